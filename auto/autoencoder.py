@@ -1,7 +1,8 @@
 """
 Denoising autoencoders, single-layer and deep.
 """
-import collections
+
+import time
 
 import numpy as np
 import matplotlib.pyplot as plt
@@ -13,8 +14,17 @@ import theano
 import theano.tensor as tt
 import theano.sandbox.rng_mrg
 
+import conv
+from datasets import mnist
+from early_stopping import StopTraining
 from hinge import multi_hinge_margin
+from masks import rf_filter_shape, sparse_mask
+import modelfile
+from optimizers import get_updates, optimizer_state, rate_variable, set_rate
+from parallel import DataParallel
 import plotting
+from precision import floatX, mean, rms_error
+from profiling import get_profiler
 
 # def norm(x, **kwargs):
 #     return np.sqrt((x**2).sum(**kwargs))
@@ -24,51 +34,18 @@ def rms(x, **kwargs):
     return np.sqrt((x**2).mean(**kwargs))
 
 
-def mnist(filename='mnist.pkl.gz'):
-    import gzip
-    import os
-    import cPickle as pickle
-    import urllib
-
-    if not os.path.exists(filename):
-        url = 'http://deeplearning.net/data/mnist/mnist.pkl.gz'
-        urllib.urlretrieve(url, filename=filename)
-
-    with gzip.open(filename, 'rb') as f:
-        train, valid, test = pickle.load(f)
-
-    return train, valid, test
-
-
 def normalize(images):
     """Normalize a set of images"""
     images -= images.mean(axis=0, keepdims=True)
     images /= np.maximum(images.std(axis=0, keepdims=True), 3e-1)
 
 
-def show_recons(x, z):
-    plotting.compare([x.reshape(-1, 28, 28), z.reshape(-1, 28, 28)],
+def show_recons(x, z, shape=(28, 28)):
+    shape = (-1,) + tuple(shape)
+    plotting.compare([x.reshape(shape), z.reshape(shape)],
                      rows=5, cols=20, vlims=(-1, 2))
 
 
-def sparse_mask(vis_shape, n_hid, rf_shape, rng=np.random):
-    assert isinstance(vis_shape, tuple) and len(vis_shape) == 2
-    assert isinstance(rf_shape, tuple) and len(rf_shape) == 2
-    M, N = vis_shape
-    m, n = rf_shape
-    n_vis = M * N
-
-    # find random positions for top-left corner of each RF
-    i = rng.randint(low=0, high=M-m+1, size=n_hid)
-    j = rng.randint(low=0, high=N-n+1, size=n_hid)
-
-    mask = np.zeros((M, N, n_hid), dtype='bool')
-    for k in xrange(n_hid):
-        mask[i[k]:i[k]+m, j[k]:j[k]+n, k] = True
-
-    return mask.reshape(n_vis, n_hid)
-
-
 def split_params(param_vect, numpy_params):
     split = []
     i = 0
@@ -83,37 +60,62 @@ def join_params(param_arrays):
 
 
 def shift_images(images, shape, r=1, rng=np.random):
-    output = np.zeros_like(images)
+    """Shift each image by up to `r` pixels in each direction, zero-filling
+
+    `shape` is `(rows, cols)` or `(rows, cols, channels)`. Images with the
+    same shift are moved together, with one slice assignment per shift.
+    """
     N = len(images)
     I = rng.randint(-r, r+1, N)
     J = rng.randint(-r, r+1, N)
 
-    m, n = shape
-    output = output.reshape((N, m, n))
-    for k, image in enumerate(images):
-        i, j = I[k], J[k]
-        image = image.reshape(shape)
-        output[k, max(i,0):min(m+i,m), max(j,0):min(n+j,n)] = (
-            image[max(-i,0):min(m-i,m), max(-j,0):min(n-j,n)])
+    m, n = shape[:2]
+    images = images.reshape((N,) + tuple(shape))
+    output = np.zeros_like(images)
+    for i in xrange(-r, r+1):
+        for j in xrange(-r, r+1):
+            k = (I == i) & (J == j)
+            output[k, max(i,0):min(m+i,m), max(j,0):min(n+j,n)] = (
+                images[k, max(-i,0):min(m-i,m), max(-j,0):min(n-j,n)])
 
-    return output.reshape(N, m*n)
+    return output.reshape(N, images[0].size)
 
 
 class FileObject(object):
     """
     A object that can be saved to file
+
+    Objects are saved in the model file format (see `modelfile.py`): arrays
+    are stored as lazily loaded tensors, simple values in the JSON config,
+    and anything else (e.g. nonlinearities) is pickled. Legacy `.npz` files
+    written with `np.savez` can still be loaded.
     """
     def to_file(self, file_name):
-        d = {}
-        d['__class__'] = self.__class__
-        d['__dict__'] = self.__getstate__()
-        np.savez(file_name, **d)
+        tensors, config, objects = {}, {}, {}
+        for k, v in self.__getstate__().items():
+            if isinstance(v, np.ndarray):
+                tensors[k] = v
+            else:
+                try:
+                    config[k] = modelfile.to_json(v)
+                except TypeError:
+                    objects[k] = v
+
+        modelfile.save(file_name, tensors, config=config, objects=objects,
+                       cls=self.__class__)
 
     @staticmethod
     def from_file(file_name):
-        npzfile = np.load(file_name)
-        cls = npzfile['__class__'].item()
-        d = npzfile['__dict__'].item()
+        if modelfile.is_model_file(file_name):
+            f = modelfile.ModelFile(file_name)
+            cls = f.cls
+            d = dict(f.config)
+            d.update(f.objects)
+            d.update((k, f[k]) for k in f.names)
+        else:
+            npzfile = np.load(file_name)
+            cls = npzfile['__class__'].item()
+            d = npzfile['__dict__'].item()
 
         self = cls.__new__(cls)
         self.__setstate__(d)
@@ -125,7 +127,8 @@ class Autoencoder(FileObject):
 
     def __init__(self, vis_shape, n_hid,
                  W=None, V=None, c=None, b=None, mask=None,
-                 rf_shape=None, hid_func=None, vis_func=None, seed=22):
+                 rf_shape=None, hid_func=None, vis_func=None, seed=22,
+                 tiled=False):
         dtype = theano.config.floatX
 
         self.vis_shape = vis_shape if isinstance(vis_shape, tuple) else (vis_shape,)
@@ -155,7 +158,8 @@ class Autoencoder(FileObject):
         self.rf_shape = rf_shape
         self.mask = mask
         if rf_shape is not None and mask is None:
-            self.mask = sparse_mask(vis_shape, n_hid, rf_shape, rng=rng)
+            self.mask = sparse_mask(vis_shape, n_hid, rf_shape, tiled=tiled,
+                                    rng=rng)
 
         if mask is not None:
             W = W * self.mask  # make initial W sparse
@@ -179,7 +183,7 @@ class Autoencoder(FileObject):
     def __setstate__(self, state):
         for k, v in state.items():
             if k in ['W', 'V', 'c', 'b']:
-                self.__dict__[k] = theano.shared(v, name=k)
+                self.__dict__[k] = theano.shared(floatX(v), name=k)
             else:
                 self.__dict__[k] = v
 
@@ -189,9 +193,17 @@ class Autoencoder(FileObject):
             return self.W.get_value().T.reshape((self.n_hid,) + self.vis_shape)
         else:
             filters = self.W.get_value().T[self.mask.T]
-            shape = (self.n_hid,) + self.rf_shape
+            shape = (self.n_hid,) + rf_filter_shape(self.vis_shape, self.rf_shape)
             return filters.reshape(shape)
 
+    def dense_weights(self):
+        """Encoding weights `(n_vis, n_hid)` and biases, e.g. for export"""
+        return self.W.get_value(), self.c.get_value()
+
+    def untie(self):
+        """Give the decoder its own weights `V`, starting from `W.T`"""
+        self.V = theano.shared(self.W.get_value(borrow=False).T, name='V')
+
     def propup(self, x, noise=0):
         a = tt.dot(x, self.W) + self.c
         if noise > 0:
@@ -228,8 +240,15 @@ class Autoencoder(FileObject):
             if param is not None:
                 assert np.isfinite(param.get_value()).all()
 
-    def auto_sgd(self, images, deep=None, test_images=None,
-                 batch_size=100, rate=0.1, noise=1., n_epochs=10):
+    def error_function(self, profile=False):
+        """Compile the (noise-free) reconstruction error of a batch"""
+        x = tt.matrix('images')
+        return theano.function([x], rms_error(x, self.propdown(self.propup(x))),
+                               profile=profile)
+
+    def train_function(self, rate=0.1, noise=1., optimizer='sgd',
+                       profile=False):
+        """Compile one denoising SGD step, returning the batch error"""
         assert not hasattr(self, 'V')
 
         dtype = theano.config.floatX
@@ -242,55 +261,100 @@ class Autoencoder(FileObject):
         z = self.propdown(y)
 
         # compute coding error
-        rmses = tt.sqrt(tt.mean((x - z)**2, axis=1))
-        error = tt.mean(rmses)
+        error = rms_error(x, z)
 
         # compute gradients
         grads = tt.grad(error, params)
-        updates = collections.OrderedDict()
-        for param, grad in zip(params, grads):
-            updates[param] = param - tt.cast(rate, dtype) * grad
+        masks = {self.W: self.mask} if self.mask is not None else None
+        updates = get_updates(optimizer, params, grads, rate, masks=masks)
 
-        if self.mask is not None:
-            updates[self.W] = updates[self.W] * self.mask
+        return theano.function([x], error, updates=updates, profile=profile)
 
-        train_dbn = theano.function([x], error, updates=updates)
-        # reconstruct = deep.reconstruct if deep is not None else None
-        encode = deep.encode if deep is not None else None
-        decode = deep.decode if deep is not None else None
+    def auto_sgd(self, images, deep=None, test_images=None,
+                 batch_size=100, rate=0.1, noise=1., n_epochs=10,
+                 optimizer='sgd', valid_images=None, early_stopping=None,
+                 profile=None):
+        """Train as a denoising autoencoder
+
+        `rate` is a number or a schedule, and `optimizer` an update rule
+        (see `optimizers.py`). If `valid_images` are given, the
+        reconstruction error on them is reported after each epoch, and
+        used by `early_stopping` (see `early_stopping.py`), if given.
+        `profile` is True or a `Profiler` to time the phases of training
+        (see `profiling.py`).
+        """
+        prof = get_profiler(profile, 'Autoencoder.auto_sgd')
+        rate, schedule = rate_variable(rate)
+        with prof.phase('compile'):
+            train_dbn = self.train_function(
+                rate=rate, noise=noise, optimizer=optimizer,
+                profile=prof.theano('train'))
+            valid_error = (self.error_function(profile=prof.theano('valid'))
+                           if valid_images is not None else None)
+            # reconstruct = deep.reconstruct if deep is not None else None
+            encode = deep.encode if deep is not None else None
+            decode = deep.decode if deep is not None else None
+        if early_stopping is not None:
+            assert valid_images is not None
+            early_stopping.reset()
 
         # --- perform SGD
-        batches = images.reshape(-1, batch_size, images.shape[1])
-        assert np.isfinite(batches).all()
+        with prof.phase('batching'):
+            batches = floatX(images).reshape(-1, batch_size, images.shape[1])
+            assert np.isfinite(batches).all()
+            if test_images is not None:
+                test_images = floatX(test_images)
+            if valid_images is not None:
+                valid_images = floatX(valid_images)
 
+        params = [self.W, self.c, self.b]
         for epoch in range(n_epochs):
+            prof.begin_epoch()
+            set_rate(rate, schedule, epoch, scale=(
+                early_stopping.rate_scale if early_stopping is not None else 1.))
             costs = []
             for batch in batches:
-                costs.append(train_dbn(batch))
-                self.check_params()
-
-            print "Epoch %d: %0.3f (sparsity: pop: %0.3f, life: %0.3f)" % (epoch, np.mean(costs))
+                with prof.phase('step'):
+                    costs.append(train_dbn(batch))
+                with prof.phase('check_params'):
+                    self.check_params()
+            prof.end_epoch(batches.shape[0] * batches.shape[1])
 
-            if deep is not None and test_images is not None:
-                # plot reconstructions on test set
-                plt.figure(2)
-                plt.clf()
-                test = test_images
-                codes = encode(test)
-                recs = decode(codes)
-                # recons = reconstruct(test_images)
-                show_recons(test, recs)
-                plt.draw()
+            print "Epoch %d: %0.3f" % (epoch, np.mean(costs))
 
-                print "Test set: (error: %0.3f) (sparsity: %0.3f)" % (
-                    rms(test - recs, axis=1).mean(), (codes > 0).mean())
-
-            # plot filters for first layer only
-            if deep is not None and self is deep.autos[0]:
-                plt.figure(3)
-                plt.clf()
-                plotting.filters(self.filters, rows=10, cols=20)
-                plt.draw()
+            if valid_images is not None:
+                with prof.phase('validation'):
+                    error = valid_error(valid_images)
+                print "Validation error: %0.3f" % error
+                if (early_stopping is not None
+                        and early_stopping.update(epoch, error, params)):
+                    break
+
+            with prof.phase('plotting'):
+                if deep is not None and test_images is not None:
+                    # plot reconstructions on test set
+                    plt.figure(2)
+                    plt.clf()
+                    test = test_images
+                    codes = encode(test)
+                    recs = decode(codes)
+                    # recons = reconstruct(test_images)
+                    show_recons(test, recs, shape=deep.vis_shape)
+                    plt.draw()
+
+                    print "Test set: (error: %0.3f) (sparsity: %0.3f)" % (
+                        rms(test - recs, axis=1).mean(), (codes > 0).mean())
+
+                # plot filters for first layer only
+                if deep is not None and self is deep.autos[0]:
+                    plt.figure(3)
+                    plt.clf()
+                    plotting.filters(self.filters, rows=10, cols=20)
+                    plt.draw()
+
+        if early_stopping is not None:
+            early_stopping.restore(params)
+        prof.end()
 
     def auto_backprop(self, images, deep=None, test_images=None,
                       noise=1., n_epochs=100):
@@ -300,14 +364,13 @@ class Autoencoder(FileObject):
         params = [self.W, self.c, self.b]
 
         # --- compute backprop function
-        x = theano.shared(images, name='images')
+        x = theano.shared(floatX(images), name='images')
         xn = x + self.theano_rng.normal(size=x.shape, std=noise, dtype=dtype)
         y = self.propup(xn)
         z = self.propdown(y)
 
         # compute coding error
-        rmses = tt.sqrt(tt.mean((x - z)**2, axis=1))
-        error = tt.mean(rmses)
+        error = rms_error(x, z)
 
         # compute gradients
         grads = tt.grad(error, params)
@@ -330,7 +393,7 @@ class Autoencoder(FileObject):
                 plt.figure(2)
                 plt.clf()
                 recons = reconstruct(test_images)
-                show_recons(test_images, recons)
+                show_recons(test_images, recons, shape=deep.vis_shape)
                 plt.draw()
 
             # plot filters for first layer only
@@ -350,6 +413,77 @@ class Autoencoder(FileObject):
             param.set_value(value.astype(param.dtype), borrow=False)
 
 
+class ConvAutoencoder(Autoencoder):
+    """Autoencoder with shared convolutional filters and tied weights
+
+    `n_filters` filters of shape `rf_shape` are applied with `stride` (see
+    `conv.py`). The hidden units are the flattened feature maps, with shape
+    `hid_shape = (rows, cols, n_filters)`, so the layer stacks with dense
+    `Autoencoder`s and `dense_weights` gives the equivalent dense layer.
+    """
+
+    def __init__(self, vis_shape, n_filters, rf_shape=(9, 9), stride=(1, 1),
+                 W=None, c=None, b=None, hid_func=None, vis_func=None, seed=22):
+        dtype = theano.config.floatX
+
+        self.vis_shape = tuple(vis_shape)
+        self.n_vis = np.prod(vis_shape)
+        self.n_filters = n_filters
+        self.rf_shape = tuple(rf_shape)
+        self.stride = tuple(stride)
+        self.hid_shape = conv.map_shape(vis_shape, rf_shape, stride) + (n_filters,)
+        self.n_hid = int(np.prod(self.hid_shape))
+        self.mask = None
+        self.hid_func = hid_func
+        self.vis_func = vis_func
+        self.seed = seed
+
+        rng = np.random.RandomState(seed=self.seed)
+        self.theano_rng = theano.sandbox.rng_mrg.MRG_RandomStreams(seed=self.seed)
+
+        if W is None:
+            W = conv.initial_filters(n_filters, vis_shape, rf_shape, stride,
+                                     rng=rng)
+        if c is None:
+            c = np.zeros(n_filters, dtype=dtype)
+        if b is None:
+            b = np.zeros(self.n_vis, dtype=dtype)
+
+        self.W = theano.shared(W.astype(dtype), name='W')
+        self.c = theano.shared(c.astype(dtype), name='c')
+        self.b = theano.shared(b.astype(dtype), name='b')
+
+    @property
+    def filter_shape(self):
+        return (self.n_filters, conv.image_shape(self.vis_shape)[2]) + self.rf_shape
+
+    @property
+    def filters(self):
+        return conv.filter_images(self.W.get_value())
+
+    def dense_weights(self):
+        return conv.dense_weights(self.W.get_value(), self.c.get_value(),
+                                  self.vis_shape, self.stride)
+
+    def untie(self):
+        """Give the decoder its own filters `V`, starting from `W`"""
+        self.V = theano.shared(self.W.get_value(borrow=False), name='V')
+
+    def propup(self, x, noise=0):
+        a = conv.conv_up(x, self.W, self.c, self.vis_shape, self.filter_shape,
+                         self.stride)
+        if noise > 0:
+            a += self.theano_rng.normal(
+                size=a.shape, std=noise, dtype=theano.config.floatX)
+        return self.hid_func(a) if self.hid_func is not None else a
+
+    def propdown(self, y):
+        V = self.V if hasattr(self, 'V') else self.W
+        a = conv.conv_down(y, V, self.vis_shape, self.filter_shape,
+                           self.stride) + self.b
+        return self.vis_func(a) if self.vis_func is not None else a
+
+
 class DeepAutoencoder(object):
 
     def __init__(self, autos=None):
@@ -360,6 +494,10 @@ class DeepAutoencoder(object):
         self.seed = 90
         self.theano_rng = theano.sandbox.rng_mrg.MRG_RandomStreams(seed=self.seed)
 
+    @property
+    def vis_shape(self):
+        return self.autos[0].vis_shape
+
     def propup(self, images, noise=0):
         codes = images
         for auto in self.autos:
@@ -392,9 +530,17 @@ class DeepAutoencoder(object):
         f = theano.function([x], z)
         return f
 
+    def class_error_function(self, W, b):
+        """Compile the (noise-free) classification error of a batch"""
+        x = tt.matrix('images')
+        y = tt.ivector('labels')
+        yc = tt.dot(self.propup(x), W) + b
+        return theano.function([x, y], tt.mean(tt.neq(tt.argmax(yc, axis=1), y)))
+
     def auto_sgd(self, images, test_images=None,
-                 batch_size=100, rate=0.1, n_epochs=10):
+                 batch_size=100, rate=0.1, n_epochs=10, optimizer='sgd'):
         dtype = theano.config.floatX
+        rate, schedule = rate_variable(rate)
 
         params = []
         for auto in self.autos:
@@ -407,27 +553,25 @@ class DeepAutoencoder(object):
         # compute coding error
         y = self.propup(xn)
         z = self.propdown(y)
-        rmses = tt.sqrt(tt.mean((x - z)**2, axis=1))
-        error = tt.mean(rmses)
+        error = rms_error(x, z)
 
         # compute gradients
         grads = tt.grad(error, params)
-        updates = collections.OrderedDict()
-        for param, grad in zip(params, grads):
-            updates[param] = param - tt.cast(rate, dtype) * grad
-
-        for auto in self.autos:
-            if auto.mask is not None:
-                updates[auto.W] = updates[auto.W] * auto.mask
+        masks = dict((auto.W, auto.mask) for auto in self.autos
+                     if auto.mask is not None)
+        updates = get_updates(optimizer, params, grads, rate, masks=masks)
 
         train_dbn = theano.function([x], error, updates=updates)
         reconstruct = self.reconstruct
 
         # --- perform SGD
-        batches = images.reshape(-1, batch_size, images.shape[1])
+        batches = floatX(images).reshape(-1, batch_size, images.shape[1])
         assert np.isfinite(batches).all()
+        if test_images is not None:
+            test_images = floatX(test_images)
 
         for epoch in range(n_epochs):
+            set_rate(rate, schedule, epoch)
             costs = []
             for batch in batches:
                 costs.append(train_dbn(batch))
@@ -440,7 +584,7 @@ class DeepAutoencoder(object):
                 plt.figure(2)
                 plt.clf()
                 recons = reconstruct(test_images)
-                show_recons(test_images, recons)
+                show_recons(test_images, recons, shape=self.vis_shape)
                 plt.draw()
 
             # plot filters for first layer only
@@ -450,12 +594,13 @@ class DeepAutoencoder(object):
             plt.draw()
 
     def auto_sgd_down(self, images, test_images=None,
-                      batch_size=100, rate=0.1, n_epochs=10):
+                      batch_size=100, rate=0.1, n_epochs=10, optimizer='sgd'):
         dtype = theano.config.floatX
+        rate, schedule = rate_variable(rate)
 
         params = []
         for auto in self.autos:
-            auto.V = theano.shared(auto.W.get_value(borrow=False).T, name='V')
+            auto.untie()
             params.extend((auto.V, auto.b))
 
         # --- compute backprop function
@@ -465,27 +610,25 @@ class DeepAutoencoder(object):
         # compute coding error
         y = self.propup(xn)
         z = self.propdown(y)
-        rmses = tt.sqrt(tt.mean((x - z)**2, axis=1))
-        error = tt.mean(rmses)
+        error = rms_error(x, z)
 
         # compute gradients
         grads = tt.grad(error, params)
-        updates = collections.OrderedDict()
-        for param, grad in zip(params, grads):
-            updates[param] = param - tt.cast(rate, dtype) * grad
-
-        for auto in self.autos:
-            if auto.mask is not None:
-                updates[auto.V] = updates[auto.V] * auto.mask.T
+        masks = dict((auto.V, auto.mask.T) for auto in self.autos
+                     if auto.mask is not None)
+        updates = get_updates(optimizer, params, grads, rate, masks=masks)
 
         train_dbn = theano.function([x], error, updates=updates)
         reconstruct = self.reconstruct
 
         # --- perform SGD
-        batches = images.reshape(-1, batch_size, images.shape[1])
+        batches = floatX(images).reshape(-1, batch_size, images.shape[1])
         assert np.isfinite(batches).all()
+        if test_images is not None:
+            test_images = floatX(test_images)
 
         for epoch in range(n_epochs):
+            set_rate(rate, schedule, epoch)
             costs = []
             for batch in batches:
                 costs.append(train_dbn(batch))
@@ -498,7 +641,7 @@ class DeepAutoencoder(object):
                 plt.figure(2)
                 plt.clf()
                 recons = reconstruct(test_images)
-                show_recons(test_images, recons)
+                show_recons(test_images, recons, shape=self.vis_shape)
                 plt.draw()
 
             # plot filters for first layer only
@@ -539,7 +682,7 @@ class DeepAutoencoder(object):
 
         # compute hinge loss
         yc = tt.dot(x, W) + b
-        cost = multi_hinge_margin(yc, y).mean()
+        cost = mean(multi_hinge_margin(yc, y))
         error = cost
 
         # compute gradients
@@ -561,7 +704,24 @@ class DeepAutoencoder(object):
 
         self.W, self.b = split_p(p_opt)
 
-    def backprop(self, train_set, test_set, noise=0, shift=False, n_epochs=30):
+    def backprop(self, train_set, test_set, noise=0, shift=False, n_epochs=30,
+                 checkpoint=None, valid_set=None, early_stopping=None,
+                 profile=None):
+        """Fine-tune the encoders with L-BFGS on the classification cost
+
+        If `checkpoint` is a `Checkpointer`, the parameters are checkpointed
+        every `checkpoint.every` function evaluations (with the state of
+        `early_stopping`, if given), and training resumes from the latest
+        checkpoint (L-BFGS restarts its curvature estimate).
+
+        If `valid_set` is given, the validation error is computed after each
+        function evaluation, which counts as an epoch for `early_stopping`
+        (plateau rate decay does not apply to L-BFGS).
+
+        `profile` is True or a `Profiler` to time the phases of training
+        (see `profiling.py`); each function evaluation counts as an epoch.
+        """
+        prof = get_profiler(profile, 'DeepAutoencoder.backprop')
         dtype = theano.config.floatX
 
         params = []
@@ -585,47 +745,139 @@ class DeepAutoencoder(object):
         # compute classification error
         yn = self.propup(x, noise=noise)
         yc = tt.dot(yn, W) + b
-        cost = multi_hinge_margin(yc, y).mean()
+        cost = mean(multi_hinge_margin(yc, y))
         error = tt.mean(tt.neq(tt.argmax(yc, axis=1), y))
 
         # compute gradients
-        grads = tt.grad(cost, params)
-        f_df = theano.function([x, y], [error] + grads)
+        with prof.phase('compile'):
+            grads = tt.grad(cost, params)
+            f_df = theano.function([x, y], [error] + grads,
+                                   profile=prof.theano('f_df'))
 
         np_params = [param.get_value() for param in params]
 
         # --- run L_BFGS
         train_images, train_labels = train_set
+        train_images = floatX(train_images)
         train_labels = train_labels.astype('int32')
 
-        def f_df_wrapper(p):
-            for param, value in zip(params, split_params(p, np_params)):
-                param.set_value(value.astype(param.dtype))
+        if valid_set is not None:
+            with prof.phase('compile'):
+                valid_error = self.class_error_function(W, b)
+            valid_images = floatX(valid_set[0])
+            valid_labels = valid_set[1].astype('int32')
+        if early_stopping is not None:
+            assert valid_set is not None
+            early_stopping.reset()
+
+        start = 0
+        if checkpoint is not None:
+            state = checkpoint.restore_shared(
+                params, early_stopping=early_stopping)
+            if state is not None:
+                start = state['step'] + 1
+                np_params = [param.get_value() for param in params]
+
+        evals = [start]
+        t_wrapper = [0.]
 
-            images = shift_images(train_images, (28, 28)) if shift else train_images
-            labels = train_labels
+        def f_df_wrapper(p):
+            prof.begin_epoch()
+            t = time.time()
+            with prof.phase('lbfgs glue'):
+                for param, value in zip(params, split_params(p, np_params)):
+                    param.set_value(value.astype(param.dtype))
+
+            with prof.phase('batching'):
+                images = (shift_images(train_images, self.vis_shape)
+                          if shift else train_images)
+                labels = train_labels
+
+            with prof.phase('step'):
+                outs = f_df(images, labels)
+            with prof.phase('lbfgs glue'):
+                cost, grads = outs[0], outs[1:]
+                grad = join_params(grads)
+
+            stop = False
+            if valid_set is not None:
+                with prof.phase('validation'):
+                    verror = valid_error(valid_images, valid_labels)
+                print "Validation error: %0.4f" % verror
+                stop = (early_stopping is not None
+                        and early_stopping.update(evals[0], verror, params))
+
+            if checkpoint is not None and checkpoint.due(evals[0]):
+                with prof.phase('checkpoint'):
+                    checkpoint.save_shared(evals[0], params,
+                                           early_stopping=early_stopping)
+            if stop:
+                raise StopTraining()
+            evals[0] += 1
+            prof.end_epoch(len(images))
+            t_wrapper[0] += time.time() - t
 
-            outs = f_df(images, labels)
-            cost, grads = outs[0], outs[1:]
-            grad = join_params(grads)
             return cost.astype('float64'), grad.astype('float64')
 
         p0 = join_params(np_params)
-        p_opt, mincost, info = scipy.optimize.lbfgsb.fmin_l_bfgs_b(
-            f_df_wrapper, p0, maxfun=n_epochs, iprint=1)
-
-        for param, value in zip(params, split_params(p_opt, np_params)):
-            param.set_value(value.astype(param.dtype), borrow=False)
+        p_opt = p0
+        if n_epochs > start:
+            t = time.time()
+            try:
+                p_opt, mincost, info = scipy.optimize.lbfgsb.fmin_l_bfgs_b(
+                    f_df_wrapper, p0, maxfun=n_epochs - start, iprint=1)
+            except StopTraining:
+                p_opt = None
+            prof.add('lbfgs', time.time() - t - t_wrapper[0])
+
+        if p_opt is not None:
+            for param, value in zip(params, split_params(p_opt, np_params)):
+                param.set_value(value.astype(param.dtype), borrow=False)
+        if early_stopping is not None:
+            early_stopping.restore(params)
+
+        if checkpoint is not None:
+            with prof.phase('checkpoint'):
+                checkpoint.wait()
+        prof.end()
 
     def sgd(self, train_set, test_set,
-            rate=0.1, noise=0, shift=False, tradeoff=0.5, n_epochs=30, batch_size=100):
-        """Use SGD to do combined autoencoder and classifier training"""
+            rate=0.1, noise=0, shift=False, tradeoff=0.5, n_epochs=30, batch_size=100,
+            checkpoint=None, n_workers=1, optimizer='sgd',
+            valid_set=None, early_stopping=None, profile=None):
+        """Use SGD to do combined autoencoder and classifier training
+
+        If `checkpoint` is a `Checkpointer`, all parameters (including the
+        classifier) and the optimizer state (see `optimizers.optimizer_state`)
+        are checkpointed every `checkpoint.every` epochs (with the state of
+        `early_stopping`, if given), and training resumes after the epoch of
+        the latest checkpoint.
+
+        If `n_workers > 1`, each batch is split over that many processes
+        (see `parallel.DataParallel`); use a correspondingly larger
+        `batch_size`. For `noise=0` the results match the serial version up
+        to rounding (Theano fuses the serial update into the matrix product);
+        with noise, each worker draws its own (see `check_parallel.py`).
+        `n_workers=1` runs the serial version.
+
+        `rate` is a number or a schedule, and `optimizer` an update rule
+        (see `optimizers.py`); the data-parallel version only supports SGD.
+
+        If `valid_set` is given, the classification error on it is reported
+        after each epoch, and used by `early_stopping`, if given.
+
+        `profile` is True or a `Profiler` to time the phases of training
+        (see `profiling.py`).
+        """
+        prof = get_profiler(profile, 'DeepAutoencoder.sgd')
         dtype = theano.config.floatX
         assert tradeoff >= 0 and tradeoff <= 1
+        assert n_workers == 1 or optimizer == 'sgd'
+        rate_var, schedule = rate_variable(rate)
 
         params = []
         for auto in self.autos:
-            auto.V = theano.shared(auto.W.get_value(borrow=False).T, name='V')
+            auto.untie()
             params.extend([auto.W, auto.V, auto.c, auto.b])
 
         # --- compute backprop function
@@ -648,31 +900,38 @@ class DeepAutoencoder(object):
         # class_error = tt.mean(tt.neq(y_pred, y))
 
         yc = tt.dot(yn, W) + b
-        class_cost = multi_hinge_margin(yc, y).mean()
+        class_cost = mean(multi_hinge_margin(yc, y))
         class_error = tt.mean(tt.neq(tt.argmax(yc, axis=1), y))
 
         # compute autoencoder error
         z = self.propdown(yn)
-        rmses = tt.sqrt(tt.mean((x - z)**2, axis=1))
-        auto_cost = tt.mean(rmses)
+        auto_cost = rms_error(x, z)
 
         cost = (tt.cast(1 - tradeoff, dtype) * auto_cost
                 + tt.cast(tradeoff, dtype) * class_cost)
         error = class_error
 
         # compute gradients
-        grads = tt.grad(cost, params)
-        updates = collections.OrderedDict()
-        for param, grad in zip(params, grads):
-            updates[param] = param - tt.cast(rate, dtype) * grad
+        with prof.phase('compile'):
+            grads = tt.grad(cost, params)
+            opt_state = []
+            if n_workers > 1:
+                f_grad = theano.function([x, y], [error] + grads,
+                                         profile=prof.theano('f_grad'))
+            else:
+                masks = {}
+                for auto in self.autos:
+                    if auto.mask is not None:
+                        masks[auto.W] = auto.mask
+                        masks[auto.V] = auto.mask.T
 
-        for auto in self.autos:
-            if auto.mask is not None:
-                updates[auto.W] = updates[auto.W] * auto.mask
-                updates[auto.V] = updates[auto.V] * auto.mask.T
+                updates = get_updates(
+                    optimizer, params, grads, rate_var, masks=masks)
+                opt_state = optimizer_state(updates, params)
+                train_dbn = theano.function([x, y], error, updates=updates,
+                                            profile=prof.theano('train'))
 
-        train_dbn = theano.function([x, y], error, updates=updates)
-        reconstruct = self.reconstruct
+            reconstruct = self.reconstruct
 
         # --- perform SGD
         # images, labels = train_set
@@ -681,44 +940,116 @@ class DeepAutoencoder(object):
         # assert np.isfinite(ibatches).all()
 
         train_images, train_labels = train_set
+        train_images = floatX(train_images)
         train_labels = train_labels.astype('int32')
         test_images, test_labels = test_set
-
-        for epoch in range(n_epochs):
-            images = shift_images(train_images, (28, 28)) if shift else train_images
-            labels = train_labels
-            ibatches = images.reshape(-1, batch_size, images.shape[1])
-            lbatches = labels.reshape(-1, batch_size)
+        if test_images is not None:
+            test_images = floatX(test_images)
+
+        if valid_set is not None:
+            with prof.phase('compile'):
+                valid_error = self.class_error_function(W, b)
+            valid_images = floatX(valid_set[0])
+            valid_labels = valid_set[1].astype('int32')
+        if early_stopping is not None:
+            assert valid_set is not None
+            early_stopping.reset()
+
+        start = 0
+        if checkpoint is not None:
+            state = checkpoint.restore_shared(params + [W, b] + opt_state,
+                                              early_stopping=early_stopping)
+            if state is not None:
+                start = state['step'] + 1
+                self.W = W.get_value()
+                self.b = b.get_value()
+
+        if n_workers > 1:
+            masks = {}
+            for k, auto in enumerate(self.autos):
+                if auto.mask is not None:
+                    masks[4*k] = auto.mask
+                    masks[4*k + 1] = auto.mask.T
+            workers = DataParallel(
+                f_grad, params, train_images.shape, n_workers, masks=masks,
+                rngs=[(auto.theano_rng, auto.seed) for auto in self.autos])
+
+        for epoch in range(start, n_epochs):
+            prof.begin_epoch()
+            set_rate(rate_var, schedule, epoch, scale=(
+                early_stopping.rate_scale if early_stopping is not None else 1.))
+            with prof.phase('batching'):
+                images = (shift_images(train_images, self.vis_shape)
+                          if shift else train_images)
+                labels = train_labels
 
             costs = []
-            for batch, label in zip(ibatches, lbatches):
-                costs.append(train_dbn(batch, label))
+            if n_workers > 1:
+                with prof.phase('step'):
+                    workers.set_data(images, labels)
+                    for i in range(0, len(images), batch_size):
+                        costs.append(workers.step(
+                            i, i + batch_size, float(rate_var.get_value())))
+                    workers.get_params(params)
+            else:
+                with prof.phase('batching'):
+                    ibatches = images.reshape(-1, batch_size, images.shape[1])
+                    lbatches = labels.reshape(-1, batch_size)
+                for batch, label in zip(ibatches, lbatches):
+                    with prof.phase('step'):
+                        costs.append(train_dbn(batch, label))
 
             # copy back parameters (for test function)
             self.W = W.get_value()
             self.b = b.get_value()
+            prof.end_epoch(len(images))
 
             print "Epoch %d: %0.3f" % (epoch, np.mean(costs))
 
-            if test_images is not None:
-                # plot reconstructions on test set
-                plt.figure(2)
+            stop = False
+            if valid_set is not None:
+                with prof.phase('validation'):
+                    error = valid_error(valid_images, valid_labels)
+                print "Validation error: %0.4f" % error
+                stop = (early_stopping is not None
+                        and early_stopping.update(epoch, error, params))
+
+            if checkpoint is not None and checkpoint.due(epoch):
+                with prof.phase('checkpoint'):
+                    checkpoint.save_shared(epoch, params + [W, b] + opt_state,
+                                           early_stopping=early_stopping)
+            if stop:
+                break
+
+            with prof.phase('plotting'):
+                if test_images is not None:
+                    # plot reconstructions on test set
+                    plt.figure(2)
+                    plt.clf()
+                    recons = reconstruct(test_images)
+                    show_recons(test_images, recons, shape=self.vis_shape)
+                    plt.draw()
+
+                # plot filters for first layer only
+                plt.figure(3)
                 plt.clf()
-                recons = reconstruct(test_images)
-                show_recons(test_images, recons)
+                plotting.filters(self.autos[0].filters, rows=10, cols=20)
                 plt.draw()
 
-            # plot filters for first layer only
-            plt.figure(3)
-            plt.clf()
-            plotting.filters(self.autos[0].filters, rows=10, cols=20)
-            plt.draw()
+        if n_workers > 1:
+            workers.close()
+        if checkpoint is not None:
+            with prof.phase('checkpoint'):
+                checkpoint.wait()
+        if early_stopping is not None:
+            early_stopping.restore(params)
+        prof.end()
 
     def test(self, test_set):
         assert self.W is not None and self.b is not None
 
         images, labels = test_set
-        codes = self.encode(images)
+        codes = self.encode(floatX(images))
 
         categories = np.unique(labels)
         inds = np.argmax(np.dot(codes, self.W) + self.b, axis=1)
@@ -766,13 +1097,12 @@ def test_shift_images():
     # for image in images2:
     #     print image.reshape(shape)
 
-    # --- timing test
-    from hunse_tools.timing import tic, toc
+    # --- timing test (see also `benchmarks.py`)
     [train_images, _], _, _ = mnist()
 
-    tic()
+    t = time.time()
     images2 = shift_images(train_images, (28, 28))
-    toc()
+    print "shift_images: %0.3f s" % (time.time() - t)
 
 if __name__ == '__main__':
     # test_autoencoder()
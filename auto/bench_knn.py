@@ -0,0 +1,68 @@
+"""
+Compare exact and LSH k-nearest-neighbour classification of the deep codes.
+
+Encodes MNIST with the autoencoder layers saved by `train_sigmoid.py`
+(50-dimensional codes), then classifies the test set with `KNNClassifier`
+using exact search and LSH indexes of several sizes. Reports the error, the
+recall of the exact neighbours, the index build time, and the query latency
+for batched queries.
+"""
+import time
+
+import numpy as np
+
+from autoencoder import mnist, FileObject, DeepAutoencoder
+from knn import KNNClassifier
+
+savenames = ["sigmoid-auto-%d.npz" % i for i in range(3)]
+k = 5
+n_test = 10000
+indexes = [None,
+           dict(n_tables=4, n_bits=10, probes=0),
+           dict(n_tables=8, n_bits=12, probes=0),
+           dict(n_tables=8, n_bits=12, probes=1),
+           dict(n_tables=8, n_bits=14, probes=1),
+           dict(n_tables=16, n_bits=14, probes=1)]
+
+# --- load the data and encode it
+train, valid, test = mnist()
+train_images, train_labels = train
+test_images, test_labels = test
+test_images, test_labels = test_images[:n_test], test_labels[:n_test]
+for images in [train_images, test_images]:
+    images -= images.mean(axis=0, keepdims=True)
+    images /= np.maximum(images.std(axis=0, keepdims=True), 3e-1)
+
+deep = DeepAutoencoder([FileObject.from_file(s) for s in savenames])
+encode = deep.encode
+train_codes = encode(train_images)
+test_codes = encode(test_images)
+print "codes: %d train, %d test, %d dims" % (
+    len(train_codes), len(test_codes), train_codes.shape[1])
+
+# --- classify with each index
+exact = KNNClassifier(train_codes, train_labels, k=k)
+true_nearest = exact.neighbours_exact(np.asarray(test_codes, dtype=np.float64))
+
+print "%-36s %8s %8s %10s %12s" % (
+    'index', 'error', 'recall', 'build [s]', 'query [ms]')
+for index in indexes:
+    t = time.time()
+    knn = KNNClassifier(train_codes, train_labels, k=k, index=index)
+    t_build = time.time() - t
+
+    t = time.time()
+    errors = knn.test((test_codes, test_labels))
+    t_query = (time.time() - t) / len(test_codes)
+
+    if index is None:
+        recall = 1.
+    else:
+        nearest = knn.neighbours_lsh(np.asarray(test_codes, dtype=np.float64))
+        recall = np.mean([len(np.intersect1d(a, b)) / float(k)
+                          for a, b in zip(nearest, true_nearest)])
+
+    name = 'exact' if index is None else ', '.join(
+        '%s=%s' % item for item in sorted(index.items()))
+    print "%-36s %8.4f %8.3f %10.2f %12.3f" % (
+        name, errors.mean(), recall, t_build, 1e3 * t_query)
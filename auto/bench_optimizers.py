@@ -0,0 +1,70 @@
+"""
+Compare update rules for training the first autoencoder layer.
+
+Trains the first layer of `train_lif.py` with each update rule and reports,
+for each, the number of epochs needed to reach a target reconstruction
+error on the test set, and the final error.
+"""
+import time
+
+import numpy as np
+
+import theano
+
+from autoencoder import mnist, normalize, rms, Autoencoder
+import optimizers
+from optimizers import rate_variable, set_rate
+from softlif import SoftLIFRate
+
+nlif = SoftLIFRate(sigma=0.05, amp=1. / 63.04)
+rules = [('sgd', 1., 'sgd'),
+         ('momentum', optimizers.step_decay(0.1, every=5), 'momentum'),
+         ('nesterov', optimizers.step_decay(0.1, every=5), 'nesterov'),
+         ('rmsprop', optimizers.inv_decay(1e-3, tau=5), 'rmsprop'),
+         ('adam', optimizers.inv_decay(1e-3, tau=5), 'adam')]
+
+n_train = 10000
+n_epochs = 15
+batch_size = 100
+target = None  # target test error (default: final error of plain SGD)
+
+# --- load the data
+dtype = theano.config.floatX
+train, valid, test = mnist()
+train_images = train[0][:n_train].astype(dtype)
+test_images = test[0][:2000].astype(dtype)
+for images in [train_images, test_images]:
+    normalize(images)
+
+batches = train_images.reshape(-1, batch_size, train_images.shape[1])
+
+# --- train with each update rule
+results = []
+for name, rate, optimizer in rules:
+    auto = Autoencoder((28, 28), 500, rf_shape=(9, 9), hid_func=nlif)
+    rate, schedule = rate_variable(rate)
+    train_fn = auto.train_function(rate=rate, optimizer=optimizer)
+    reconstruct = auto.reconstruct
+
+    errors = []
+    t = time.time()
+    for epoch in range(n_epochs):
+        set_rate(rate, schedule, epoch)
+        for batch in batches:
+            train_fn(batch)
+        recons = reconstruct(test_images)
+        errors.append(rms(test_images - recons, axis=1).mean())
+        print "%s, epoch %d: %0.4f" % (name, epoch, errors[-1])
+
+    results.append((name, errors, time.time() - t))
+
+# --- report epochs to reach the target error
+if target is None:
+    target = results[0][1][-1]
+
+print "target test error: %0.4f" % target
+print "%-10s %10s %12s %10s" % ('', 'epochs', 'final error', 'time [s]')
+for name, errors, t in results:
+    reached = np.nonzero(np.array(errors) <= target)[0]
+    epochs = '%d' % (reached[0] + 1) if len(reached) > 0 else '-'
+    print "%-10s %10s %12.4f %10.1f" % (name, epochs, errors[-1], t)
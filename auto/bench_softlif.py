@@ -0,0 +1,55 @@
+"""
+Compare the fused soft LIF op against the composed elementwise graph.
+
+Times the forward pass and the forward + backward pass on a large matrix of
+activations, and checks that the Theano op matches the NumPy kernel.
+"""
+import timeit
+
+import numpy as np
+
+import theano
+import theano.tensor as tt
+
+import rates
+from softlif import SoftLIFRate, softlif_graph
+
+shape = (10000, 500)
+n_repeats = 5
+params = dict(sigma=0.05, amp=1. / 63.04)
+
+
+def best_time(f, *args):
+    return min(timeit.repeat(lambda: f(*args), number=1, repeat=n_repeats))
+
+
+dtype = theano.config.floatX
+rng = np.random.RandomState(8)
+acts = rng.normal(scale=2., size=shape).astype(dtype)
+
+x = tt.matrix('x', dtype=dtype)
+functions = [('composed', softlif_graph(x, **params)),
+             ('fused', SoftLIFRate(**params)(x))]
+
+results = {}
+for name, y in functions:
+    f = theano.function([x], y)
+    f_df = theano.function([x], [y, tt.grad(y.sum(), x)])
+    results[name] = (best_time(f, acts), best_time(f_df, acts), f(acts),
+                     f_df(acts)[1])
+
+# the op computes in double precision, so compare with the float64 kernel
+fused_out = results['fused'][2]
+ref = rates.softlif_rate(acts.astype(np.float64), **params)
+assert np.allclose(fused_out, ref, rtol=1e-6, atol=1e-9)
+assert np.allclose(results['fused'][3],
+                   rates.softlif_rate_grad(acts.astype(np.float64), ref,
+                                           **params), rtol=1e-5, atol=1e-9)
+print "Max difference (fused vs. composed): %0.3e" % (
+    np.abs(fused_out - results['composed'][2]).max())
+print "NumPy kernel: %0.4f s" % best_time(
+    lambda a: rates.softlif_rate(a, out=a.copy(), **params), acts)
+
+print "%-10s %12s %12s" % ('', 'forward [s]', 'fwd+bwd [s]')
+for name, _ in functions:
+    print "%-10s %12.4f %12.4f" % ((name,) + results[name][:2])
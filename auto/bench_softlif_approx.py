@@ -0,0 +1,66 @@
+"""
+Compare exact and table-approximated soft LIF hidden units in training.
+
+For each nonlinearity, trains one autoencoder layer with SGD, reports the time
+per SGD step (the best epoch, excluding compilation), then trains a hinge
+classifier on the codes and reports the test-set classification error.
+"""
+import time
+
+import numpy as np
+
+import theano
+import theano.tensor as tt
+
+from autoencoder import mnist, normalize, Autoencoder, DeepAutoencoder
+import rates
+from softlif import SoftLIFRate, SoftLIFApprox
+
+params = dict(sigma=0.05, amp=1. / 63.04)
+funcs = [('exact', SoftLIFRate(**params)),
+         ('approx 1e-3', SoftLIFApprox(tol=1e-3, **params)),
+         ('approx 1e-2', SoftLIFApprox(tol=1e-2, **params))]
+
+n_train = 10000
+n_epochs = 3
+batch_size = 100
+
+# --- load the data
+dtype = theano.config.floatX
+train, valid, test = mnist()
+train = (train[0][:n_train].astype(dtype), train[1][:n_train])
+test = (test[0].astype(dtype), test[1])
+for images in [train[0], test[0]]:
+    normalize(images)
+
+# --- check the approximation error
+x = np.linspace(-5, 20, 100001)
+exact = rates.softlif_rate(x, **params)
+for name, func in funcs[1:]:
+    print "%s: %d points, max error %0.2e" % (
+        name, func.table.n_points, np.abs(func.table(x) - exact).max())
+
+# --- train with each nonlinearity
+results = []
+for name, func in funcs:
+    auto = Autoencoder((28, 28), 500, rf_shape=(9, 9), hid_func=func)
+
+    train_step = auto.train_function(rate=1.)
+    batches = train[0].reshape(-1, batch_size, train[0].shape[1])
+
+    epoch_times = []
+    for epoch in range(n_epochs):
+        t = time.time()
+        for batch in batches:
+            train_step(batch)
+        epoch_times.append(time.time() - t)
+    step_time = min(epoch_times) / len(batches)
+
+    deep = DeepAutoencoder([auto])
+    deep.train_classifier(train, test)
+    error = deep.test(test).mean()
+    results.append((name, step_time, error))
+
+print "%-12s %14s %10s" % ('', 'step time [ms]', 'error')
+for name, step_time, error in results:
+    print "%-12s %14.2f %10.4f" % (name, 1e3 * step_time, error)
@@ -0,0 +1,399 @@
+"""
+Benchmark suite for training, inference and spiking evaluation.
+
+Times a fixed set of operations on synthetic MNIST-shaped data (so no
+download is needed), writes the results as JSON, and optionally compares
+them against a stored baseline, flagging regressions:
+
+    PYTHONPATH=../common python benchmarks.py --output results.json
+    PYTHONPATH=../common python benchmarks.py --baseline results.json
+
+Each benchmark is run once to warm up (compiling Theano functions), then
+`--repeats` times; the median and minimum times are reported, along with
+the throughput in samples per second. Benchmarks whose dependencies are not
+installed (e.g. nengo) are reported as skipped. The exit status is 1 if any
+benchmark is slower than the baseline by more than the tolerance.
+
+The `_64` and `_64x3` variants use 64x64 grey and colour images, with as
+many pixels in total as the MNIST-sized runs, to show how the epoch time
+grows with image size. The `conv_` variants use a first layer of 5 shared
+9x9 filters with stride 2 (500 units on 28x28 images) instead of 500
+random 9x9 receptive fields. `nengo_masked_steps` simulates the spiking
+784-500-200-50 network of `train_sigmoid.py` (with masked 9x9 receptive
+fields in the first layer) using dense transforms; the `_sparse` variant
+uses `transforms.connect`, and the `_node` variant forces a sparse `Node`
+for every layer, to check where `connect` should use one.
+
+The RBM benchmarks use `rbm.py` from `sigmoid-rbm/`, and the NEF decoder
+benchmark `solvers.py` from the repository root. Like the other scripts,
+this one does not change `sys.path`; run it from this folder with those
+folders on the path to include them:
+
+    PYTHONPATH=../common:../sigmoid-rbm:.. python benchmarks.py
+
+Otherwise they are reported as skipped, naming the missing folder.
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import sys
+import time
+
+import numpy as np
+
+import theano
+import theano.tensor as tt
+
+from autoencoder import (shift_images, Autoencoder, ConvAutoencoder,
+                         DeepAutoencoder)
+from datasets import synthetic_mnist
+from hinge import multi_hinge_margin
+
+benchmarks = []
+
+
+def benchmark(func):
+    """Register a benchmark (named after the function, without `bench_`)
+
+    A benchmark takes the number of examples `n` and returns `(run, n)`,
+    where `run` does the timed work on `n` samples.
+    """
+    benchmarks.append(func)
+    return func
+
+
+@contextlib.contextmanager
+def quiet():
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        yield
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+
+def synthetic_data(n, seed, shape=(28, 28)):
+    """`n` normalized synthetic MNIST images (see `datasets.py`), and labels"""
+    (images, labels), _, _ = synthetic_mnist(
+        n_train=n, n_valid=0, n_test=0, shape=shape, seed=seed)
+    images = images.astype(theano.config.floatX)
+    images -= images.mean(axis=0, keepdims=True)
+    images /= np.maximum(images.std(axis=0, keepdims=True), 3e-1)
+    return images, labels.astype('int32')
+
+
+def scaled_n(n, shape, batch_size=100):
+    """Examples with as many pixels as `n` MNIST images (whole batches)"""
+    n = n * 784 // int(np.prod(shape))
+    return max(n // batch_size, 1) * batch_size
+
+
+def auto_sgd_epoch(n, shape, convolutional=False):
+    n = scaled_n(n, shape)
+    images, _ = synthetic_data(n, 1, shape=shape)
+    if convolutional:
+        # 5 maps of 10x10 (28x28) or 28x28 (64x64) units, stride 2
+        auto = ConvAutoencoder(shape, 5, rf_shape=(9, 9), stride=(2, 2),
+                               hid_func=tt.nnet.sigmoid)
+    else:
+        auto = Autoencoder(shape, 500, rf_shape=(9, 9),
+                           hid_func=tt.nnet.sigmoid)
+
+    batches = images.reshape(-1, 100, images.shape[1])
+    train = auto.train_function(rate=0.1, noise=1.)
+
+    def run():
+        for batch in batches:
+            train(batch)
+    return run, n
+
+
+@benchmark
+def bench_auto_sgd_epoch(n):
+    return auto_sgd_epoch(n, (28, 28))
+
+
+@benchmark
+def bench_auto_sgd_epoch_64(n):
+    return auto_sgd_epoch(n, (64, 64))
+
+
+@benchmark
+def bench_auto_sgd_epoch_64x3(n):
+    return auto_sgd_epoch(n, (64, 64, 3))
+
+
+@benchmark
+def bench_conv_auto_sgd_epoch(n):
+    return auto_sgd_epoch(n, (28, 28), convolutional=True)
+
+
+@benchmark
+def bench_conv_auto_sgd_epoch_64x3(n):
+    return auto_sgd_epoch(n, (64, 64, 3), convolutional=True)
+
+
+@benchmark
+def bench_deep_encode(n):
+    images, _ = synthetic_data(n, 2)
+    sigmoid = tt.nnet.sigmoid
+    deep = DeepAutoencoder([
+        Autoencoder((28, 28), 500, rf_shape=(9, 9), hid_func=sigmoid),
+        Autoencoder(500, 200, vis_func=sigmoid, hid_func=sigmoid),
+        Autoencoder(200, 50, vis_func=sigmoid)])
+    encode = deep.encode
+    return (lambda: encode(images)), n
+
+
+@benchmark
+def bench_hinge_forward_backward(n):
+    rng = np.random.RandomState(3)
+    dtype = theano.config.floatX
+    x = tt.matrix('x')
+    y = tt.ivector('y')
+    cost = tt.mean(multi_hinge_margin(x, y))
+    f = theano.function([x, y], [cost, tt.grad(cost, x)])
+    values = rng.normal(size=(n, 10)).astype(dtype)
+    labels = rng.randint(0, 10, size=n).astype('int32')
+    return (lambda: f(values, labels)), n
+
+
+@benchmark
+def bench_shift_images(n):
+    images, _ = synthetic_data(n, 4)
+    return (lambda: shift_images(images, (28, 28))), n
+
+
+@benchmark
+def bench_shift_images_64x3(n):
+    shape = (64, 64, 3)
+    n = scaled_n(n, shape)
+    images, _ = synthetic_data(n, 4, shape=shape)
+    return (lambda: shift_images(images, shape)), n
+
+
+def import_sibling(module, folder):
+    """Import `module` from `folder`, which must be on the path (see above)"""
+    try:
+        return __import__(module)
+    except ImportError as e:
+        raise ImportError("%s (add %s to PYTHONPATH)" % (e, folder))
+
+
+def rbm_cd_epoch(n, shape, convolutional=False):
+    rbm_module = import_sibling('rbm', 'sigmoid-rbm/')
+    RBM, ConvRBM = rbm_module.RBM, rbm_module.ConvRBM
+    n = scaled_n(n, shape)
+    images, _ = synthetic_data(n, 5, shape=shape)
+    batches = images.reshape(-1, 100, images.shape[1])
+    rbm = (ConvRBM(shape, 5, rf_shape=(9, 9), stride=(2, 2)) if convolutional
+           else RBM(shape, 500, rf_shape=(9, 9)))
+    train = rbm.train_function(rate=0.1)
+
+    def run():
+        for batch in batches:
+            train(batch)
+    return run, n
+
+
+@benchmark
+def bench_rbm_cd_epoch(n):
+    return rbm_cd_epoch(n, (28, 28))
+
+
+@benchmark
+def bench_rbm_cd_epoch_64x3(n):
+    return rbm_cd_epoch(n, (64, 64, 3))
+
+
+@benchmark
+def bench_conv_rbm_cd_epoch(n):
+    return rbm_cd_epoch(n, (28, 28), convolutional=True)
+
+
+@benchmark
+def bench_nef_decoder_solve(n):
+    solvers = import_sibling('solvers', 'the repository root')
+    rng = np.random.RandomState(6)
+    images, _ = synthetic_data(n, 6)
+    encoders = rng.normal(size=(784, 500)) / 28.
+    acts = np.maximum(np.dot(images, encoders), 0)
+
+    def run():
+        normal = solvers.NormalEquations(500, 784)
+        normal.add(acts, images)
+        normal.solve(reg=0.1)
+    return run, n
+
+
+@benchmark
+def bench_nengo_simulator_steps(n):
+    import nengo
+    rng = np.random.RandomState(7)
+    n_steps = max(n // 10, 100)
+    model = nengo.Network(seed=8)
+    with model:
+        u = nengo.Node(output=rng.uniform(-1, 1, size=784))
+        prev, n_prev = u, 784
+        for n_neurons in [500, 200]:
+            layer = nengo.Ensemble(
+                n_neurons, 1, neuron_type=nengo.LIF(),
+                max_rates=np.full(n_neurons, 63.04),
+                intercepts=np.zeros(n_neurons))
+            post = prev if prev is u else prev.neurons
+            nengo.Connection(post, layer.neurons, synapse=0.005,
+                             transform=rng.normal(size=(n_neurons, n_prev))
+                             / np.sqrt(n_prev))
+            prev, n_prev = layer, n_neurons
+
+    with quiet():
+        sim = nengo.Simulator(model, dt=1e-3)
+    return (lambda: sim.run_steps(n_steps, progress_bar=False)), n_steps
+
+
+def nengo_masked_steps(n, mode):
+    import nengo
+    from masks import sparse_mask
+    from transforms import connect
+    rng = np.random.RandomState(9)
+    n_steps = max(n // 10, 100)
+    sizes = [784, 500, 200, 50]  # the layers of train_sigmoid.py
+    weights = [rng.normal(size=(n_in, n_out)) / np.sqrt(n_in)
+               for n_in, n_out in zip(sizes[:-1], sizes[1:])]
+    weights[0] *= sparse_mask((28, 28), sizes[1], (9, 9), rng=rng)
+    model = nengo.Network(seed=10)
+    with model:
+        u = nengo.Node(output=rng.uniform(-1, 1, size=784))
+        pre = u
+        for W in weights:
+            layer = nengo.Ensemble(
+                W.shape[1], 1, neuron_type=nengo.LIF(),
+                max_rates=np.full(W.shape[1], 63.04),
+                intercepts=np.zeros(W.shape[1]))
+            if mode == 'dense':
+                nengo.Connection(pre, layer.neurons, transform=W.T,
+                                 synapse=0.005)
+            elif mode == 'node':
+                connect(pre, layer.neurons, transform=W.T, synapse=0.005,
+                        max_density=1., min_size=0)
+            else:
+                connect(pre, layer.neurons, transform=W.T, synapse=0.005)
+            pre = layer.neurons
+
+    with quiet():
+        sim = nengo.Simulator(model, dt=1e-3)
+    return (lambda: sim.run_steps(n_steps, progress_bar=False)), n_steps
+
+
+@benchmark
+def bench_nengo_masked_steps(n):
+    return nengo_masked_steps(n, 'dense')
+
+
+@benchmark
+def bench_nengo_masked_sparse_steps(n):
+    return nengo_masked_steps(n, 'connect')
+
+
+@benchmark
+def bench_nengo_masked_node_steps(n):
+    return nengo_masked_steps(n, 'node')
+
+
+def run_benchmark(func, n, repeats):
+    result = dict(name=func.__name__[len('bench_'):])
+    try:
+        run, n_samples = func(n)
+        run()  # warm up (e.g. compile)
+        times = []
+        for _ in range(repeats):
+            t = time.time()
+            run()
+            times.append(time.time() - t)
+    except ImportError as e:
+        result.update(status='skipped', reason=str(e))
+        return result
+
+    result.update(status='ok', n=n_samples, repeats=repeats,
+                  median=float(np.median(times)), min=float(np.min(times)),
+                  samples_per_sec=n_samples / float(np.median(times)))
+    return result
+
+
+def environment():
+    return dict(python=platform.python_version(), machine=platform.machine(),
+                numpy=np.__version__, theano=theano.__version__,
+                floatX=theano.config.floatX,
+                date=time.strftime('%Y-%m-%d %H:%M:%S'))
+
+
+def compare(results, baseline, tolerance):
+    """Mark each result relative to the baseline; returns the regressions"""
+    base = dict((r['name'], r) for r in baseline['results']
+                if r['status'] == 'ok')
+    regressions = []
+    for r in results:
+        b = base.get(r['name'])
+        if r['status'] != 'ok' or b is None or b['n'] != r['n']:
+            continue
+        r['baseline'] = b['median']
+        r['ratio'] = r['median'] / b['median']
+        if r['ratio'] > 1 + tolerance:
+            regressions.append(r['name'])
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--output', help="JSON file for the results")
+    parser.add_argument('--baseline', help="JSON results to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help="slowdown relative to baseline that is flagged")
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--n', type=int, default=10000,
+                        help="number of examples per benchmark")
+    parser.add_argument('--quick', action='store_true',
+                        help="use 1000 examples and one repeat")
+    parser.add_argument('names', nargs='*', help="benchmarks to run")
+    args = parser.parse_args(argv)
+
+    n, repeats = (1000, 1) if args.quick else (args.n, args.repeats)
+    funcs = [f for f in benchmarks
+             if not args.names or f.__name__[len('bench_'):] in args.names]
+
+    results = []
+    for func in funcs:
+        result = run_benchmark(func, n, repeats)
+        results.append(result)
+        if result['status'] == 'ok':
+            print "%-24s %10.4f s %14.0f samples/s" % (
+                result['name'], result['median'], result['samples_per_sec'])
+        else:
+            print "%-24s skipped (%s)" % (result['name'], result['reason'])
+
+    regressions = []
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        print "\n%-24s %10s %10s %8s" % ('vs. baseline', 'time [s]',
+                                         'base [s]', 'ratio')
+        for r in results:
+            if 'ratio' in r:
+                flag = '  REGRESSION' if r['name'] in regressions else ''
+                print "%-24s %10.4f %10.4f %8.2f%s" % (
+                    r['name'], r['median'], r['baseline'], r['ratio'], flag)
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(dict(environment=environment(), results=results), f,
+                      indent=2, sort_keys=True)
+
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,53 @@
+"""
+Check that data-parallel workers draw different noise.
+
+The workers of `parallel.DataParallel` are forked after the gradient function
+is compiled, so they start with copies of the same random stream states.
+Gives every worker the same shard of examples and compares the gradients
+they write: without noise they must be equal, and with noise (after the
+per-worker reseeding) they must differ.
+"""
+import numpy as np
+
+import theano
+import theano.tensor as tt
+
+from autoencoder import mnist, normalize, Autoencoder, DeepAutoencoder
+from parallel import DataParallel
+from precision import floatX
+
+n_workers = 2
+batch_size = 100
+
+train, valid, test = mnist()
+images = floatX(train[0][:batch_size])
+normalize(images)
+labels = train[1][:batch_size].astype('int32')
+
+auto = Autoencoder((28, 28), 200, hid_func=tt.nnet.sigmoid)
+deep = DeepAutoencoder([auto])
+auto.untie()
+params = [auto.W, auto.V, auto.c, auto.b]
+
+# every worker gets the same examples
+data = np.concatenate([images] * n_workers)
+targets = np.concatenate([labels] * n_workers)
+
+for noise in [0, 0.3]:
+    x = tt.matrix('batch')
+    y = tt.ivector('labels')
+    cost = tt.mean((deep.propdown(deep.propup(x, noise=noise)) - x)**2)
+    f_grad = theano.function([x, y], [cost] + tt.grad(cost, params),
+                             on_unused_input='ignore')
+
+    workers = DataParallel(
+        f_grad, params, data.shape, n_workers,
+        rngs=[(auto.theano_rng, auto.seed)])
+    workers.set_data(data, targets)
+    workers.step(0, len(data), 0.)
+    grads = workers.grads.array.copy()
+    workers.close()
+
+    same = [np.array_equal(grads[0], g) for g in grads[1:]]
+    print("noise=%s: shard gradients equal: %s" % (noise, same))
+    assert all(same) if noise == 0 else not any(same)
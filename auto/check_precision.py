@@ -0,0 +1,50 @@
+"""
+Check that float32 training gives the same classifier error as float64.
+
+Trains the same small network (one sigmoid autoencoder layer plus a hinge
+classifier, with SGD fine-tuning) under each precision policy, and compares
+the reconstruction and classification errors and the parameter memory.
+"""
+import numpy as np
+
+import theano
+import theano.tensor as tt
+
+import precision
+from autoencoder import mnist, normalize, rms, Autoencoder, DeepAutoencoder
+
+n_train = 10000
+n_epochs = 5
+
+train, valid, test = mnist()
+train = (train[0][:n_train], train[1][:n_train])
+for images in [train[0], test[0]]:
+    normalize(images)
+
+results = {}
+for dtype in ['float64', 'float32']:
+    precision.set_precision(dtype)
+
+    auto = Autoencoder((28, 28), 500, rf_shape=(9, 9),
+                       hid_func=tt.nnet.sigmoid)
+    auto.auto_sgd(train[0], rate=1., noise=0.1, n_epochs=n_epochs)
+
+    deep = DeepAutoencoder([auto])
+    deep.train_classifier(train, test)
+    deep.sgd(train, (None, None), n_epochs=n_epochs, tradeoff=1)
+
+    test_images = precision.floatX(test[0])
+    recons = auto.reconstruct(test_images)
+    results[dtype] = dict(
+        recons=rms(test_images - recons, axis=1).mean(),
+        error=deep.test(test).mean(),
+        nbytes=sum(p.get_value().nbytes for p in [auto.W, auto.c, auto.b]))
+
+print "%-8s %10s %10s %10s" % ('', 'recons', 'error', 'MB')
+for dtype in ['float64', 'float32']:
+    r = results[dtype]
+    print "%-8s %10.4f %10.4f %10.2f" % (
+        dtype, r['recons'], r['error'], r['nbytes'] / 1e6)
+
+delta = results['float32']['error'] - results['float64']['error']
+print "Classifier error difference (float32 - float64): %0.4f" % delta
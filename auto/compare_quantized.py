@@ -0,0 +1,131 @@
+"""
+Compare a trained network with its quantized export.
+
+Exports the network with `quantize.export_quantized`, then reports the file
+sizes and the classification error of the float and quantized networks, both
+as ANNs and as spiking networks (same architecture as `run_lif.py`).
+"""
+import os
+
+import numpy as np
+
+import nengo
+
+from datasets import mnist
+from inference import Network
+from modelfile import load_network
+from presentation import Presentation, folded_gain_bias, steps_per_presentation
+from quantize import (classifier_transform, export_quantized, load_quantized,
+                      QuantizedNetwork)
+
+# --- parameters
+model_file = 'nlif-deep.npz'
+bits = 8
+quantized_file = 'nlif-deep-int%d.npz' % bits
+
+presentation_time = 0.1
+n_spiking = 100  # number of test images to run through the spiking networks
+Ncode = 10
+Nclass = 30
+pstc = 0.004
+max_rate = 63.04
+amp = 1. / max_rate
+dt = 1e-3
+
+
+def spiking_errors(biases, transforms, class_transform, bc,
+                   images, image_labels):
+    """Run a spiking network and compute errors offline from the probes
+
+    `transforms[i]` is the (already scaled) transform into layer `i`.
+    """
+    neuron_type = nengo.LIF(tau_rc=0.02, tau_ref=0.002)
+
+    model = nengo.Network(seed=97)
+    with model:
+        input_images = nengo.Node(
+            output=Presentation(images, presentation_time, dt=dt))
+
+        layers = []
+        for i, [transform, b] in enumerate(zip(transforms[:-1], biases[:-1])):
+            n = b.size
+            gain, bias = folded_gain_bias(neuron_type, max_rate*np.ones(n),
+                                          np.zeros(n), b)
+            layer = nengo.Ensemble(n, 1, neuron_type=neuron_type,
+                                   gain=gain, bias=bias)
+            pre = input_images if i == 0 else layers[-1].neurons
+            nengo.Connection(pre, layer.neurons, transform=transform,
+                             synapse=pstc)
+            layers.append(layer)
+
+        b = biases[-1]
+        code_layer = nengo.networks.EnsembleArray(Ncode, b.size, radius=5)
+        nengo.Connection(nengo.Node(output=b), code_layer.input, synapse=0)
+        nengo.Connection(layers[-1].neurons, code_layer.input,
+                         transform=transforms[-1], synapse=pstc)
+
+        class_layer = nengo.networks.EnsembleArray(Nclass, bc.size, radius=5)
+        nengo.Connection(nengo.Node(output=bc), class_layer.input, synapse=0)
+        nengo.Connection(code_layer.output, class_layer.input,
+                         transform=class_transform, synapse=pstc)
+        probe_class = nengo.Probe(class_layer.output, synapse=0.03)
+
+    sim = nengo.Simulator(model, dt=dt)
+    sim.run(len(images) * presentation_time)
+
+    # classify using the last half of each presentation
+    steps = steps_per_presentation(presentation_time, dt)
+    y = sim.data[probe_class][:len(images) * steps]
+    y = y.reshape(len(images), steps, -1)[:, steps // 2:].mean(axis=1)
+    return image_labels != labels[np.argmax(y, axis=1)]
+
+
+# --- load the model and data
+data = load_network(model_file)
+weights, biases = list(data['weights']), list(data['biases'])
+Wc, bc = data['Wc'], data['bc']
+
+export_quantized(quantized_file, weights, biases, Wc, bc, bits=bits,
+                 amp=amp, dt=dt)
+qdata = load_network(quantized_file)
+qweights, _, qWc, _ = load_quantized(quantized_file)
+
+print "File size: float %0.2f MB, int%d %0.2f MB" % (
+    os.path.getsize(model_file) / 1e6, bits,
+    os.path.getsize(quantized_file) / 1e6)
+for i, (W, Wq) in enumerate(zip(weights + [Wc], qweights + [qWc])):
+    print "Layer %d: max quantization error %0.2e (max |W| %0.2e)" % (
+        i, np.abs(W - Wq).max(), np.abs(W).max())
+
+_, _, [test_images, test_labels] = mnist()
+test_images -= test_images.mean(axis=0, keepdims=True)
+test_images /= np.maximum(test_images.std(axis=0, keepdims=True), 3e-1)
+
+rng = np.random.RandomState(92)
+inds = rng.permutation(len(test_images))
+test_images = test_images[inds]
+test_labels = test_labels[inds]
+labels = np.unique(test_labels)
+
+# --- test as ANN
+ann = Network(weights, biases, Wc=Wc, bc=bc, neuron='lif')
+qann = QuantizedNetwork.from_file(quantized_file, neuron='lif')
+ann_error = (test_labels != ann.classify(test_images, labels=labels)).mean()
+qann_error = (test_labels != qann.classify(test_images, labels=labels)).mean()
+print "ANN error: float %0.4f, int%d %0.4f (delta %+0.4f)" % (
+    ann_error, bits, qann_error, qann_error - ann_error)
+
+# --- test as spiking networks
+images, image_labels = test_images[:n_spiking], test_labels[:n_spiking]
+float_transforms = [weights[0].T] + [W.T * amp / dt for W in weights[1:]]
+quant_transforms = [q.T * s for q, s in
+                    zip(qdata['weights'], qdata['spike_scales'])]
+
+spk_error = spiking_errors(biases, float_transforms, Wc.T, bc,
+                           images, image_labels).mean()
+# the classifier reads the decoded code layer, not spikes
+qspk_error = spiking_errors(biases, quant_transforms,
+                            classifier_transform(qdata, 'code'), bc,
+                            images, image_labels).mean()
+print "Spiking error (%d images): float %0.4f, int%d %0.4f (delta %+0.4f)" % (
+    n_spiking, spk_error, bits, qspk_error, qspk_error - spk_error)
@@ -0,0 +1,132 @@
+"""
+Fast non-spiking forward pass for deployed networks, without Theano.
+
+`Network` loads the saved `weights`/`biases` (and optionally the classifier
+`Wc`/`bc`) once, preallocates one buffer per layer for a maximum batch size,
+and evaluates each layer in place (`np.dot(..., out=)` followed by an
+in-place rate computation). Large batches are split into chunks that are
+evaluated by a pool of threads; NumPy releases the GIL for the matrix
+products and the elementwise operations, so the threads run in parallel.
+"""
+import multiprocessing
+import multiprocessing.pool
+
+import numpy as np
+
+import rates
+from modelfile import load_network
+
+
+def lif(x, out=None):
+    """LIF rates, scaled so that f(1) = 1 (matches `nlif` in training)"""
+    return rates.softlif_rate(x, sigma=0, amp=1. / 63.04, out=out)
+
+
+neuron_types = {'lif': lif, 'sigmoid': rates.sigmoid}
+
+
+class Network(object):
+    """
+    Feedforward network for fast ANN evaluation of saved models.
+
+    `neuron` is one of `neuron_types` or a function `f(x, out=None)` that
+    computes rates in place. If `linear_top` is true, the last layer of
+    `weights` is linear (e.g. a code layer), otherwise all layers use the
+    nonlinearity.
+    """
+
+    def __init__(self, weights, biases, Wc=None, bc=None, neuron='lif',
+                 linear_top=True, max_batch=1000, n_threads=None,
+                 dtype=np.float64):
+        assert len(weights) == len(biases)
+        self.dtype = np.dtype(dtype)
+        self.weights = [np.asarray(w, dtype=self.dtype) for w in weights]
+        self.biases = [np.asarray(b, dtype=self.dtype) for b in biases]
+        self.Wc = None if Wc is None else np.asarray(Wc, dtype=self.dtype)
+        self.bc = None if bc is None else np.asarray(bc, dtype=self.dtype)
+        self.neuron = neuron_types.get(neuron, neuron)
+        self.linear_top = linear_top
+
+        self.max_batch = max_batch
+        self.n_threads = (multiprocessing.cpu_count() if n_threads is None
+                          else n_threads)
+        self.pool = (multiprocessing.pool.ThreadPool(self.n_threads)
+                     if self.n_threads > 1 else None)
+
+        # --- preallocate buffers
+        self.input = np.zeros((max_batch, self.weights[0].shape[0]),
+                              dtype=self.dtype)
+        self.layers = [np.zeros((max_batch, w.shape[1]), dtype=self.dtype)
+                       for w in self.weights]
+        self.classes = (np.zeros((max_batch, self.Wc.shape[1]),
+                                 dtype=self.dtype)
+                        if self.Wc is not None else None)
+
+    @classmethod
+    def from_file(cls, filename, **kwargs):
+        data = load_network(filename)
+        Wc = data['Wc'] if 'Wc' in data else None
+        bc = data['bc'] if 'bc' in data else None
+        return cls(data['weights'], data['biases'], Wc=Wc, bc=bc, **kwargs)
+
+    @property
+    def n_outputs(self):
+        return self.weights[-1].shape[1]
+
+    def _run_chunk(self, chunk):
+        i0, i1, classify = chunk
+        x = self.input[i0:i1]
+        n_layers = len(self.weights)
+        for k, (w, b) in enumerate(zip(self.weights, self.biases)):
+            y = self.layers[k][i0:i1]
+            np.dot(x, w, out=y)
+            y += b
+            if k < n_layers - 1 or not self.linear_top:
+                self.neuron(y, out=y)
+            x = y
+
+        if classify:
+            y = self.classes[i0:i1]
+            np.dot(x, self.Wc, out=y)
+            y += self.bc
+
+    def _run(self, x, out, classify):
+        for i in xrange(0, len(x), self.max_batch):
+            n = min(self.max_batch, len(x) - i)
+            self.input[:n] = x[i:i+n]
+
+            n_chunks = min(self.n_threads, n)
+            bounds = np.linspace(0, n, n_chunks + 1).astype(int)
+            chunks = [(i0, i1, classify)
+                      for i0, i1 in zip(bounds[:-1], bounds[1:])]
+            if self.pool is not None and n_chunks > 1:
+                self.pool.map(self._run_chunk, chunks)
+            else:
+                map(self._run_chunk, chunks)
+
+            out[i:i+n] = (self.classes if classify else self.layers[-1])[:n]
+
+        return out
+
+    def forward(self, x, out=None):
+        """Output of the last layer of `weights` for inputs `x`"""
+        if out is None:
+            out = np.zeros((len(x), self.n_outputs), dtype=self.dtype)
+        return self._run(x, out, classify=False)
+
+    def class_scores(self, x, out=None):
+        """Classifier outputs (`np.dot(code, Wc) + bc`) for inputs `x`"""
+        assert self.Wc is not None and self.bc is not None
+        if out is None:
+            out = np.zeros((len(x), self.Wc.shape[1]), dtype=self.dtype)
+        return self._run(x, out, classify=True)
+
+    def classify(self, x, labels=None):
+        """Index of the winning class (or its label, if `labels` given)"""
+        inds = np.argmax(self.class_scores(x), axis=1)
+        return inds if labels is None else np.asarray(labels)[inds]
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool = None
@@ -0,0 +1,197 @@
+"""
+k-nearest-neighbour classification of network codes.
+
+`KNNClassifier` keeps the encoded training set and classifies queries by a
+majority vote of their `k` nearest training codes (Euclidean distance). The
+neighbours are found either exactly, with batched GEMM distances
+(`||a||^2 - 2 a.b + ||b||^2`), or approximately with `LSHIndex`, which uses
+random-hyperplane locality-sensitive hashing (as prototyped in
+`cluster-lsh.py`): codes are centred, hashed by the signs of their
+projections onto `n_bits` random hyperplanes in each of `n_tables` tables,
+and only training codes sharing a bucket with the query (or, with
+`probes=1`, a bucket one bit away) are compared exactly.
+"""
+import numpy as np
+
+
+class LSHIndex(object):
+
+    def __init__(self, points, n_tables=8, n_bits=12, probes=1, rng=np.random):
+        assert n_bits < 63
+        self.points = points
+        self.center = points.mean(axis=0)
+        self.n_tables = n_tables
+        self.n_bits = n_bits
+        self.probes = probes
+
+        # planes for all tables at once: (dims, n_tables * n_bits)
+        self.planes = rng.normal(size=(points.shape[1], n_tables * n_bits))
+        self.powers = 2**np.arange(n_bits, dtype='int64')
+
+        # each table is a sort of the points by bucket key
+        keys = self.hash(points)
+        self.orders, self.keys, self.starts = [], [], []
+        for t in range(n_tables):
+            order = np.argsort(keys[:, t], kind='mergesort')
+            ukeys, starts = np.unique(keys[order, t], return_index=True)
+            self.orders.append(order)
+            self.keys.append(ukeys)
+            self.starts.append(np.append(starts, len(points)))
+
+    def hash(self, x):
+        """Bucket keys of the points `x`, one column per table"""
+        bits = np.dot(x - self.center, self.planes) > 0
+        bits = bits.reshape(len(x), self.n_tables, self.n_bits)
+        return np.dot(bits, self.powers)
+
+    def candidate_pairs(self, x):
+        """Candidate neighbours of the points `x`, as flat index arrays
+
+        Returns `(queries, cands)`, sorted by query and then candidate, with
+        no duplicates: training point `cands[i]` is a candidate for
+        `x[queries[i]]`.
+        """
+        keys = self.hash(x)
+        flips = np.array([0] + ([1 << b for b in range(self.n_bits)]
+                                if self.probes > 0 else []), dtype='int64')
+        n = len(self.points)
+
+        # look up all (query, probe) buckets of each table at once, and
+        # expand the found buckets into (query, point) pairs
+        pairs = []
+        for t in range(self.n_tables):
+            probe_keys = keys[:, t, None] ^ flips
+            i = np.searchsorted(self.keys[t], probe_keys)
+            i = np.minimum(i, len(self.keys[t]) - 1)
+            found = self.keys[t][i] == probe_keys
+            queries = np.nonzero(found)[0]
+            starts = self.starts[t][i][found]
+            lengths = self.starts[t][i + 1][found] - starts
+            offsets = np.arange(lengths.sum()) - np.repeat(
+                np.cumsum(lengths) - lengths, lengths)
+            points = self.orders[t][np.repeat(starts, lengths) + offsets]
+            pairs.append(np.repeat(queries, lengths) * n + points)
+
+        pairs = np.unique(np.concatenate(pairs))
+        return pairs // n, pairs % n
+
+    def candidates(self, x):
+        """Indices of the candidate neighbours of each point in `x`"""
+        queries, cands = self.candidate_pairs(x)
+        return np.split(cands, np.searchsorted(queries, np.arange(1, len(x))))
+
+
+class KNNClassifier(object):
+    """
+    Parameters
+    ----------
+    codes : array (n_examples, dims)
+        Encoded training set (e.g. `DeepAutoencoder.encode` output).
+    labels : array (n_examples,)
+    k : int
+        Number of neighbours that vote.
+    index : dict or None
+        Parameters for an `LSHIndex`; if None, searches are exact.
+    """
+
+    def __init__(self, codes, labels, k=5, index=None):
+        self.codes = np.asarray(codes, dtype=np.float64)
+        self.labels = np.asarray(labels)
+        self.categories, self.label_inds = np.unique(
+            self.labels, return_inverse=True)
+        self.k = k
+        self.sq_norms = (self.codes**2).sum(axis=1)
+        self.index = LSHIndex(self.codes, **index) if index is not None else None
+
+    def neighbours_exact(self, x, batch_size=1000):
+        """Indices of the `k` nearest training codes, by batched GEMM"""
+        k = self.k
+        result = np.zeros((len(x), k), dtype='int64')
+        for i in range(0, len(x), batch_size):
+            # ||x||^2 is the same for all training codes, so it is left out
+            d = np.dot(x[i:i + batch_size], self.codes.T)
+            d *= -2
+            d += self.sq_norms
+            nearest = np.argpartition(d, k - 1, axis=1)[:, :k]
+            rows = np.arange(len(d))[:, None]
+            order = np.argsort(d[rows, nearest], axis=1)
+            result[i:i + batch_size] = nearest[rows, order]
+        return result
+
+    def neighbours_lsh(self, x, batch_size=1000, chunk_size=65536):
+        """Indices of the (approximate) `k` nearest training codes
+
+        The candidates of a batch of queries are found at once (see
+        `LSHIndex.candidate_pairs`). The queries are then sorted by their
+        number of candidates and handled in groups, with the candidates of
+        each query laid out in a row (padded with inf), so the distances of
+        a group are one batched product and its nearest `k` one
+        `argpartition`. Each group gathers at most `chunk_size` code values,
+        padding included, which keeps them in cache (so queries with many
+        candidates are handled nearly one at a time, and a query with more
+        than `chunk_size` values gets a group of its own). Queries with
+        fewer than `k` candidates fall back to exact search.
+        """
+        k = self.k
+        dims = self.codes.shape[1]
+        result = np.zeros((len(x), k), dtype='int64')
+        exact = []
+        for i in range(0, len(x), batch_size):
+            xi = x[i:i + batch_size]
+            queries, cands = self.index.candidate_pairs(xi)
+            counts = np.bincount(queries, minlength=len(xi))
+            firsts = np.cumsum(counts) - counts
+            exact.extend(i + np.nonzero(counts < k)[0])
+
+            order = np.argsort(counts, kind='mergesort')
+            sorted_counts = counts[order]
+            j = np.searchsorted(sorted_counts, k)
+            while j < len(order):
+                # counts are ascending, so a group of n rows is padded to the
+                # count of its last query
+                sizes = sorted_counts[j:] * np.arange(1, len(order) - j + 1)
+                n = max(np.searchsorted(sizes, chunk_size // dims, 'right'), 1)
+                group, j = order[j:j + n], j + n
+                cols = np.arange(counts[group].max())
+                valid = cols < counts[group][:, None]
+                points = cands[np.where(valid, firsts[group][:, None] + cols, 0)]
+
+                # ||x||^2 is the same for all candidates of a query, so left out
+                d = self.sq_norms[points] - 2 * np.matmul(
+                    self.codes[points], xi[group][:, :, None])[:, :, 0]
+                d[~valid] = np.inf
+
+                nearest = np.argpartition(d, k - 1, axis=1)[:, :k]
+                rows = np.arange(len(group))[:, None]
+                nearest = nearest[rows, np.argsort(d[rows, nearest], axis=1)]
+                result[i + group] = points[rows, nearest]
+
+        if len(exact) > 0:
+            result[exact] = self.neighbours_exact(x[exact])
+        return result
+
+    def predict(self, x, batch_size=1000):
+        """Majority vote of the `k` nearest neighbours for each code in `x`"""
+        x = np.asarray(x, dtype=np.float64)
+        if x.ndim == 1:
+            return self.predict(x[None, :], batch_size=batch_size)[0]
+
+        nearest = (self.neighbours_exact(x, batch_size=batch_size)
+                   if self.index is None
+                   else self.neighbours_lsh(x, batch_size=batch_size))
+
+        # votes[i, c] = number of neighbours of x[i] with category c
+        n_cats = len(self.categories)
+        votes = np.zeros((len(x), n_cats), dtype='int64')
+        inds = self.label_inds[nearest]
+        np.add.at(votes, (np.arange(len(x))[:, None], inds), 1)
+
+        # break ties in favour of the nearest neighbour's category
+        votes *= self.k + 1
+        votes[np.arange(len(x)), inds[:, 0]] += 1
+        return self.categories[np.argmax(votes, axis=1)]
+
+    def test(self, test_set, batch_size=1000):
+        """Errors on `(codes, labels)`, like `DeepAutoencoder.test`"""
+        codes, labels = test_set
+        return (labels != self.predict(codes, batch_size=batch_size))
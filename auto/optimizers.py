@@ -0,0 +1,176 @@
+"""
+Update rules and learning-rate schedules for SGD training.
+
+Each update rule takes lists of parameters (shared variables) and their
+gradients and returns an `OrderedDict` of Theano updates, including the
+updates for any optimizer state (velocities, moment estimates). `masks` maps
+parameters to sparsity masks; the gradients and the updated parameters are
+both masked, so masked weights stay zero and accumulate no optimizer state.
+`optimizer_state` picks the state variables out of the updates.
+
+`rate` can be a number or a Theano scalar (e.g. from `rate_variable`, so that
+it can follow a schedule). Schedules are functions from the epoch number to
+the learning rate.
+"""
+import collections
+
+import numpy as np
+
+import theano
+import theano.tensor as tt
+
+
+def _state(param, name):
+    return theano.shared(np.zeros_like(param.get_value(borrow=True)),
+                         name='%s_%s' % (param.name, name),
+                         broadcastable=param.broadcastable)
+
+
+def _masked(params, grads, masks):
+    masks = {} if masks is None else masks
+    return [grad * masks[param] if param in masks else grad
+            for param, grad in zip(params, grads)]
+
+
+def _mask_params(updates, masks):
+    for param, mask in (masks or {}).items():
+        if param in updates:
+            updates[param] = updates[param] * mask
+    return updates
+
+
+def sgd(params, grads, rate=0.1, masks=None):
+    """Plain SGD: `param - rate * grad`"""
+    updates = collections.OrderedDict()
+    for param, grad in zip(params, grads):
+        updates[param] = param - tt.cast(rate, param.dtype) * grad
+
+    return _mask_params(updates, masks)
+
+
+def _momentum(params, grads, rate, mu, nesterov, masks):
+    updates = collections.OrderedDict()
+    for param, grad in zip(params, _masked(params, grads, masks)):
+        dtype = param.dtype
+        rate_, mu = tt.cast(rate, dtype), tt.cast(mu, dtype)
+
+        velocity = _state(param, 'velocity')
+        step = mu * velocity - rate_ * grad
+        updates[velocity] = step
+        if nesterov:
+            step = mu * step - rate_ * grad
+        updates[param] = param + step
+
+    return _mask_params(updates, masks)
+
+
+def momentum(params, grads, rate=0.1, momentum=0.9, masks=None):
+    """SGD with classical momentum"""
+    return _momentum(params, grads, rate, momentum, False, masks)
+
+
+def nesterov(params, grads, rate=0.1, momentum=0.9, masks=None):
+    """SGD with Nesterov momentum"""
+    return _momentum(params, grads, rate, momentum, True, masks)
+
+
+def rmsprop(params, grads, rate=1e-3, rho=0.9, eps=1e-6, masks=None):
+    """RMSProp: scale steps by a running RMS of the gradients"""
+    updates = collections.OrderedDict()
+    for param, grad in zip(params, _masked(params, grads, masks)):
+        dtype = param.dtype
+        rho_ = tt.cast(rho, dtype)
+
+        acc = _state(param, 'msq')
+        acc_new = rho_ * acc + (1 - rho_) * grad**2
+        updates[acc] = acc_new
+        updates[param] = param - tt.cast(rate, dtype) * grad / tt.sqrt(
+            acc_new + tt.cast(eps, dtype))
+
+    return _mask_params(updates, masks)
+
+
+def adam(params, grads, rate=1e-3, beta1=0.9, beta2=0.999, eps=1e-8,
+         masks=None):
+    """Adam (Kingma & Ba, 2015), with bias-corrected moment estimates"""
+    updates = collections.OrderedDict()
+    dtype = params[0].dtype
+    t = theano.shared(np.asarray(0, dtype=dtype), name='adam_t')
+    t_new = t + 1
+    updates[t] = t_new
+
+    b1, b2 = tt.cast(beta1, dtype), tt.cast(beta2, dtype)
+    rate_t = tt.cast(rate, dtype) * tt.sqrt(1 - b2**t_new) / (1 - b1**t_new)
+
+    for param, grad in zip(params, _masked(params, grads, masks)):
+        m = _state(param, 'm')
+        v = _state(param, 'v')
+        m_new = b1 * m + (1 - b1) * grad
+        v_new = b2 * v + (1 - b2) * grad**2
+        updates[m] = m_new
+        updates[v] = v_new
+        updates[param] = param - tt.cast(rate_t, param.dtype) * m_new / (
+            tt.sqrt(v_new) + tt.cast(eps, param.dtype))
+
+    return _mask_params(updates, masks)
+
+
+optimizers = {'sgd': sgd, 'momentum': momentum, 'nesterov': nesterov,
+              'rmsprop': rmsprop, 'adam': adam}
+
+
+def get_updates(optimizer, params, grads, rate, masks=None):
+    """Updates from `optimizer`, a name in `optimizers` or an update rule
+
+    Use `functools.partial` to set other options of a rule, e.g.
+    `partial(optimizers.adam, beta1=0.8)`.
+    """
+    rule = optimizers[optimizer] if isinstance(optimizer, str) else optimizer
+    return rule(params, grads, rate=rate, masks=masks)
+
+
+def optimizer_state(updates, params):
+    """The optimizer state variables updated by `updates`
+
+    These are the shared variables other than `params` (velocities, moment
+    estimates, step counts); checkpoint them along with the parameters so
+    that training resumes with the same optimizer state.
+    """
+    return [var for var in updates if var not in params]
+
+
+# --- learning-rate schedules
+def constant(rate):
+    return lambda epoch: rate
+
+
+def step_decay(rate, factor=0.5, every=10):
+    """Multiply the rate by `factor` every `every` epochs"""
+    return lambda epoch: rate * factor**(epoch // every)
+
+
+def exp_decay(rate, gamma=0.95):
+    """Multiply the rate by `gamma` every epoch"""
+    return lambda epoch: rate * gamma**epoch
+
+
+def inv_decay(rate, tau=10.):
+    """Decay the rate as `1 / (1 + epoch / tau)`"""
+    return lambda epoch: rate / (1. + epoch / float(tau))
+
+
+def rate_variable(rate, dtype=None):
+    """A shared learning rate and its schedule
+
+    `rate` is a number (constant rate) or a schedule. Returns the shared
+    variable, initialized to the rate for epoch 0, and the schedule; call
+    `set_rate(var, schedule, epoch)` at the start of each epoch.
+    """
+    dtype = theano.config.floatX if dtype is None else dtype
+    schedule = rate if callable(rate) else constant(rate)
+    var = theano.shared(np.asarray(schedule(0), dtype=dtype), name='rate')
+    return var, schedule
+
+
+def set_rate(var, schedule, epoch, scale=1.):
+    var.set_value(np.asarray(scale * schedule(epoch), dtype=var.dtype))
@@ -0,0 +1,90 @@
+"""
+Low-bit quantized export of trained networks for spiking deployment.
+
+Each weight matrix is stored as signed integers (int8 or int16) with one
+float scale per layer, using symmetric linear quantization:
+
+    W ~= q * scale,  scale = max(|W|) / (2**(bits - 1) - 1)
+
+The file also stores `spike_scales`, the scales with the spike-input factors
+folded in (`amp / dt`, i.e. `amp * 1000`), so the Nengo transform for a layer
+fed by spiking neurons is just `q.T * spike_scale`. Biases stay in floating
+point, since they are small. Files are written in the model file format
+(see `modelfile.py`).
+
+The right classifier scale depends on what the classifier reads: `scale_c`
+if it reads a decoded code layer (`run_lif.py`, `compare_quantized.py`),
+and `spike_scale_c` if it reads the spikes of the top layer directly
+(`run_lif_nocode.py`). Use `classifier_transform` to pick one.
+"""
+import numpy as np
+
+from inference import Network
+import modelfile
+
+int_types = {8: np.int8, 16: np.int16}
+
+
+def quantize(W, bits=8):
+    """Quantize `W` to signed integers, returning `(q, scale)`"""
+    qmax = 2**(bits - 1) - 1
+    wmax = np.abs(W).max()
+    scale = wmax / qmax if wmax > 0 else 1.
+    q = np.round(W / scale).clip(-qmax, qmax).astype(int_types[bits])
+    return q, scale
+
+
+def dequantize(q, scale, dtype=np.float64):
+    W = q.astype(dtype)
+    W *= scale
+    return W
+
+
+def export_quantized(filename, weights, biases, Wc, bc, bits=8,
+                     amp=1. / 63.04, dt=1e-3):
+    """Save a quantized copy of a network (see module docstring)
+
+    Layer 0 takes the images directly, so its spike scale has no `amp / dt`
+    factor; all other layers (and the classifier) take spiking inputs.
+    """
+    qs, scales = zip(*[quantize(W, bits=bits) for W in weights])
+    qc, scale_c = quantize(Wc, bits=bits)
+
+    spike_factor = amp / dt
+    spike_scales = [scales[0]] + [s * spike_factor for s in scales[1:]]
+
+    modelfile.save(filename, dict(
+        weights=qs, scales=np.array(scales), spike_scales=np.array(spike_scales),
+        biases=list(biases), Wc=qc, scale_c=np.array(scale_c),
+        spike_scale_c=np.array(scale_c * spike_factor), bc=bc),
+        config=dict(bits=bits, amp=amp, dt=dt))
+
+
+def classifier_transform(data, input):
+    """Nengo transform for the classifier of a loaded quantized file
+
+    `input` is what the classifier reads: 'code' for a decoded code layer,
+    or 'spikes' for the spikes of the top layer.
+    """
+    scales = dict(code='scale_c', spikes='spike_scale_c')
+    assert input in scales, "input must be 'code' or 'spikes', not %r" % input
+    return data['Wc'].T * data[scales[input]]
+
+
+def load_quantized(filename, dtype=np.float64):
+    """Load a quantized file, returning dequantized `weights, biases, Wc, bc`"""
+    data = modelfile.load_network(filename)
+    weights = [dequantize(q, s, dtype=dtype)
+               for q, s in zip(data['weights'], data['scales'])]
+    Wc = dequantize(data['Wc'], data['scale_c'], dtype=dtype)
+    return weights, list(data['biases']), Wc, data['bc']
+
+
+class QuantizedNetwork(Network):
+    """Non-spiking forward pass using the quantized weights"""
+
+    @classmethod
+    def from_file(cls, filename, **kwargs):
+        dtype = kwargs.get('dtype', np.float64)
+        weights, biases, Wc, bc = load_quantized(filename, dtype=dtype)
+        return cls(weights, biases, Wc=Wc, bc=bc, **kwargs)
@@ -0,0 +1,235 @@
+"""
+Firing-rate curves for LIF neurons, in plain NumPy.
+
+These are the reference implementations of the (soft) LIF rate function used
+as a nonlinearity throughout training. They do not import Theano, so they can
+be used by deployment and inference code. The C code of the Theano op in
+`softlif.py` follows these functions (and calls them when there is no C
+compiler), so both paths agree to double precision.
+"""
+
+import numpy as np
+
+# default neuron parameters (so that f(0) = firing threshold)
+SIGMA = 0.05
+TAU_RC = 0.02
+TAU_REF = 0.002
+
+
+def softplus(x, out=None):
+    """Numerically stable `log(1 + exp(x))`, computed with one temporary"""
+    t = np.abs(x)
+    np.negative(t, out=t)
+    np.exp(t, out=t)
+    np.log1p(t, out=t)
+    out = np.maximum(x, 0, out=out)
+    out += t
+    return out
+
+
+def softlif_current(x, sigma=SIGMA, out=None):
+    """Smoothed input current `j = sigma * softplus(x / sigma)`
+
+    With `sigma == 0` this is the rectified current `max(x, 0)`.
+    """
+    if sigma > 0:
+        out = np.divide(x, sigma, out=out)
+        softplus(out, out=out)
+        out *= sigma
+    else:
+        out = np.maximum(x, 0, out=out)
+    return out
+
+
+def softlif_rate(x, sigma=SIGMA, tau_rc=TAU_RC, tau_ref=TAU_REF, amp=1.,
+                 out=None):
+    """Soft LIF firing rate, scaled by `amp`
+
+    Computes `amp / (tau_ref + tau_rc * log(1 + 1 / j))` for the smoothed
+    current `j` (see `softlif_current`), and zero where `j == 0`. The
+    computation is done in place on `out` if given, and does not overflow
+    for large inputs. With `sigma == 0` this is the standard LIF rate curve
+    (i.e. `nengo.LIF().rates(x, 1, 1) * amp`).
+    """
+    out = softlif_current(x, sigma=sigma, out=out)
+    with np.errstate(divide='ignore'):
+        np.reciprocal(out, out=out)
+    np.log1p(out, out=out)
+    out *= tau_rc
+    out += tau_ref
+    np.divide(amp, out, out=out)
+    return out
+
+
+def softlif_rate_grad(x, r=None, sigma=SIGMA, tau_rc=TAU_RC, tau_ref=TAU_REF,
+                      amp=1.):
+    """Derivative of `softlif_rate` with respect to `x`
+
+    Uses `dj/dx = sigmoid(x / sigma) = 1 - exp(-j / sigma)`, which is stable
+    for all `x` and lets the whole gradient be written in terms of `j`. If
+    the rates `r` have already been computed they can be passed in to save
+    recomputing them.
+    """
+    if r is None:
+        r = softlif_rate(x, sigma=sigma, tau_rc=tau_rc, tau_ref=tau_ref,
+                         amp=amp)
+
+    j = softlif_current(x, sigma=sigma)
+    if sigma > 0:
+        grad = np.divide(j, -sigma)
+        np.expm1(grad, out=grad)
+        np.negative(grad, out=grad)
+    else:
+        grad = (j > 0).astype(j.dtype)
+
+    # grad = (dj/dx / j) * (tau_rc / amp) * r**2 / (j + 1), zero where j == 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        grad /= j
+        j += 1
+        grad /= j
+    grad *= tau_rc / amp
+    grad *= r
+    grad *= r
+    grad[r == 0] = 0
+    return grad
+
+
+def sigmoid(x, out=None):
+    """Logistic sigmoid, computed in place on `out` if given"""
+    out = np.negative(x, out=out)
+    with np.errstate(over='ignore'):
+        np.exp(out, out=out)
+    out += 1
+    np.reciprocal(out, out=out)
+    return out
+
+
+class SoftLIFTable(object):
+    """
+    Piecewise-cubic approximation of `softlif_rate`.
+
+    The rate curve is tabulated on a uniform grid over `[x_lo, x_hi]` and
+    evaluated with cubic Hermite interpolation using the exact values and
+    derivatives at the knots, so the derivative of the approximation matches
+    the exact derivative at every knot. The grid is refined until the
+    interpolation error is below `tol`.
+
+    Outside the table, the curve is computed from its asymptotes, which need
+    no exponentials or logarithms: below `x_lo` the smoothed current is
+    `j = sigma * exp(x / sigma)` to machine precision, so
+    `log(1 + 1/j) = -log(sigma) - x / sigma`; above `x_hi` the current is
+    `j = x` and `log(1 + 1/x)` is replaced by its third-order series, with
+    `x_hi` chosen so that the series error is also below `tol`.
+    """
+
+    def __init__(self, tol=1e-3, sigma=SIGMA, tau_rc=TAU_RC, tau_ref=TAU_REF,
+                 amp=1., points_per_check=8, max_points=2**16):
+        if sigma <= 0:
+            raise ValueError("Tables need a smooth curve (sigma > 0)")
+
+        self.tol = tol
+        self.sigma = sigma
+        self.tau_rc = tau_rc
+        self.tau_ref = tau_ref
+        self.amp = amp
+
+        # the series error is at most tau_rc * amp * u**4 / (4 * tau_ref**2)
+        u_hi = (4 * tol * tau_ref**2 / (tau_rc * amp))**0.25
+        self.x_lo = -37. * sigma
+        self.x_hi = max(1. / u_hi, 37. * sigma)
+
+        n = 16
+        while True:
+            self._make_table(n)
+            err = self._check_error(points_per_check)
+            if err <= tol:
+                break
+            n *= 2
+            if n > max_points:
+                raise ValueError("Could not reach tolerance %g with %d points"
+                                 % (tol, max_points))
+
+        self.max_error = err
+
+    @property
+    def kwargs(self):
+        return dict(sigma=self.sigma, tau_rc=self.tau_rc,
+                    tau_ref=self.tau_ref, amp=self.amp)
+
+    @property
+    def n_points(self):
+        return self.coefs.shape[1] + 1
+
+    def _make_table(self, n):
+        x = np.linspace(self.x_lo, self.x_hi, n + 1)
+        y = softlif_rate(x, **self.kwargs)
+        d = softlif_rate_grad(x, **self.kwargs)
+
+        # polynomial coefficients in t = (x - x_k) / dx for each interval
+        self.dx = (self.x_hi - self.x_lo) / n
+        hd0, hd1 = self.dx * d[:-1], self.dx * d[1:]
+        dy = y[1:] - y[:-1]
+        self.coefs = np.array([y[:-1], hd0,
+                               3 * dy - 2 * hd0 - hd1,
+                               -2 * dy + hd0 + hd1])
+
+    def _check_error(self, points_per_check):
+        n = self.coefs.shape[1]
+        m = n * points_per_check
+        x = self.x_lo + (np.arange(m) + 0.5) * (self.dx / points_per_check)
+        return np.abs(self(x) - softlif_rate(x, **self.kwargs)).max()
+
+    def _locate(self, x):
+        s = np.clip(x, self.x_lo, self.x_hi)
+        s -= self.x_lo
+        s /= self.dx
+        i = s.astype(np.intp)
+        np.minimum(i, self.coefs.shape[1] - 1, out=i)
+        s -= i
+        return i, s
+
+    def __call__(self, x, out=None):
+        """Approximate rates for `x`"""
+        x = np.asarray(x)
+        i, t = self._locate(x)
+        c0, c1, c2, c3 = [c.take(i).astype(x.dtype) for c in self.coefs]
+
+        out = np.multiply(t, c3, out=out)
+        out += c2
+        out *= t
+        out += c1
+        out *= t
+        out += c0
+
+        lo, hi = x < self.x_lo, x > self.x_hi
+        if lo.any():
+            out[lo] = self.amp / (self.tau_ref + self.tau_rc * (
+                -np.log(self.sigma) - x[lo] / self.sigma))
+        if hi.any():
+            u = 1. / x[hi]
+            out[hi] = self.amp / (self.tau_ref + self.tau_rc * (
+                u - u**2 / 2 + u**3 / 3))
+        return out
+
+    def grad(self, x):
+        """Derivative of the approximation with respect to `x`"""
+        x = np.asarray(x)
+        i, t = self._locate(x)
+        _, c1, c2, c3 = [c.take(i).astype(x.dtype) for c in self.coefs]
+
+        grad = 3 * t * c3
+        grad += 2 * c2
+        grad *= t
+        grad += c1
+        grad /= self.dx
+
+        lo, hi = x < self.x_lo, x > self.x_hi
+        if lo.any():
+            den = self.tau_ref + self.tau_rc * (
+                -np.log(self.sigma) - x[lo] / self.sigma)
+            grad[lo] = self.amp * self.tau_rc / self.sigma / den**2
+        if hi.any():
+            u = 1. / x[hi]
+            den = self.tau_ref + self.tau_rc * (u - u**2 / 2 + u**3 / 3)
+            grad[hi] = self.amp * self.tau_rc * (1 - u + u**2) * u**2 / den**2
+        return grad
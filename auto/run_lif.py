@@ -9,6 +9,13 @@ plt.ion()
 
 import nengo
 
+from inference import Network
+from modelfile import load_network
+from presentation import (
+    Presentation, block_errors, filtered, folded_gain_bias, step_correct,
+    steps_per_presentation)
+from transforms import connect
+
 # --- parameters
 presentation_time = 0.1
 Ncode = 10
@@ -16,34 +23,16 @@ Nclass = 30
 # pstc = 0.006
 pstc = 0.004
 
-# --- functions
-def forward(x, weights, biases):
-    lif = nengo.LIF()
-    for w, b in zip(weights, biases):
-        x = np.dot(x, w)
-        x += b
-        if w is not weights[-1]:
-            x = lif.rates(x, 1, 1) / 63.04
-    return x
-
-def get_image(t):
-    return test_images[int(t / presentation_time)]
-
-def test_dots(t, dots):
-    i = int(t / presentation_time)
-    j = np.argmax(dots)
-    return test_labels[i] == labels[j]
-
 # --- load the RBM data
 # data = np.load('nlif-deep-orig.npz')
-data = np.load('nlif-deep.npz')
+data = load_network('nlif-deep.npz')
 weights = data['weights']
 biases = data['biases']
 Wc = data['Wc']
 bc = data['bc']
 
 # --- load the testing data
-from autoencoder import mnist
+from datasets import mnist
 _, _, [test_images, test_labels] = mnist()
 
 for images in [test_images]:
@@ -60,10 +49,8 @@ labels = np.unique(test_labels)
 n_labels = labels.size
 
 # --- test as ANN
-codes = forward(test_images, weights, biases)
-inds = np.argmax(np.dot(codes, Wc) + bc, axis=1)
-labels = np.unique(test_labels)
-errors = (test_labels != labels[inds])
+ann = Network(weights, biases, Wc=Wc, bc=bc, neuron='lif')
+errors = (test_labels != ann.classify(test_images, labels=labels))
 print "ANN error:", errors.mean()
 
 # --- create the model
@@ -75,24 +62,24 @@ assert np.allclose(neuron_type.gain_bias(max_rate, intercept), (1, 1), atol=1e-2
 
 model = nengo.Network(seed=97)
 with model:
-    input_images = nengo.Node(output=get_image, label='images')
+    input_images = nengo.Node(
+        output=Presentation(test_images, presentation_time), label='images')
 
     # --- make nonlinear layers
     layers = []
     for i, [W, b] in enumerate(zip(weights[:-1], biases[:-1])):
         n = b.size
+        gain, bias = folded_gain_bias(neuron_type, max_rate*np.ones(n),
+                                      intercept*np.ones(n), b)
         layer = nengo.Ensemble(n, 1, label='layer %d' % i, neuron_type=neuron_type,
-                               max_rates=max_rate*np.ones(n),
-                               intercepts=intercept*np.ones(n))
-        bias = nengo.Node(output=b)
-        nengo.Connection(bias, layer.neurons, transform=np.eye(n), synapse=0)
+                               gain=gain, bias=bias)
 
         if i == 0:
-            nengo.Connection(input_images, layer.neurons,
-                             transform=W.T, synapse=pstc)
+            connect(input_images, layer.neurons,
+                    transform=W.T, synapse=pstc)
         else:
-            nengo.Connection(layers[-1].neurons, layer.neurons,
-                             transform=W.T * amp * 1000, synapse=pstc)
+            connect(layers[-1].neurons, layer.neurons,
+                    transform=W.T * amp * 1000, synapse=pstc)
 
         layers.append(layer)
 
@@ -101,8 +88,8 @@ with model:
     code_layer = nengo.networks.EnsembleArray(Ncode, b.size, label='code', radius=5)
     code_bias = nengo.Node(output=b)
     nengo.Connection(code_bias, code_layer.input, synapse=0)
-    nengo.Connection(layers[-1].neurons, code_layer.input,
-                     transform=W.T * amp * 1000, synapse=pstc)
+    connect(layers[-1].neurons, code_layer.input,
+            transform=W.T * amp * 1000, synapse=pstc)
 
     # --- make cleanup
     class_layer = nengo.networks.EnsembleArray(Nclass, 10, label='class', radius=5)
@@ -111,15 +98,11 @@ with model:
     nengo.Connection(code_layer.output, class_layer.input,
                      transform=Wc.T, synapse=pstc)
 
-    test = nengo.Node(output=test_dots, size_in=n_labels)
-    nengo.Connection(class_layer.output, test)
-
     # --- make probes
     probe_layers = [nengo.Probe(layer, 'spikes') for layer in layers]
     # probe_code = nengo.Probe(code_layer.output, synapse=0.03)
     probe_code = nengo.Probe(code_layer.neuron_output)
     probe_class = nengo.Probe(class_layer.output, synapse=0.03)
-    probe_test = nengo.Probe(test, synapse=0.01)
 
 
 # --- simulation
@@ -133,12 +116,15 @@ if 1:
     t = sim.trange()
     x = sim.data[probe_code]
     y = sim.data[probe_class]
-    z = sim.data[probe_test]
 
-    # np.savez(rundata_file, t=t, y=y, z=z)
+    # np.savez(rundata_file, t=t, y=y)
 else:
     rundata = np.load(rundata_file)
-    t, y, z = [rundata[k] for k in ['t', 'y', 'z']]
+    t, y = [rundata[k] for k in ['t', 'y']]
+
+# --- decisions, offline from the class probe
+steps = steps_per_presentation(presentation_time)
+z = filtered(step_correct(y, test_labels, labels, steps))
 
 # --- plots
 from nengo.utils.matplotlib import rasterplot
@@ -150,13 +136,10 @@ def plot_bars():
 
 inds = slice(0, int(t[-1]/presentation_time) + 1)
 images = test_images[inds]
-labels = test_labels[inds]
 allimage = np.zeros((28, 28 * len(images)), dtype=images.dtype)
 for i, image in enumerate(images):
     allimage[:, i * 28:(i + 1) * 28] = image.reshape(28, 28)
 
-z2 = np.argmax(y, axis=1) == labels.repeat(100)
-
 plt.figure(1)
 plt.clf()
 r, c = 5, 1
@@ -204,10 +187,8 @@ plt.tight_layout()
 plt.savefig('run_lif.png')
 
 # --- compute error rate
-zblocks = z.reshape(-1, 100)[:, 50:]  # 50 ms blocks at end of each 100
-errors = np.mean(zblocks, axis=1) < 0.5
+errors = block_errors(z, steps, 50)  # 50 ms blocks at end of each 100
 print errors.mean()
 
-zblocks = z2.reshape(-1, 100)[:, 80:]  # 20 ms blocks at end of each 100
-errors = np.mean(zblocks, axis=1) < 0.5
+errors = block_errors(z, steps, 80)  # 20 ms blocks at end of each 100
 print errors.mean()
@@ -9,6 +9,14 @@ plt.ion()
 
 import nengo
 
+from classifiers import Vocabulary
+from modelfile import load_network
+from presentation import (
+    Presentation, block_errors, filtered, folded_gain_bias, presented,
+    step_correct, steps_per_presentation)
+from rates import softlif_rate
+from transforms import connect
+
 # --- parameters
 presentation_time = 0.1
 Ncode = 10
@@ -19,33 +27,24 @@ pstc = 0.005
 
 # --- functions
 def forward(x, weights, biases):
-    lif = nengo.LIF()
     layers = []
     for w, b in zip(weights, biases):
         x = np.dot(x, w) + b
-        x = lif.rates(x, 1, 1) / 63.04
+        softlif_rate(x, sigma=0, amp=1. / 63.04, out=x)
         layers.append(x)
     return x, layers
 
-def get_image(t):
-    return test_images[int(t / presentation_time)]
-
-def test_dots(t, dots):
-    i = int(t / presentation_time)
-    j = np.argmax(dots)
-    return test_labels[i] == labels[j]
-
 # --- load the RBM data
 # data = np.load('nlif-deep-orig.npz')
 # data = np.load('lif-500-200-10.npz')
-data = np.load('lif-126-error.npz')
+data = load_network('lif-126-error.npz')
 weights = data['weights']
 biases = data['biases']
 Wc = data['Wc']
 bc = data['bc']
 
 # --- load the testing data
-from autoencoder import mnist
+from datasets import mnist
 _, _, [test_images, test_labels] = mnist()
 
 for images in [test_images]:
@@ -72,16 +71,21 @@ print "ANN classes: mean=%0.3f, std=%0.3f, min=%0.3f, max=%0.3f" % (
 for i, layer in enumerate(layers):
     print "Layer %d: sparsity=%0.3f, %0.3f" % (i, (layer > 0).mean(), (layer > 1).mean())
 
+# class means of the codes, cached alongside the model
+vocab_file = 'lif-126-error-vocab.npz'
+if os.path.exists(vocab_file):
+    vocab = Vocabulary.load(vocab_file)
+else:
+    vocab = Vocabulary()
+    vocab.update(codes, test_labels)
+    vocab.save(vocab_file)
+
 # try centroid classifier
-code_means = np.array([codes[test_labels == label].mean(0) for label in labels])
-dists = ((codes[:, :, None] - code_means.T)**2).sum(axis=1)
-errors = (test_labels != labels[np.argmin(dists, axis=1)])
+errors = (test_labels != vocab.classify_centroid(codes))
 print "ANN centroid error:", errors.mean()
 
 # try dot product classifier
-code_mean = codes.mean(0)
-dists = np.dot(codes - code_mean, (code_means - code_mean).T)
-errors = (test_labels != labels[np.argmax(dists, axis=1)])
+errors = (test_labels != vocab.classify_dot(codes, normalize=False, center=True))
 print "ANN dot error:", errors.mean()
 
 if 1:
@@ -102,24 +106,25 @@ assert np.allclose(neuron_type.gain_bias(max_rate, intercept), (1, 1), atol=1e-2
 dt = 1e-3
 model = nengo.Network(seed=97)
 with model:
-    input_images = nengo.Node(output=get_image, label='images')
+    input_images = nengo.Node(
+        output=Presentation(test_images, presentation_time, dt=dt),
+        label='images')
 
     # --- make nonlinear layers
     layers = []
     for i, [W, b] in enumerate(zip(weights, biases)):
         n = b.size
+        gain, bias = folded_gain_bias(neuron_type, max_rate*np.ones(n),
+                                      intercept*np.ones(n), b)
         layer = nengo.Ensemble(n, 1, label='layer %d' % i, neuron_type=neuron_type,
-                               max_rates=max_rate*np.ones(n),
-                               intercepts=intercept*np.ones(n))
-        bias = nengo.Node(output=b)
-        nengo.Connection(bias, layer.neurons, transform=np.eye(n), synapse=0)
+                               gain=gain, bias=bias)
 
         if i == 0:
-            nengo.Connection(input_images, layer.neurons,
-                             transform=W.T, synapse=pstc)
+            connect(input_images, layer.neurons,
+                    transform=W.T, synapse=pstc)
         else:
-            nengo.Connection(layers[-1].neurons, layer.neurons,
-                             transform=W.T * amp / dt, synapse=pstc)
+            connect(layers[-1].neurons, layer.neurons,
+                    transform=W.T * amp / dt, synapse=pstc)
 
         layers.append(layer)
 
@@ -130,36 +135,10 @@ with model:
     nengo.Connection(layers[-1].neurons, class_layer.input,
                      transform=Wc.T * amp / dt, synapse=pstc)
 
-    test = nengo.Node(output=test_dots, size_in=n_labels)
-    nengo.Connection(class_layer.output, test)
-
-    # --- make centroid classifier node
-    def centroid_test_fn(t, x):
-        i = int(t / presentation_time)
-        d = ((x - code_means)**2).sum(1)
-        return test_labels[i] == labels[np.argmin(d)]
-
-    centroid_test = nengo.Node(centroid_test_fn, size_in=layers[-1].n_neurons)
-    nengo.Connection(layers[-1].neurons, centroid_test,
-                     transform=amp / dt, synapse=pstc)
-
-    # --- make dot classifier node
-    def dot_test_fn(t, x):
-        i = int(t / presentation_time)
-        # d = np.dot(code_means, x)
-        d = np.dot(code_means - code_mean, x - code_mean)
-        return test_labels[i] == labels[np.argmax(d)]
-
-    dot_test = nengo.Node(dot_test_fn, size_in=layers[-1].n_neurons)
-    nengo.Connection(layers[-1].neurons, dot_test,
-                     transform=amp / dt, synapse=pstc)
-
     # --- make probes
     probe_layers = [nengo.Probe(layer, 'spikes') for layer in layers]
     probe_class = nengo.Probe(class_layer.output, synapse=0.03)
-    probe_test = nengo.Probe(test, synapse=0.01)
-    probe_centroid = nengo.Probe(centroid_test, synapse=0.01)
-    probe_dot = nengo.Probe(dot_test, synapse=0.01)
+    probe_code = nengo.Probe(layers[-1].neurons, synapse=pstc)
 
 
 # --- simulation
@@ -170,6 +149,17 @@ sim.run(100., progress=True)
 
 t = sim.trange()
 
+# --- decisions, offline from the probes
+steps = steps_per_presentation(presentation_time, dt)
+codes = sim.data[probe_code] * (amp / dt)
+step_labels = presented(test_labels, len(codes), steps)
+z = filtered(step_correct(sim.data[probe_class], test_labels, labels,
+                          steps), dt=dt)
+z_centroid = filtered(vocab.classify_centroid(codes) == step_labels, dt=dt)
+# z_dot = vocab.classify_dot(codes, normalize=False) == step_labels
+z_dot = filtered(vocab.classify_dot(codes, normalize=False, center=True)
+                 == step_labels, dt=dt)
+
 # --- plots
 from nengo.utils.matplotlib import rasterplot
 
@@ -180,7 +170,6 @@ def plot_bars():
 
 inds = slice(0, int(t[-1]/presentation_time) + 1)
 images = test_images[inds]
-labels = test_labels[inds]
 allimage = np.zeros((28, 28 * len(images)), dtype=images.dtype)
 for i, image in enumerate(images):
     allimage[:, i * 28:(i + 1) * 28] = image.reshape(28, 28)
@@ -213,13 +202,13 @@ plot_bars()
 plt.ylabel('class')
 
 plt.subplot(r, c, 5)
-plt.plot(t, sim.data[probe_test])
+plt.plot(t, z)
 plt.ylim([-0.1, 1.1])
 plot_bars()
 plt.ylabel('correct')
 
 plt.subplot(r, c, 6)
-plt.plot(t, sim.data[probe_dot])
+plt.plot(t, z_dot)
 plt.ylim([-0.1, 1.1])
 plot_bars()
 plt.xlabel('time [s]')
@@ -230,19 +219,14 @@ plt.tight_layout()
 plt.savefig('run_lif_nocode.png')
 
 # --- compute error rate
-zblocks = sim.data[probe_test].reshape(-1, 100)[:, 50:]  # 50 ms blocks at end of each 100
-errors = np.mean(zblocks, axis=1) < 0.5
+errors = block_errors(z, steps, 50)  # 50 ms blocks at end of each 100
 print "Neuron error:", errors.mean()
 
-zblocks = sim.data[probe_centroid].reshape(-1, 100)[:, 50:]
-errors = np.mean(zblocks, axis=1) < 0.5
+errors = block_errors(z_centroid, steps, 50)
 print "Neuron centroid error:", errors.mean()
 
-zblocks = sim.data[probe_dot].reshape(-1, 100)[:, 50:]
-errors = np.mean(zblocks, axis=1) < 0.5
+errors = block_errors(z_dot, steps, 50)
 print "Neuron dot error:", errors.mean()
 
-# z2 = np.argmax(y, axis=1) == labels.repeat(100)
-# zblocks = z2.reshape(-1, 100)[:, 80:]  # 20 ms blocks at end of each 100
-# errors = np.mean(zblocks, axis=1) < 0.5
+# errors = block_errors(z, steps, 80)  # 20 ms blocks at end of each 100
 # print errors.mean()
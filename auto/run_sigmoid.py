@@ -9,6 +9,13 @@ plt.ion()
 
 import nengo
 
+from inference import Network
+from modelfile import load_network
+from presentation import (
+    Presentation, block_errors, filtered, step_correct,
+    steps_per_presentation)
+from transforms import connect
+
 # --- parameters
 presentation_time = 0.1
 Ncode = 10
@@ -20,31 +27,15 @@ pstc = 0.004
 def sigmoid(x):
     return 1. / (1 + np.exp(-x))
 
-def forward(x, weights, biases):
-    for w, b in zip(weights, biases):
-        x = np.dot(x, w)
-        x += b
-        if w is not weights[-1]:
-            x = sigmoid(x)
-    return x
-
-def get_image(t):
-    return test_images[int(t / presentation_time)]
-
-def test_dots(t, dots):
-    i = int(t / presentation_time)
-    j = np.argmax(dots)
-    return test_labels[i] == labels[j]
-
 # --- load the RBM data
-data = np.load('sigmoid-deep.npz')
+data = load_network('sigmoid-deep.npz')
 weights = data['weights']
 biases = data['biases']
 Wc = data['Wc']
 bc = data['bc']
 
 # --- load the testing data
-from autoencoder import mnist
+from datasets import mnist
 _, _, [test_images, test_labels] = mnist()
 
 for images in [test_images]:
@@ -61,10 +52,8 @@ labels = np.unique(test_labels)
 n_labels = labels.size
 
 # --- test as ANN
-codes = forward(test_images, weights, biases)
-inds = np.argmax(np.dot(codes, Wc) + bc, axis=1)
-labels = np.unique(test_labels)
-errors = (test_labels != labels[inds])
+ann = Network(weights, biases, Wc=Wc, bc=bc, neuron='sigmoid')
+errors = (test_labels != ann.classify(test_images, labels=labels))
 print "ANN error:", errors.mean()
 
 # --- find good neuron params for sigmoid
@@ -80,7 +69,8 @@ N = neuron_params.pop('N')
 # --- create the model
 model = nengo.Network()
 with model:
-    input_images = nengo.Node(output=get_image, label='images')
+    input_images = nengo.Node(
+        output=Presentation(test_images, presentation_time), label='images')
 
     # --- make sigmoidal layers
     layers = []
@@ -90,7 +80,7 @@ with model:
         bias = nengo.Node(output=b)
         nengo.Connection(bias, layer.input, synapse=0)
 
-        nengo.Connection(output, layer.input, transform=w.T, synapse=pstc)
+        connect(output, layer.input, transform=w.T, synapse=pstc)
         output = layer.add_output('sigmoid', function=sigmoid)
 
         layers.append(layer)
@@ -100,7 +90,7 @@ with model:
     code_layer = nengo.networks.EnsembleArray(Ncode, b.size, label='code', radius=10)
     code_bias = nengo.Node(output=b)
     nengo.Connection(code_bias, code_layer.input, synapse=0)
-    nengo.Connection(output, code_layer.input, transform=W.T, synapse=pstc)
+    connect(output, code_layer.input, transform=W.T, synapse=pstc)
 
     # --- make cleanup
     class_layer = nengo.networks.EnsembleArray(Nclass, 10, label='class', radius=5)
@@ -109,12 +99,8 @@ with model:
     nengo.Connection(code_layer.output, class_layer.input,
                      transform=Wc.T, synapse=pstc)
 
-    test = nengo.Node(output=test_dots, size_in=n_labels)
-    nengo.Connection(class_layer.output, test)
-
     probe_code = nengo.Probe(code_layer.output, synapse=0.03)
     probe_class = nengo.Probe(class_layer.output, synapse=0.03)
-    probe_test = nengo.Probe(test, synapse=0.01)
 
 
 # --- simulation
@@ -128,12 +114,15 @@ if 1:
     t = sim.trange()
     x = sim.data[probe_code]
     y = sim.data[probe_class]
-    z = sim.data[probe_test]
 
-    # np.savez(rundata_file, t=t, y=y, z=z)
+    # np.savez(rundata_file, t=t, x=x, y=y)
 else:
     rundata = np.load(rundata_file)
-    t, y, z = [rundata[k] for k in ['t', 'y', 'z']]
+    t, x, y = [rundata[k] for k in ['t', 'x', 'y']]
+
+# --- decisions, offline from the class probe
+steps = steps_per_presentation(presentation_time)
+z = filtered(step_correct(y, test_labels, labels, steps))
 
 # --- plots
 def plot_bars():
@@ -143,13 +132,10 @@ def plot_bars():
 
 inds = slice(0, int(t[-1]/presentation_time) + 1)
 images = test_images[inds]
-labels = test_labels[inds]
 allimage = np.zeros((28, 28 * len(images)), dtype=images.dtype)
 for i, image in enumerate(images):
     allimage[:, i * 28:(i + 1) * 28] = image.reshape(28, 28)
 
-z2 = np.argmax(y, axis=1) == labels.repeat(100)
-
 plt.figure(1)
 plt.clf()
 r, c = 4, 1
@@ -179,10 +165,8 @@ plt.ylabel('correct')
 # plt.savefig('runtime.png')
 
 # --- compute error rate
-zblocks = z.reshape(-1, 100)[:, 50:]  # 50 ms blocks at end of each 100
-errors = np.mean(zblocks, axis=1) < 0.5
+errors = block_errors(z, steps, 50)  # 50 ms blocks at end of each 100
 print errors.mean()
 
-zblocks = z2.reshape(-1, 100)[:, 80:]  # 20 ms blocks at end of each 100
-errors = np.mean(zblocks, axis=1) < 0.5
+errors = block_errors(z, steps, 80)  # 20 ms blocks at end of each 100
 print errors.mean()
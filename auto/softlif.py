@@ -0,0 +1,240 @@
+"""
+Theano ops for the soft LIF rate function.
+
+`SoftLIFRate` is a fused elementwise op that evaluates the rate curve (and its
+hand-written gradient) in one pass, with C code following the NumPy kernels
+in `rates.py` (which are also its Python implementation). `softlif_graph`
+builds the same function out of standard Theano elementwise ops, for
+comparison.
+`SoftLIFApprox` is an opt-in approximation that replaces the transcendental
+functions with a precomputed interpolation table.
+"""
+
+import numpy as np
+
+import theano
+from theano import gof
+from theano import scalar
+from theano import tensor
+from theano.gradient import DisconnectedType, grad_not_implemented
+
+import rates
+from rates import SIGMA, TAU_RC, TAU_REF
+
+
+class ScalarSoftLIFRate(scalar.ScalarOp):
+    """Soft LIF firing rate of a scalar and, if `derivative`, its derivative
+
+    Both come out of one pass, since they share the smoothed current and
+    its transcendental functions; the derivative output is the saved state
+    for the backward pass (see `SoftLIFRate`).
+    """
+    nin = 1
+
+    def __init__(self, sigma=SIGMA, tau_rc=TAU_RC, tau_ref=TAU_REF, amp=1.,
+                 derivative=True, output_types_preference=scalar.upgrade_to_float,
+                 name=None):
+        super(ScalarSoftLIFRate, self).__init__(output_types_preference, name)
+        self.sigma = float(sigma)
+        self.tau_rc = float(tau_rc)
+        self.tau_ref = float(tau_ref)
+        self.amp = float(amp)
+        self.derivative = derivative
+        self.nout = 2 if derivative else 1
+
+    @property
+    def kwargs(self):
+        return dict(sigma=self.sigma, tau_rc=self.tau_rc,
+                    tau_ref=self.tau_ref, amp=self.amp)
+
+    def __eq__(self, other):
+        return (super(ScalarSoftLIFRate, self).__eq__(other) and
+                self.kwargs == other.kwargs and
+                self.derivative == other.derivative)
+
+    def __hash__(self):
+        return hash((super(ScalarSoftLIFRate, self).__hash__(), self.sigma,
+                     self.tau_rc, self.tau_ref, self.amp, self.derivative))
+
+    def __str__(self):
+        return '%s{sigma=%g, amp=%g%s}' % (
+            self.__class__.__name__, self.sigma, self.amp,
+            ', derivative' if self.derivative else '')
+
+    def make_new_inplace(self, output_types_preference=None, name=None):
+        # used by the inplace optimization, which would drop the parameters
+        return self.__class__(derivative=self.derivative,
+                              output_types_preference=output_types_preference,
+                              name=name, **self.kwargs)
+
+    def output_types(self, types):
+        types = self.output_types_preference(*types)
+        return types * self.nout if len(types) == 1 else types
+
+    def impl(self, x):
+        x = np.asarray([x], dtype=np.float64)
+        r = rates.softlif_rate(x, **self.kwargs)
+        if not self.derivative:
+            return r[0]
+        return r[0], rates.softlif_rate_grad(x, r, **self.kwargs)[0]
+
+    def L_op(self, inputs, outputs, output_grads):
+        if not self.derivative:
+            x, = inputs
+            return [output_grads[0] *
+                    ScalarSoftLIFRate(derivative=True, **self.kwargs)(x)[1]]
+
+        x, = inputs
+        r, dr = outputs
+        g_r, g_dr = output_grads
+        if not isinstance(g_dr.type, DisconnectedType):
+            return [grad_not_implemented(
+                self, 0, x, "second derivative of the soft LIF rate")]
+        return [g_r * dr]
+
+    def c_code(self, node, name, inputs, outputs, sub):
+        if self.derivative and name == 'test_presence_of_c_code':
+            # Theano's elemwise fusion probes for C code like this, but it
+            # only handles single-output scalar ops (it would read the rates
+            # where the derivative is used), so opt out of being fused
+            raise NotImplementedError("not fusable (two outputs)")
+
+        x, = inputs
+        code = self.c_current(x) + (
+            "\n%(z)s = %(amp)r / (%(tau_ref)r + %(tau_rc)r * L);"
+            % dict(z=outputs[0], **self.kwargs))
+        if self.derivative:
+            code += (
+                "\n%(dz)s = %(z)s != 0 ? "
+                "dj / (j * (j + 1)) * %(scale)r * %(z)s * %(z)s : 0;"
+                % dict(z=outputs[0], dz=outputs[1],
+                       scale=self.tau_rc / self.amp))
+        return "{\n%s\n}" % code
+
+    def c_current(self, x):
+        """C statements setting the doubles `j` (the smoothed current), `dj`
+        (its derivative) and `L = log1p(1 / j)`
+
+        Far from zero, `softplus` needs no transcendental functions to
+        double precision (`j = x` above, `log1p(1 / j) = -log(j)` below),
+        which saves most of the work for saturated units.
+        """
+        d = dict(x=x, sigma=self.sigma, neg_log_sigma=-np.log(self.sigma)
+                 if self.sigma > 0 else 0.)
+        if self.sigma <= 0:
+            return ("double j = fmax(%(x)s, 0.), dj = %(x)s > 0 ? 1. : 0.;\n"
+                    "double L = log1p(1. / j);" % d)
+
+        code = """double xs = %(x)s / %(sigma)r, j, dj, L;
+if (xs > 36.) {
+    j = %(x)s;
+    dj = 1.;
+    L = log1p(1. / j);
+} else if (xs < -36.) {
+    dj = exp(xs);
+    j = %(sigma)r * dj;
+    L = isinf(1. / j) ? INFINITY : %(neg_log_sigma)r - xs;
+} else {
+    double e = exp(-fabs(xs));
+    j = %(sigma)r * (fmax(xs, 0.) + log1p(e));
+    dj = (xs > 0 ? 1. : e) / (1. + e);
+    L = log1p(1. / j);
+}"""
+        return code % d
+
+    def c_code_cache_version(self):
+        return (4,)
+
+
+class SoftLIFRate(tensor.Elemwise):
+    """
+    Soft LIF firing rate as a single elementwise op.
+
+    Output is `amp / (tau_ref + tau_rc * log(1 + 1 / j))`, where
+    `j = sigma * log(1 + exp(x / sigma))`. The scalar op has C code, so it
+    is compiled like Theano's own. It computes the derivative in the same
+    pass, so the backward pass needs no transcendental functions; graphs
+    that do not use the derivative get a rates-only op instead (see
+    `local_softlif_rates_only`).
+    """
+    def __init__(self, sigma=SIGMA, tau_rc=TAU_RC, tau_ref=TAU_REF, amp=1.):
+        super(SoftLIFRate, self).__init__(ScalarSoftLIFRate(
+            sigma=sigma, tau_rc=tau_rc, tau_ref=tau_ref, amp=amp))
+
+    @property
+    def kwargs(self):
+        return self.scalar_op.kwargs
+
+    def __call__(self, x):
+        return super(SoftLIFRate, self).__call__(x)[0]
+
+
+@tensor.opt.register_specialize
+@gof.local_optimizer([SoftLIFRate, tensor.Elemwise])
+def local_softlif_rates_only(node):
+    """Drop the derivative output of `SoftLIFRate` where it is not used"""
+    op = node.op
+    if (isinstance(op, tensor.Elemwise) and
+            isinstance(op.scalar_op, ScalarSoftLIFRate) and
+            op.scalar_op.derivative and len(node.outputs[1].clients) == 0):
+        rates_op = tensor.Elemwise(
+            ScalarSoftLIFRate(derivative=False, **op.scalar_op.kwargs))
+        return {node.outputs[0]: rates_op(*node.inputs)}
+
+
+def softlif_graph(x, sigma=SIGMA, tau_rc=TAU_RC, tau_ref=TAU_REF, amp=1.):
+    """The soft LIF rate composed from standard Theano elementwise ops"""
+    dtype = x.dtype
+    sigma = tensor.cast(sigma, dtype=dtype)
+    tau_ref = tensor.cast(tau_ref, dtype=dtype)
+    tau_rc = tensor.cast(tau_rc, dtype=dtype)
+    amp = tensor.cast(amp, dtype=dtype)
+
+    j = sigma * tensor.nnet.softplus(x / sigma)
+    v = amp / (tau_ref + tau_rc * tensor.log1p(1. / j))
+    return tensor.switch(j > 0, v, 0.0)
+
+
+class SoftLIFApprox(object):
+    """
+    Soft LIF nonlinearity evaluated from an interpolation table.
+
+    Can be used anywhere `SoftLIFRate` is (e.g. as `Autoencoder.hid_func`).
+    The approximation stays within `tol` of the exact curve; see
+    `rates.SoftLIFTable`. The gradient is the exact derivative of the
+    piecewise-cubic approximation, computed by Theano.
+    """
+    def __init__(self, tol=1e-3, **kwargs):
+        self.table = rates.SoftLIFTable(tol=tol, **kwargs)
+
+    def __str__(self):
+        return '%s{tol=%g, n_points=%d}' % (
+            self.__class__.__name__, self.table.tol, self.table.n_points)
+
+    def __call__(self, x):
+        table = self.table
+        dtype = x.dtype
+        cast = lambda v: tensor.cast(v, dtype=dtype)
+        sigma, tau_rc, tau_ref, amp = [
+            cast(table.kwargs[k]) for k in ('sigma', 'tau_rc', 'tau_ref', 'amp')]
+        x_lo, x_hi = cast(table.x_lo), cast(table.x_hi)
+
+        # interpolate inside the table
+        s = (tensor.clip(x, x_lo, x_hi) - x_lo) / cast(table.dx)
+        i = tensor.minimum(tensor.cast(tensor.floor(s), 'int32'),
+                           table.coefs.shape[1] - 1)
+        t = s - i
+        c0, c1, c2, c3 = [tensor.constant(c.astype(dtype))[i.flatten()]
+                          .reshape(x.shape) for c in table.coefs]
+        y = c0 + t * (c1 + t * (c2 + t * c3))
+
+        # use the asymptotes outside the table (see `rates.SoftLIFTable`)
+        xl = tensor.minimum(x, x_lo)
+        y_lo = amp / (tau_ref + tau_rc * (-tensor.log(sigma) - xl / sigma))
+        u = 1. / tensor.maximum(x, x_hi)
+        y_hi = amp / (tau_ref + tau_rc * (u - u**2 / 2 + u**3 / 3))
+
+        return tensor.switch(x < x_lo, y_lo, tensor.switch(x > x_hi, y_hi, y))
+
+
+softlif = SoftLIFRate()
@@ -11,30 +11,28 @@ import matplotlib.pyplot as plt
 import theano
 import theano.tensor as tt
 
+import modelfile
 import plotting
+import precision
 
 import autoencoder
 reload(autoencoder)
 from autoencoder import (rms, mnist, show_recons,
                          FileObject, Autoencoder, DeepAutoencoder)
+from checkpoint import Checkpointer
+from early_stopping import EarlyStopping
+from pipeline import pipeline_pretrain
+from softlif import SoftLIFRate, SoftLIFApprox
 
 plt.ion()
 
+# precision.set_precision('float32')  # float32 storage, float64 reductions
 
-def nlif(x):
-    dtype = theano.config.floatX
-    sigma = tt.cast(0.05, dtype=dtype)
-    tau_ref = tt.cast(0.002, dtype=dtype)
-    tau_rc = tt.cast(0.02, dtype=dtype)
-    alpha = tt.cast(1, dtype=dtype)
-    beta = tt.cast(1, dtype=dtype)  # so that f(0) = firing threshold
-    amp = tt.cast(1. / 63.04, dtype=dtype)  # so that f(1) = 1
-
-    j = alpha * x + beta - 1
-    j = sigma * tt.log1p(tt.exp(j / sigma))
-    v = amp / (tau_ref + tau_rc * tt.log1p(1. / j))
-    return tt.switch(j > 0, v, 0.0)
-
+# set `approx_tol` to train with a faster table approximation of the rates
+approx_tol = None
+nlif_params = dict(sigma=0.05, amp=1. / 63.04)  # so that f(1) = 1
+nlif = (SoftLIFRate(**nlif_params) if approx_tol is None else
+        SoftLIFApprox(tol=approx_tol, **nlif_params))
 
 # --- load the data
 train, valid, test = mnist()
@@ -60,17 +58,33 @@ assert len(rates) == n_layers
 n_epochs = 15
 batch_size = 100
 
+# set `pipelined` to train all layers at once, in parallel processes
+pipelined = False
+savenames = ["lif-auto-%d.npz" % i for i in range(n_layers)]
+if pipelined and not all(os.path.exists(s) for s in savenames):
+    autos = [Autoencoder(shapes[i], shapes[i+1], rf_shape=rf_shapes[i],
+                         vis_func=funcs[i], hid_func=funcs[i+1])
+             for i in range(n_layers)]
+    pipeline_pretrain(autos, train_images, n_epochs=n_epochs,
+                      batch_size=batch_size,
+                      train_params=[dict(rate=rate) for rate in rates])
+    for auto, savename in zip(autos, savenames):
+        auto.to_file(savename)
+
 deep = DeepAutoencoder()
 data = train_images
+valid_data = valid_images
 for i in range(n_layers):
-    savename = "lif-auto-%d.npz" % i
+    savename = savenames[i]
     if not os.path.exists(savename):
         auto = Autoencoder(
             shapes[i], shapes[i+1], rf_shape=rf_shapes[i],
             vis_func=funcs[i], hid_func=funcs[i+1])
         deep.autos.append(auto)
         auto.auto_sgd(data, deep, test_images,
-                      n_epochs=n_epochs, rate=rates[i])
+                      n_epochs=n_epochs, rate=rates[i],
+                      valid_images=valid_data,
+                      early_stopping=EarlyStopping(patience=3))
         auto.to_file(savename)
     else:
         auto = FileObject.from_file(savename)
@@ -78,6 +92,7 @@ for i in range(n_layers):
         deep.autos.append(auto)
 
     data = auto.encode(data)
+    valid_data = auto.encode(valid_data)
 
 plt.figure(99)
 plt.clf()
@@ -108,7 +123,9 @@ if 1:
     # deep.sgd(train, test, n_epochs=5, noise=0.5, shift=True)
     # deep.backprop(train, test, n_epochs=50, noise=0.5, shift=True)
 
-    deep.sgd(train, test, n_epochs=50, tradeoff=1, noise=0.3, shift=True)
+    deep.sgd(train, test, n_epochs=50, tradeoff=1, noise=0.3, shift=True,
+             checkpoint=Checkpointer('checkpoints/lif-sgd'), valid_set=valid,
+             early_stopping=EarlyStopping(patience=5, decay_patience=2))
     print "mean error", deep.test(test).mean()
 
 # --- try to get autoencoder back
@@ -134,14 +151,15 @@ if 0:
 if 0:
     # save parameters
     d = {}
-    d['weights'] = [auto.W.get_value() for auto in deep.autos]
-    d['biases'] = [auto.c.get_value() for auto in deep.autos]
+    layers = [auto.dense_weights() for auto in deep.autos]  # unroll conv
+    d['weights'] = [W for W, c in layers]
+    d['biases'] = [c for W, c in layers]
     if all(hasattr(auto, 'V') for auto in deep.autos):
         d['rec_weights'] = [auto.V.get_value() for auto in deep.autos]
         d['rec_biases'] = [auto.b.get_value() for auto in deep.autos]
     d['Wc'] = deep.W
     d['bc'] = deep.b
-    np.savez('lif-126-error.npz', **d)
+    modelfile.save('lif-126-error.npz', d)
 
 if 0:
     # compute top layers mean and std
@@ -11,15 +11,23 @@ import matplotlib.pyplot as plt
 import theano
 import theano.tensor as tt
 
+import modelfile
 import plotting
+import precision
 
 import autoencoder
 reload(autoencoder)
 from autoencoder import (rms, mnist, show_recons,
-                         FileObject, Autoencoder, DeepAutoencoder)
+                         FileObject, Autoencoder, ConvAutoencoder,
+                         DeepAutoencoder)
+from checkpoint import Checkpointer
+from early_stopping import EarlyStopping
+from pipeline import pipeline_pretrain
 
 plt.ion()
 
+# precision.set_precision('float32')  # float32 storage, float64 reductions
+
 # --- load the data
 train, valid, test = mnist()
 train_images, _ = train
@@ -48,24 +56,52 @@ assert len(rates) == n_layers
 n_epochs = 5
 batch_size = 100
 
+# set `convolutional` for a first layer of 5 shared 9x9 filters with stride 2,
+# i.e. 10x10x5 = 500 hidden units like the dense layer, but 405 weights
+convolutional = False
+
+
+def make_auto(i):
+    if i == 0 and convolutional:
+        return ConvAutoencoder(shapes[0], 5, rf_shape=rf_shapes[0],
+                               stride=(2, 2), vis_func=funcs[0],
+                               hid_func=funcs[1])
+    return Autoencoder(shapes[i], shapes[i+1], rf_shape=rf_shapes[i],
+                       vis_func=funcs[i], hid_func=funcs[i+1])
+
+# set `pipelined` to train all layers at once, in parallel processes
+pipelined = False
+savenames = [("sigmoid-conv-auto-%d.npz" if convolutional else
+              "sigmoid-auto-%d.npz") % i for i in range(n_layers)]
+if pipelined and not all(os.path.exists(s) for s in savenames):
+    autos = [make_auto(i) for i in range(n_layers)]
+    pipeline_pretrain(autos, train_images, n_epochs=n_epochs,
+                      batch_size=batch_size,
+                      train_params=[dict(rate=rate, noise=0.1)
+                                    for rate in rates])
+    for auto, savename in zip(autos, savenames):
+        auto.to_file(savename)
+
 deep = DeepAutoencoder()
 data = train_images
+valid_data = valid_images
 for i in range(n_layers):
-    savename = "sigmoid-auto-%d.npz" % i
+    savename = savenames[i]
     if not os.path.exists(savename):
-        auto = Autoencoder(
-            shapes[i], shapes[i+1], rf_shape=rf_shapes[i],
-            vis_func=funcs[i], hid_func=funcs[i+1])
+        auto = make_auto(i)
         deep.autos.append(auto)
         auto.auto_sgd(data, deep, test_images, noise=0.1,
-                      n_epochs=n_epochs, rate=rates[i])
+                      n_epochs=n_epochs, rate=rates[i],
+                      valid_images=valid_data,
+                      early_stopping=EarlyStopping(patience=3))
         auto.to_file(savename)
     else:
         auto = FileObject.from_file(savename)
-        assert type(auto) is Autoencoder
+        assert isinstance(auto, Autoencoder)
         deep.autos.append(auto)
 
     data = auto.encode(data)
+    valid_data = auto.encode(valid_data)
 
 plt.figure(99)
 plt.clf()
@@ -93,8 +129,11 @@ if 1:
     # deep.backprop(train, test, n_epochs=100)
     # deep.sgd(train, test, n_epochs=50)
 
-    deep.sgd(train, test, n_epochs=5, noise=0.5)
-    deep.backprop(train, test, n_epochs=50, noise=0.5)
+    deep.sgd(train, test, n_epochs=5, noise=0.5,
+             checkpoint=Checkpointer('checkpoints/sigmoid-sgd'))
+    deep.backprop(train, test, n_epochs=50, noise=0.5,
+                  checkpoint=Checkpointer('checkpoints/sigmoid-backprop', every=5),
+                  valid_set=valid, early_stopping=EarlyStopping(patience=5))
     print "mean error", deep.test(test).mean()
 
 # --- try to get autoencoder back
@@ -120,14 +159,15 @@ if 0:
 if 0:
     # save parameters
     d = {}
-    d['weights'] = [auto.W.get_value() for auto in deep.autos]
-    d['biases'] = [auto.c.get_value() for auto in deep.autos]
+    layers = [auto.dense_weights() for auto in deep.autos]  # unroll conv
+    d['weights'] = [W for W, c in layers]
+    d['biases'] = [c for W, c in layers]
     if all(hasattr(auto, 'V') for auto in deep.autos):
         d['rec_weights'] = [auto.V.get_value() for auto in deep.autos]
         d['rec_biases'] = [auto.b.get_value() for auto in deep.autos]
     d['Wc'] = deep.W
     d['bc'] = deep.b
-    np.savez('sigmoid-deep.npz', **d)
+    modelfile.save('sigmoid-deep.npz', d)
 
 if 0:
     # compute top layers mean and std
@@ -0,0 +1,136 @@
+"""
+Periodic checkpointing of training state.
+
+`Checkpointer.save` copies the given arrays into an in-memory snapshot and
+writes it on a background thread (in the model file format, see
+`modelfile.py`), so training continues while the file is written. Each file
+is written under a temporary name and renamed into place, so a crash during
+a write never leaves a partial checkpoint. Only the last `keep` checkpoints
+are kept on disk.
+"""
+import glob
+import os
+import re
+import threading
+
+import numpy as np
+
+import modelfile
+
+
+class Checkpointer(object):
+    """
+    Saves checkpoints to `<prefix>-<step>.npz` every `every` steps.
+
+    A step is whatever the training method counts (epochs for SGD, function
+    evaluations for L-BFGS). Training methods take a `checkpoint` argument;
+    when given, they resume from the latest checkpoint, if there is one.
+    """
+
+    def __init__(self, prefix, every=1, keep=3):
+        assert every >= 1 and keep >= 1
+        self.prefix = prefix
+        self.every = every
+        self.keep = keep
+
+        self._thread = None
+        self._error = None
+
+        dirname = os.path.dirname(prefix)
+        if dirname and not os.path.exists(dirname):
+            os.makedirs(dirname)
+
+    def path(self, step):
+        return '%s-%06d.npz' % (self.prefix, step)
+
+    @property
+    def steps(self):
+        """Steps of the checkpoints on disk, in increasing order"""
+        pattern = re.compile(
+            re.escape(os.path.basename(self.prefix)) + r'-(\d+)\.npz$')
+        matches = (pattern.match(os.path.basename(path))
+                   for path in glob.glob(self.prefix + '-*.npz'))
+        return sorted(int(m.group(1)) for m in matches if m is not None)
+
+    def due(self, step):
+        """Whether a checkpoint should be saved after step `step`"""
+        return (step + 1) % self.every == 0
+
+    def save(self, step, tensors, **config):
+        """Snapshot `tensors` (a dict of arrays or lists of arrays) and
+        write them in the background, along with the JSON `config`"""
+        snapshot = {}
+        for k, v in tensors.items():
+            snapshot[k] = ([np.array(x) for x in v]
+                           if isinstance(v, (list, tuple)) else np.array(v))
+        config['step'] = step
+
+        self.wait()
+        self._thread = threading.Thread(
+            target=self._write, args=(step, snapshot, config))
+        self._thread.start()
+
+    def _write(self, step, tensors, config):
+        try:
+            path = self.path(step)
+            tmp = path + '.tmp'
+            modelfile.save(tmp, tensors, config=config)
+            os.rename(tmp, path)
+
+            for old in self.steps[:-self.keep]:
+                os.remove(self.path(old))
+        except Exception as e:
+            self._error = e
+
+    def wait(self):
+        """Wait for the current write to finish, and raise any write error"""
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def load(self, step=None):
+        """Open checkpoint `step` (default: latest), or None if there is none"""
+        self.wait()
+        steps = self.steps
+        if step is None and len(steps) == 0:
+            return None
+        return modelfile.ModelFile(self.path(steps[-1] if step is None else step))
+
+    def save_shared(self, step, shared, early_stopping=None, **config):
+        """Checkpoint the values of a list of Theano shared variables
+
+        If `early_stopping` is given, its state is checkpointed as well.
+        """
+        tensors = dict(shared=[s.get_value(borrow=True) for s in shared])
+        if early_stopping is not None:
+            config['early_stopping'], best = early_stopping.get_state()
+            if best is not None:
+                tensors['best_params'] = best
+        self.save(step, tensors, **config)
+
+    def restore_shared(self, shared, early_stopping=None):
+        """Set shared variables (and `early_stopping`) from the latest
+        checkpoint
+
+        Returns the checkpoint config (including `step`), or None if there
+        is no checkpoint to resume from.
+        """
+        state = self.load()
+        if state is None:
+            return None
+
+        values = state['shared']
+        assert len(values) == len(shared), "Checkpoint does not match model"
+        for s, v in zip(shared, values):
+            s.set_value(np.asarray(v, dtype=s.dtype))
+        if early_stopping is not None and 'early_stopping' in state.config:
+            early_stopping.set_state(
+                state.config['early_stopping'],
+                state['best_params'] if 'best_params' in state else None)
+
+        print "Resuming from %s" % self.path(state.config['step'])
+        return state.config
@@ -0,0 +1,118 @@
+"""
+Nearest-centroid and dot-product classifiers on network codes.
+
+A `Vocabulary` keeps the sum and count of the codes seen for each category,
+so the class means ("pointers") can be updated incrementally as more codes
+are seen, and cached with the model (`save`/`load`) instead of re-encoding
+the training set. Distances use the GEMM form
+`||a||^2 - 2 a.b + ||b||^2`, so no (examples, dims, classes) temporaries
+are formed.
+"""
+import numpy as np
+
+import modelfile
+
+
+class Vocabulary(object):
+
+    def __init__(self, categories=None, sums=None, counts=None):
+        self.categories = (np.array([], dtype='int64') if categories is None
+                           else np.asarray(categories))
+        self.sums = sums
+        self.counts = (np.zeros(len(self.categories)) if counts is None
+                       else np.asarray(counts, dtype=np.float64))
+        self._cache = {}
+
+    @property
+    def dims(self):
+        return None if self.sums is None else self.sums.shape[1]
+
+    def update(self, codes, labels):
+        """Add the codes for `labels` to the class sums"""
+        codes = np.asarray(codes)
+        labels = np.asarray(labels)
+        new = np.setdiff1d(np.unique(labels), self.categories)
+        if self.sums is None:
+            self.sums = np.zeros((0, codes.shape[1]))
+        if len(new) > 0:
+            categories = np.union1d(self.categories, new)
+            keep = np.searchsorted(categories, self.categories)
+            sums = np.zeros((len(categories), self.dims))
+            counts = np.zeros(len(categories))
+            sums[keep], counts[keep] = self.sums, self.counts
+            self.categories, self.sums, self.counts = categories, sums, counts
+
+        # one-hot GEMM: sums[i] += sum of codes with label categories[i]
+        inds = np.searchsorted(self.categories, labels)
+        onehot = np.zeros((len(self.categories), len(labels)),
+                          dtype=codes.dtype)
+        onehot[inds, np.arange(len(labels))] = 1
+        self.sums += np.dot(onehot, codes)
+        self.counts += np.bincount(inds, minlength=len(self.categories))
+        self._cache.clear()
+
+    @property
+    def means(self):
+        """Mean code of each category"""
+        if 'means' not in self._cache:
+            self._cache['means'] = self.sums / self.counts[:, None]
+        return self._cache['means']
+
+    @property
+    def mean(self):
+        """Mean of all codes seen"""
+        if 'mean' not in self._cache:
+            self._cache['mean'] = self.sums.sum(0) / self.counts.sum()
+        return self._cache['mean']
+
+    def pointers(self, normalize=True, center=False):
+        """Class means for the dot-product classifier
+
+        If `center`, the overall mean is subtracted (use the same
+        centering for the codes); if `normalize`, pointers have unit norm.
+        """
+        key = ('pointers', normalize, center)
+        if key not in self._cache:
+            p = self.means - self.mean if center else self.means.copy()
+            if normalize:
+                p /= np.sqrt((p**2).sum(axis=1, keepdims=True))
+            self._cache[key] = p
+        return self._cache[key]
+
+    def _centroid_scores(self, codes):
+        # -2 a.b + ||b||^2, i.e. the squared distances without ||a||^2
+        if 'means_sq' not in self._cache:
+            self._cache['means_sq'] = (self.means**2).sum(axis=1)
+        d = np.dot(codes, self.means.T)
+        d *= -2
+        d += self._cache['means_sq']
+        return d
+
+    def distances(self, codes):
+        """Squared distances from each code to each class mean"""
+        d = self._centroid_scores(codes)
+        d += (codes**2).sum(axis=-1)[..., None]
+        return d
+
+    def classify_centroid(self, codes):
+        """Category of the nearest class mean for each code"""
+        d = self._centroid_scores(codes)  # ||a||^2 does not change argmin
+        return self.categories[np.argmin(d, axis=-1)]
+
+    def classify_dot(self, codes, normalize=True, center=False):
+        """Category with the largest dot product with each code"""
+        p = self.pointers(normalize=normalize, center=center)
+        if center:
+            codes = codes - self.mean
+        return self.categories[np.argmax(np.dot(codes, p.T), axis=-1)]
+
+    def save(self, filename):
+        modelfile.save(filename, dict(categories=self.categories,
+                                      sums=self.sums, counts=self.counts),
+                       cls=self.__class__)
+
+    @classmethod
+    def load(cls, filename):
+        f = modelfile.ModelFile(filename)
+        return cls(categories=np.array(f['categories']),
+                   sums=np.array(f['sums']), counts=np.array(f['counts']))
@@ -0,0 +1,98 @@
+"""
+Convolutional (shared-weight) layers on flattened images.
+
+Images are flattened channels-last, `(rows, cols[, channels])` (see
+`masks.py`), and so are the hidden feature maps, `(rows, cols, filters)`,
+so convolutional layers stack with dense ones. Filters have Theano's layout
+`(filters, channels, m, n)` and are applied with a `stride` and without
+flipping (as correlations, like the dense receptive fields).
+
+A convolutional layer is a dense layer with shared, mostly zero weights;
+`dense_weights` unrolls it, e.g. to export it to the Nengo runs.
+"""
+import numpy as np
+
+from theano.tensor.nnet import conv2d
+from theano.tensor.nnet.abstract_conv import (
+    conv2d_grad_wrt_inputs, conv2d_grad_wrt_weights)
+
+
+def image_shape(vis_shape):
+    """`(rows, cols, channels)` of a 2-D or 3-D image shape"""
+    vis_shape = tuple(vis_shape)
+    return vis_shape if len(vis_shape) == 3 else vis_shape + (1,)
+
+
+def map_shape(vis_shape, rf_shape, stride):
+    """`(rows, cols)` of each feature map (valid convolution)"""
+    M, N = vis_shape[:2]
+    m, n = rf_shape
+    return ((M - m) // stride[0] + 1, (N - n) // stride[1] + 1)
+
+
+def initial_filters(n_filters, vis_shape, rf_shape, stride, rng=np.random):
+    """Uniform random filters `(n_filters, channels, m, n)`"""
+    C = image_shape(vis_shape)[2]
+    m, n = rf_shape
+    fan_in = C * m * n
+    fan_out = n_filters * m * n / float(stride[0] * stride[1])
+    Wmag = 4 * np.sqrt(6. / (fan_in + fan_out))
+    return rng.uniform(low=-Wmag, high=Wmag, size=(n_filters, C, m, n))
+
+
+def conv_up(x, W, c, vis_shape, filter_shape, stride):
+    """Flattened feature maps (plus biases `c`) of the flat images `x`"""
+    M, N, C = image_shape(vis_shape)
+    x = x.reshape((x.shape[0], M, N, C)).dimshuffle(0, 3, 1, 2)
+    h = conv2d(x, W, input_shape=(None, C, M, N), filter_shape=filter_shape,
+               subsample=stride, filter_flip=False)
+    h += c.dimshuffle('x', 0, 'x', 'x')
+    return h.dimshuffle(0, 2, 3, 1).flatten(2)
+
+
+def conv_down(h, W, vis_shape, filter_shape, stride):
+    """Flat images from flattened feature maps `h`; the transpose of `conv_up`"""
+    M, N, C = image_shape(vis_shape)
+    P, Q = map_shape(vis_shape, filter_shape[2:], stride)
+    h = h.reshape((h.shape[0], P, Q, filter_shape[0])).dimshuffle(0, 3, 1, 2)
+    x = conv2d_grad_wrt_inputs(
+        h, W, input_shape=(None, C, M, N), filter_shape=filter_shape,
+        subsample=stride, filter_flip=False)
+    return x.dimshuffle(0, 2, 3, 1).flatten(2)
+
+
+def conv_products(x, h, vis_shape, filter_shape, stride):
+    """Products of flat images `x` and feature maps `h`, shaped like `W`
+
+    Summed over the batch and the map positions; this is the gradient of
+    `sum(h * conv_up(x, W, 0, ...))` with respect to `W`.
+    """
+    M, N, C = image_shape(vis_shape)
+    P, Q = map_shape(vis_shape, filter_shape[2:], stride)
+    x = x.reshape((x.shape[0], M, N, C)).dimshuffle(0, 3, 1, 2)
+    h = h.reshape((h.shape[0], P, Q, filter_shape[0])).dimshuffle(0, 3, 1, 2)
+    return conv2d_grad_wrt_weights(
+        x, h, filter_shape=filter_shape, input_shape=(None, C, M, N),
+        subsample=stride, filter_flip=False)
+
+
+def filter_images(W):
+    """Filters `(filters, m, n[, channels])`, for `plotting.filters`"""
+    W = W.transpose(0, 2, 3, 1)
+    return W[..., 0] if W.shape[3] == 1 else W
+
+
+def dense_weights(W, c, vis_shape, stride):
+    """The equivalent dense weights `(n_vis, n_hid)` and biases `(n_hid,)`"""
+    F, C, m, n = W.shape
+    M, N, _ = image_shape(vis_shape)
+    P, Q = map_shape(vis_shape, (m, n), stride)
+    sy, sx = stride
+
+    dense = np.zeros((M, N, C, P, Q, F), dtype=W.dtype)
+    block = W.transpose(2, 3, 1, 0)  # m, n, channels, filters
+    for i in xrange(P):
+        for j in xrange(Q):
+            dense[i*sy:i*sy+m, j*sx:j*sx+n, :, i, j, :] = block
+
+    return dense.reshape(M * N * C, P * Q * F), np.tile(c, P * Q)
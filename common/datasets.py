@@ -0,0 +1,145 @@
+"""
+Loading datasets, without depending on Theano.
+
+`synthetic_mnist` generates a deterministic, MNIST-like dataset (no download
+needed), with the same `(train, valid, test)` format as `mnist`. To run
+the scripts that call `mnist()` on machines without network access, set
+the environment variable `SYNTHETIC_MNIST=1` (or pass `synthetic=True`).
+"""
+import os
+
+import numpy as np
+
+
+def mnist(filename='mnist.pkl.gz', synthetic=None):
+    """MNIST as `(train, valid, test)`, each `(images, labels)`
+
+    If `synthetic` is True (or a dict of arguments for it), or it
+    is None and `SYNTHETIC_MNIST` is set in the environment, a synthetic
+    dataset of the same format (`synthetic_mnist`) is returned instead of
+    loading `filename`.
+    """
+    if synthetic is None:
+        synthetic = os.environ.get('SYNTHETIC_MNIST', '') not in ('', '0')
+    if synthetic:
+        return synthetic_mnist(
+            **(synthetic if isinstance(synthetic, dict) else {}))
+
+    import gzip
+    import cPickle as pickle
+    import urllib
+
+    if not os.path.exists(filename):
+        url = 'http://deeplearning.net/data/mnist/mnist.pkl.gz'
+        urllib.urlretrieve(url, filename=filename)
+
+    with gzip.open(filename, 'rb') as f:
+        train, valid, test = pickle.load(f)
+
+    return train, valid, test
+
+
+def stroke_templates(n_templates, shape, n_strokes=3, width=None,
+                     rng=np.random):
+    """Images of `n_strokes` random, blurred line segments each
+
+    Returns an array (n_templates,) + shape with values in [0, 1]. If
+    `shape` is `(rows, cols, channels)`, each template has a random colour.
+    Segment end points lie in the central 70% of the image, and `width`
+    (the standard deviation of the stroke profile, in pixels) defaults to
+    a 28x28 MNIST pen width scaled to `shape`.
+    """
+    rows, cols = shape[:2]
+    if width is None:
+        width = 1.2 * min(rows, cols) / 28.
+
+    p = rng.uniform(0.15, 0.85, size=(n_strokes, n_templates, 2, 2))
+    p *= np.array([rows - 1, cols - 1])
+
+    grid = np.indices((rows, cols), dtype=np.float64).reshape(2, -1).T  # (pixels, 2)
+    images = np.zeros((n_templates, rows * cols), dtype=np.float32)
+    for stroke in p:
+        # squared distance from each pixel to the nearest point on the segment
+        a, b = stroke[:, None, 0], stroke[:, None, 1]  # (n, 1, 2)
+        ab = b - a
+        t = ((grid - a) * ab).sum(-1) / np.maximum((ab**2).sum(-1), 1e-12)
+        t = np.clip(t, 0, 1)
+        d2 = ((grid - (a + t[..., None] * ab))**2).sum(-1)
+        np.maximum(images, np.exp(-0.5 * d2 / width**2), out=images)
+    images = images.reshape(n_templates, rows, cols)
+
+    if len(shape) == 3:
+        colours = rng.uniform(0.2, 1, size=(n_templates, 1, 1, shape[2]))
+        images = (images[..., None] * colours).astype(np.float32)
+    return images
+
+
+def _shift(images, dy, dx):
+    """Shift each image (n, rows, cols[, channels]) by its integer offsets"""
+    result = np.zeros_like(images)
+    rows, cols = images.shape[1:3]
+    for sy in np.unique(dy):
+        for sx in np.unique(dx):
+            i = (dy == sy) & (dx == sx)
+            if not i.any():
+                continue
+            dst = (slice(max(sy, 0), rows + min(sy, 0)),
+                   slice(max(sx, 0), cols + min(sx, 0)))
+            src = (slice(max(-sy, 0), rows - max(sy, 0)),
+                   slice(max(-sx, 0), cols - max(sx, 0)))
+            result[i, dst[0], dst[1]] = images[i, src[0], src[1]]
+    return result
+
+
+def synthetic_set(n, templates, n_classes, max_shift=2, contrast=0.3,
+                  noise=0.05, rng=np.random, chunk_size=10000):
+    """`n` examples from `templates` (n_classes * n_modes,) + image shape
+
+    Each example is a random template of a random class, shifted by up to
+    `max_shift` pixels, scaled by a random contrast in `[1 - contrast, 1]`,
+    with Gaussian pixel noise of std `noise`, and clipped to [0, 1].
+    """
+    n_modes = len(templates) // n_classes
+    labels = rng.randint(n_classes, size=n)
+    inds = labels * n_modes + rng.randint(n_modes, size=n)
+    dy, dx = rng.randint(-max_shift, max_shift + 1, size=(2, n))
+    scales = rng.uniform(1 - contrast, 1, size=n).astype(np.float32)
+    scales = scales.reshape((n,) + (1,) * (templates.ndim - 1))
+
+    # work in chunks to limit the float64 noise temporaries
+    images = np.zeros((n,) + templates.shape[1:], dtype=np.float32)
+    for i in range(0, n, chunk_size):
+        s = slice(i, i + chunk_size)
+        chunk = _shift(templates[inds[s]], dy[s], dx[s])
+        chunk *= scales[s]
+        chunk += rng.normal(scale=noise, size=chunk.shape)
+        images[s] = chunk
+    np.clip(images, 0, 1, out=images)
+    return images.reshape(n, templates[0].size), labels.astype(np.int64)
+
+
+def synthetic_mnist(n_train=50000, n_valid=10000, n_test=10000,
+                    shape=(28, 28), n_classes=10, n_modes=4, n_strokes=3,
+                    max_shift=2, contrast=0.3, noise=0.05, seed=0):
+    """Deterministic MNIST-like dataset as `(train, valid, test)`
+
+    Each class has `n_modes` templates ("writing styles") of `n_strokes`
+    random strokes, from which the examples are drawn (see
+    `synthetic_set`). The images are float32 in [0, 1], flattened, and
+    the labels int64, as in `mnist.pkl.gz`. The defaults give the MNIST
+    sizes; larger `shape`s give higher-resolution variants, and a shape
+    `(rows, cols, channels)` gives colour images (flattened channels-last).
+
+    The templates depend only on `seed` and the structure parameters, and
+    each set only on `seed` and its own size, so e.g. the test set does not
+    change with `n_train`.
+    """
+    templates = stroke_templates(
+        n_classes * n_modes, tuple(shape), n_strokes=n_strokes,
+        rng=np.random.RandomState([seed, 0]))
+
+    kwargs = dict(max_shift=max_shift, contrast=contrast, noise=noise)
+    return tuple(
+        synthetic_set(n, templates, n_classes,
+                      rng=np.random.RandomState([seed, i + 1]), **kwargs)
+        for i, n in enumerate([n_train, n_valid, n_test]))
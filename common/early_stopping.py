@@ -0,0 +1,88 @@
+"""
+Validation-driven early stopping for the training methods.
+
+Training methods that take an `early_stopping` argument evaluate the error on
+a validation set after each epoch (with a function compiled once per call)
+and pass it to `EarlyStopping.update`, which keeps a copy of the best
+parameters so far. Training stops once the validation error has not improved
+for `patience` epochs, and the best parameters are then restored. If
+`decay_patience` is set, the learning rate is also multiplied by `decay`
+whenever the error has not improved for that many epochs (plateau decay).
+
+Pass the `EarlyStopping` to `Checkpointer.save_shared` and `restore_shared`
+so that training resumes with the same best error, patience and rate scale.
+"""
+import numpy as np
+
+
+class StopTraining(Exception):
+    """Raised from inside an optimizer's function to end training early"""
+
+
+class EarlyStopping(object):
+
+    def __init__(self, patience=5, min_delta=1e-4, decay_patience=None,
+                 decay=0.5):
+        self.patience = patience
+        self.min_delta = min_delta
+        self.decay_patience = decay_patience
+        self.decay = decay
+        self.reset()
+
+    def reset(self):
+        self.best_error = np.inf
+        self.best_epoch = None
+        self.best_params = None
+        self.wait = 0
+        self.plateau = 0
+        self.rate_scale = 1.
+
+    def update(self, epoch, error, params):
+        """Record the validation error after `epoch`; returns True to stop"""
+        if error < self.best_error - self.min_delta:
+            self.best_error = error
+            self.best_epoch = epoch
+            self.best_params = [p.get_value() for p in params]
+            self.wait = 0
+            self.plateau = 0
+        else:
+            self.wait += 1
+            self.plateau += 1
+            if (self.decay_patience is not None
+                    and self.plateau >= self.decay_patience):
+                self.rate_scale *= self.decay
+                self.plateau = 0
+                print "Validation plateau: rate scaled by %g" % self.rate_scale
+
+        if self.wait >= self.patience:
+            print "Stopping early: no improvement in %d epochs" % self.wait
+            return True
+        return False
+
+    def get_state(self):
+        """The state to checkpoint: a JSON config and the best parameters"""
+        config = dict(best_error=float(self.best_error),
+                      best_epoch=self.best_epoch,
+                      wait=self.wait, plateau=self.plateau,
+                      rate_scale=self.rate_scale)
+        return config, self.best_params
+
+    def set_state(self, config, best_params):
+        """Resume from a state returned by `get_state`"""
+        self.best_error = config['best_error']
+        self.best_epoch = config['best_epoch']
+        self.wait = config['wait']
+        self.plateau = config['plateau']
+        self.rate_scale = config['rate_scale']
+        self.best_params = (None if best_params is None
+                            else [np.array(p) for p in best_params])
+
+    def restore(self, params):
+        """Set `params` to the best values seen"""
+        if self.best_params is None:
+            return
+
+        for p, value in zip(params, self.best_params):
+            p.set_value(value)
+        print "Restored parameters from epoch %d (validation error %0.4f)" % (
+            self.best_epoch, self.best_error)
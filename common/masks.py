@@ -0,0 +1,71 @@
+"""
+Receptive-field masks for sparsely connected first layers.
+
+Images are flattened in `(rows, cols[, channels])` order (channels last, as
+`plotting.tile` expects). A mask is a boolean array `(n_vis, n_hid)` that is
+True where a hidden unit is connected; `Autoencoder` and `RBM` multiply
+their weights (and the weight updates) by it.
+"""
+import numpy as np
+
+
+def rf_positions(vis_shape, n_hid, rf_shape, tiled=False, rng=np.random):
+    """Top-left corners `(i, j)` of the receptive fields of `n_hid` units
+
+    Corners are random, or, if `tiled`, taken from a grid with a stride of
+    half the field size that covers the image evenly (in random order,
+    cycling when there are more units than grid positions).
+    """
+    M, N = vis_shape[:2]
+    m, n = rf_shape[:2]
+    if not tiled:
+        i = rng.randint(low=0, high=M-m+1, size=n_hid)
+        j = rng.randint(low=0, high=N-n+1, size=n_hid)
+        return i, j
+
+    def starts(size, rf):
+        step = max(rf // 2, 1)
+        return np.unique(np.append(np.arange(0, size - rf + 1, step), size - rf))
+
+    ii, jj = np.meshgrid(starts(M, m), starts(N, n), indexing='ij')
+    grid = np.column_stack([ii.ravel(), jj.ravel()])
+    order = np.concatenate([rng.permutation(len(grid))
+                            for _ in xrange(-(-n_hid // len(grid)))])
+    i, j = grid[order[:n_hid]].T
+    return i, j
+
+
+def sparse_mask(vis_shape, n_hid, rf_shape, tiled=False, rng=np.random):
+    """Boolean mask (n_vis, n_hid) giving each hidden unit a receptive field
+
+    `vis_shape` is `(rows, cols)` or `(rows, cols, channels)`, with pixels
+    flattened in that (channels-last) order. `rf_shape` is `(m, n)` for
+    fields covering all channels, or `(m, n, c)` for fields covering `c`
+    consecutive channels, starting at a random channel.
+    """
+    assert isinstance(vis_shape, tuple) and len(vis_shape) in (2, 3)
+    assert isinstance(rf_shape, tuple) and len(rf_shape) in (2, 3)
+    M, N = vis_shape[:2]
+    m, n = rf_shape[:2]
+    C = vis_shape[2] if len(vis_shape) == 3 else 1
+    c = rf_shape[2] if len(rf_shape) == 3 else C
+    assert m <= M and n <= N and c <= C
+    n_vis = M * N * C
+
+    # find positions for top-left corner (and first channel) of each RF
+    i, j = rf_positions(vis_shape, n_hid, rf_shape, tiled=tiled, rng=rng)
+    h = (rng.randint(low=0, high=C-c+1, size=n_hid) if c < C
+         else np.zeros(n_hid, dtype=int))
+
+    mask = np.zeros((M, N, C, n_hid), dtype='bool')
+    for k in xrange(n_hid):
+        mask[i[k]:i[k]+m, j[k]:j[k]+n, h[k]:h[k]+c, k] = True
+
+    return mask.reshape(n_vis, n_hid)
+
+
+def rf_filter_shape(vis_shape, rf_shape):
+    """Shape of one masked filter: `rf_shape`, with the channels if any"""
+    if len(rf_shape) == 3 or len(vis_shape) == 2:
+        return tuple(rf_shape)
+    return tuple(rf_shape) + tuple(vis_shape[2:])
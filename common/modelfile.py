@@ -0,0 +1,225 @@
+"""
+Versioned model file format with lazily loaded tensors.
+
+A model file is an uncompressed zip archive containing:
+
+    manifest.json       format name and version, the model class, a JSON
+                        config, and the name, shape and dtype of each tensor
+    tensors/<name>.npy  one entry per tensor, stored uncompressed and aligned
+    objects.pkl         (optional) pickled config values that are not JSON
+
+Since the tensor entries are stored uncompressed, `ModelFile` can memory-map
+each one directly from the archive. Opening a file only reads the manifest,
+and a tensor is only read from disk when it is used.
+
+Lists of tensors (e.g. the `weights` of each layer) are stored as
+`weights/0`, `weights/1`, ... and read back with `ModelFile.tensor_list`.
+"""
+import cPickle as pickle
+import io
+import json
+import struct
+import zipfile
+
+import numpy as np
+
+FORMAT = 'nef-rbm-model'
+VERSION = 1
+
+ALIGNMENT = 64  # byte alignment of tensor data within the file
+EXTRA_ID = 0xcafe  # zip extra field ID used for alignment padding
+
+MANIFEST = 'manifest.json'
+OBJECTS = 'objects.pkl'
+
+
+def to_json(value):
+    """Convert `value` to a JSON-compatible value, or raise `TypeError`"""
+    if value is None or isinstance(value, (bool, int, long, float, basestring)):
+        return value
+    elif isinstance(value, np.generic):
+        return value.item()
+    elif isinstance(value, (list, tuple)):
+        return [to_json(v) for v in value]
+    elif isinstance(value, dict):
+        return dict((str(k), to_json(v)) for k, v in value.items())
+    raise TypeError("%r is not JSON serializable" % (value,))
+
+
+def from_json(value):
+    """Inverse of `to_json`; sequences come back as tuples"""
+    if isinstance(value, list):
+        return tuple(from_json(v) for v in value)
+    elif isinstance(value, dict):
+        return dict((str(k), from_json(v)) for k, v in value.items())
+    return value
+
+
+def _npy_bytes(array):
+    f = io.BytesIO()
+    np.lib.format.write_array(f, np.asanyarray(array), allow_pickle=False)
+    return f.getvalue()
+
+
+def _npy_header_length(data):
+    f = io.BytesIO(data)
+    version = np.lib.format.read_magic(f)
+    if version == (1, 0):
+        np.lib.format.read_array_header_1_0(f)
+    else:
+        np.lib.format.read_array_header_2_0(f)
+    return f.tell()
+
+
+def save(filename, tensors, config=None, objects=None, cls=None):
+    """Save a model file
+
+    Parameters
+    ----------
+    tensors : dict
+        Maps names to arrays. Values that are lists or tuples of arrays are
+        stored as one tensor per element.
+    config : dict
+        JSON-serializable configuration (shapes, hyperparameters, ...).
+    objects : dict
+        Other configuration values, which are pickled (e.g. nonlinearities).
+    cls : type
+        Class of the saved model, recorded so that it can be rebuilt.
+    """
+    flat = []
+    for name, value in sorted(tensors.items()):
+        if isinstance(value, (list, tuple)):
+            flat.extend(('%s/%d' % (name, i), v) for i, v in enumerate(value))
+        else:
+            flat.append((name, value))
+
+    manifest = dict(format=FORMAT, version=VERSION, tensors={}, lists={},
+                    config=to_json(config if config is not None else {}),
+                    objects=sorted(objects) if objects else [],
+                    cls=None if cls is None else [cls.__module__, cls.__name__])
+    for name, value in tensors.items():
+        if isinstance(value, (list, tuple)):
+            manifest['lists'][name] = len(value)
+
+    with zipfile.ZipFile(filename, 'w', zipfile.ZIP_STORED) as zf:
+        for name, value in flat:
+            data = _npy_bytes(value)
+            arcname = 'tensors/%s.npy' % name
+
+            # pad the local header so that the array data is aligned
+            start = (zf.fp.tell() + zipfile.sizeFileHeader + len(arcname)
+                     + 4 + _npy_header_length(data))
+            pad = -start % ALIGNMENT
+            info = zipfile.ZipInfo(arcname, date_time=(1980, 1, 1, 0, 0, 0))
+            info.compress_type = zipfile.ZIP_STORED
+            info.extra = struct.pack('<HH', EXTRA_ID, pad) + '\0' * pad
+            zf.writestr(info, data)
+
+            value = np.asanyarray(value)
+            manifest['tensors'][name] = dict(
+                file=arcname, shape=list(value.shape), dtype=value.dtype.str)
+
+        if objects:
+            zf.writestr(OBJECTS, pickle.dumps(objects, protocol=2))
+        zf.writestr(MANIFEST, json.dumps(manifest, indent=1, sort_keys=True))
+
+
+def is_model_file(filename):
+    """Whether `filename` is in this format (as opposed to a legacy npz)"""
+    if not zipfile.is_zipfile(filename):
+        return False
+    with zipfile.ZipFile(filename) as zf:
+        return MANIFEST in zf.namelist()
+
+
+class ModelFile(object):
+    """A model file opened for reading; tensors are memory-mapped on access"""
+
+    def __init__(self, filename):
+        self.filename = filename
+        with zipfile.ZipFile(filename) as zf:
+            self.manifest = json.loads(zf.read(MANIFEST))
+            self._offsets = dict(
+                (name, zf.getinfo(t['file']).header_offset)
+                for name, t in self.manifest['tensors'].items())
+
+        if self.manifest.get('format') != FORMAT:
+            raise ValueError("%r is not a model file" % filename)
+        if self.version > VERSION:
+            raise ValueError("%r has version %d, newer than supported (%d)"
+                             % (filename, self.version, VERSION))
+
+        self.config = from_json(self.manifest['config'])
+        self._tensors = {}
+        self._objects = None
+
+    @property
+    def version(self):
+        return self.manifest['version']
+
+    @property
+    def names(self):
+        return sorted(str(k) for k in self.manifest['tensors'])
+
+    @property
+    def lists(self):
+        return self.manifest['lists']
+
+    def __contains__(self, name):
+        return name in self.manifest['tensors'] or name in self.lists
+
+    def __getitem__(self, name):
+        if name in self.lists:
+            return self.tensor_list(name)
+        if name not in self._tensors:
+            self._tensors[name] = self._memmap(name)
+        return self._tensors[name]
+
+    def tensor_list(self, name):
+        return [self['%s/%d' % (name, i)] for i in range(self.lists[name])]
+
+    def _memmap(self, name):
+        with open(self.filename, 'rb') as f:
+            # skip the zip local file header (its extra field holds padding)
+            f.seek(self._offsets[name])
+            header = struct.unpack(zipfile.structFileHeader,
+                                   f.read(zipfile.sizeFileHeader))
+            f.seek(header[zipfile._FH_FILENAME_LENGTH]
+                   + header[zipfile._FH_EXTRA_FIELD_LENGTH], 1)
+
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran, dtype = np.lib.format.read_array_header_2_0(f)
+            offset = f.tell()
+
+        if np.prod(shape) == 0:
+            return np.zeros(shape, dtype=dtype)
+        return np.memmap(self.filename, dtype=dtype, mode='r', offset=offset,
+                         shape=shape, order='F' if fortran else 'C')
+
+    @property
+    def objects(self):
+        if self._objects is None:
+            self._objects = {}
+            if self.manifest['objects']:
+                with zipfile.ZipFile(self.filename) as zf:
+                    self._objects = pickle.loads(zf.read(OBJECTS))
+        return self._objects
+
+    @property
+    def cls(self):
+        if self.manifest['cls'] is None:
+            return None
+        module, name = self.manifest['cls']
+        return getattr(__import__(module), name)
+
+
+def load_network(filename):
+    """Load the final parameters of a deep network (new or legacy npz)
+
+    Returns a dict-like object with `weights` and `biases` lists and the
+    classifier `Wc` and `bc`, if present.
+    """
+    return ModelFile(filename) if is_model_file(filename) else np.load(filename)
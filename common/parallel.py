@@ -0,0 +1,176 @@
+"""
+Synchronous data-parallel SGD across worker processes.
+
+`DataParallel` forks `n_workers` processes that share (through shared memory)
+the training data, one flat parameter vector, and one gradient vector per
+worker. Each step has two phases:
+
+1. Each worker computes the gradient on its shard of the batch and writes it
+   to its gradient vector.
+2. All-reduce and update: each worker sums the gradients of all workers over
+   its own slice of the parameter vector, weighted by shard size, and
+   applies the SGD update (and the sparsity masks) to that slice.
+
+The workers' Theano shared variables are views of the shared parameter
+vector, so updated parameters are visible to all workers without copying.
+Since the costs are means over examples, the weighted sum of the shard
+gradients is the gradient of the whole batch.
+"""
+import multiprocessing
+
+import numpy as np
+
+
+class SharedVector(object):
+    """A flat vector in shared memory, with views for a list of shapes"""
+
+    typecodes = {np.dtype('float32'): 'f', np.dtype('float64'): 'd',
+                 np.dtype('int32'): 'i'}
+
+    def __init__(self, shapes, dtype, rows=1):
+        self.dtype = np.dtype(dtype)
+        self.shapes = shapes
+        self.sizes = [int(np.prod(shape)) for shape in shapes]
+        self.size = sum(self.sizes)
+        self.rows = rows
+        self.base = multiprocessing.RawArray(
+            self.typecodes[self.dtype], self.rows * self.size)
+
+    @property
+    def array(self):
+        a = np.frombuffer(self.base, dtype=self.dtype)
+        return a.reshape(self.rows, self.size) if self.rows > 1 else a
+
+    def views(self, row=None):
+        """Arrays with the given shapes, viewing (row `row` of) the vector"""
+        a = self.array if row is None else self.array[row]
+        views = []
+        i = 0
+        for shape, size in zip(self.shapes, self.sizes):
+            views.append(a[i:i + size].reshape(shape))
+            i += size
+        return views
+
+
+class DataParallel(object):
+    """
+    Run SGD steps for a gradient function on several processes.
+
+    Parameters
+    ----------
+    f_grad : theano.function
+        Takes `(images, labels)` and returns `[error] + grads`, where the
+        gradients are in the order of `params`. It is compiled before the
+        workers are forked, so they all share the compiled code.
+    params : list of shared variables
+        The parameters. Their values are copied into shared memory; call
+        `get_params` to copy the trained values back.
+    data_shape : tuple
+        Shape of the training images for one epoch.
+    masks : dict
+        Maps parameter indices to masks that are reapplied after each update.
+    rngs : list of (MRG_RandomStreams, int)
+        Random streams used by `f_grad`, with their seeds. The workers are
+        forked with copies of the same stream states, so without reseeding
+        every shard would draw the same noise; worker `k` reseeds each
+        stream with `seed + 1 + k` (as in `RBM.pretrain_hogwild`).
+    """
+
+    def __init__(self, f_grad, params, data_shape, n_workers, masks=None,
+                 rngs=None):
+        self.n_workers = n_workers
+        self.rngs = list(rngs or [])
+        dtype = params[0].dtype
+
+        self.params = SharedVector(
+            [p.get_value(borrow=True).shape for p in params], dtype)
+        self.grads = SharedVector(self.params.shapes, dtype, rows=n_workers)
+        self.mask = SharedVector(self.params.shapes, dtype)
+        self.images = SharedVector([data_shape], dtype)
+        self.labels = SharedVector([data_shape[:1]], 'int32')
+
+        for p, value in zip(params, self.params.views()):
+            value[...] = p.get_value(borrow=True)
+        self.mask.array[:] = 1
+        for i, mask in (masks or {}).items():
+            self.mask.views()[i][...] = mask
+
+        bounds = np.linspace(0, self.params.size, n_workers + 1).astype(int)
+        self.slices = [slice(i0, i1) for i0, i1 in zip(bounds[:-1], bounds[1:])]
+
+        self.conns = []
+        self.workers = []
+        for k in range(n_workers):
+            conn, child_conn = multiprocessing.Pipe()
+            worker = multiprocessing.Process(
+                target=self._work, args=(k, child_conn, f_grad, params))
+            worker.daemon = True
+            worker.start()
+            self.conns.append(conn)
+            self.workers.append(worker)
+
+    def _work(self, k, conn, f_grad, params):
+        for rng, seed in self.rngs:
+            rng.seed(seed + 1 + k)
+        for p, value in zip(params, self.params.views()):
+            p.set_value(value, borrow=True)
+
+        images, = self.images.views()
+        labels, = self.labels.views()
+        grads = self.grads.array.reshape(self.n_workers, -1)
+        param = self.params.array[self.slices[k]]
+        mask = self.mask.array[self.slices[k]]
+        grad_k = grads[:, self.slices[k]]
+        dtype = self.params.dtype
+
+        while True:
+            msg = conn.recv()
+            if msg is None:
+                break
+
+            kind, args = msg
+            if kind == 'grad':
+                i0, i1 = args
+                outs = f_grad(images[i0:i1], labels[i0:i1])
+                grads[k] = np.concatenate([g.ravel() for g in outs[1:]])
+                conn.send(outs[0])
+            elif kind == 'update':
+                rate, weights = args
+                g = dtype.type(weights[0]) * grad_k[0]
+                for j in range(1, self.n_workers):
+                    g += dtype.type(weights[j]) * grad_k[j]
+                param -= dtype.type(rate) * g
+                param *= mask
+                conn.send(None)
+
+    def set_data(self, images, labels):
+        self.images.views()[0][...] = images
+        self.labels.views()[0][...] = labels
+
+    def step(self, i0, i1, rate):
+        """SGD step on examples `i0:i1`, returning the batch error"""
+        n = i1 - i0
+        assert n >= self.n_workers, "Batch smaller than number of workers"
+        bounds = np.linspace(i0, i1, self.n_workers + 1).astype(int)
+        weights = np.diff(bounds) / float(n)
+        for conn, j0, j1 in zip(self.conns, bounds[:-1], bounds[1:]):
+            conn.send(('grad', (j0, j1)))
+        errors = [conn.recv() for conn in self.conns]
+
+        for conn in self.conns:
+            conn.send(('update', (rate, weights)))
+        for conn in self.conns:
+            conn.recv()
+
+        return np.dot(weights, errors)
+
+    def get_params(self, params):
+        """Copy the current parameter values into `params`"""
+        for p, value in zip(params, self.params.views()):
+            p.set_value(value.copy())
+
+    def close(self):
+        for conn in self.conns:
+            conn.send(None)
+        for worker in self.workers:
+            worker.join()
@@ -0,0 +1,168 @@
+"""
+Layer-parallel (pipelined) greedy pretraining.
+
+Greedy pretraining normally trains layer `i` to completion, encodes the whole
+training set, and only then starts layer `i + 1`. `pipeline_pretrain` trains
+all layers at once, each in its own worker process. Every `refresh_every`
+epochs, each layer encodes its input data and publishes the codes to a
+shared-memory buffer, and the layer above switches to the newest codes. So
+layer `i + 1` starts training on codes from an early snapshot of layer `i`
+while layer `i` keeps refining.
+
+Once its input layer has finished, each layer trains for `final_epochs` more
+epochs on the final codes, so that upper layers are not left fitted to stale
+inputs.
+
+Layers can be any objects with `W`, `c` and `b` shared variables, an `n_hid`
+attribute, and `train_function` and `encode` methods (e.g. `Autoencoder` or
+`RBM`).
+Each worker uses its own BLAS threads, so limit those (e.g. with
+`OMP_NUM_THREADS`) to about `n_cores / n_layers`.
+"""
+import multiprocessing
+import Queue
+import time
+
+import numpy as np
+
+from precision import floatX
+
+
+class CodeBuffer(object):
+    """Shared-memory buffer holding the latest codes published by a layer"""
+
+    typecodes = {np.dtype('float32'): 'f', np.dtype('float64'): 'd'}
+
+    def __init__(self, shape, dtype):
+        self.shape = shape
+        self.dtype = np.dtype(dtype)
+        self.base = multiprocessing.RawArray(
+            self.typecodes[self.dtype], int(np.prod(shape)))
+        self.lock = multiprocessing.Lock()
+        self.version = multiprocessing.RawValue('i', 0)
+        self.final = multiprocessing.RawValue('b', 0)
+
+    @property
+    def array(self):
+        return np.frombuffer(self.base, dtype=self.dtype).reshape(self.shape)
+
+    def publish(self, codes, final=False):
+        with self.lock:
+            self.array[...] = codes
+            self.final.value = final
+            self.version.value += 1
+
+    def read(self, out):
+        """Copy the codes into `out`, returning `(version, final)`"""
+        with self.lock:
+            out[...] = self.array
+            return self.version.value, bool(self.final.value)
+
+    def wait(self, version=0, poll=0.1):
+        """Wait until the buffer is newer than `version`"""
+        while self.version.value <= version:
+            time.sleep(poll)
+
+
+def _train_layer(i, layer, data, inbuf, outbuf, results, n_epochs,
+                 refresh_every, final_epochs, batch_size, train_params):
+    train = layer.train_function(**train_params)
+    encode = layer.encode
+
+    if inbuf is None:
+        version, final = 0, True
+    else:
+        data = np.zeros(inbuf.shape, dtype=inbuf.dtype)
+        inbuf.wait()
+        version, final = inbuf.read(data)
+
+    epoch = 0
+    final_epoch = 0 if final else None
+    while (epoch < n_epochs or final_epoch is None
+           or epoch - final_epoch < final_epochs):
+        batches = data.reshape(-1, batch_size, data.shape[1])
+        costs = [train(batch) for batch in batches]
+        epoch += 1
+        print "Layer %d, epoch %d: %0.3f%s" % (
+            i, epoch, np.mean(costs), "" if final else " (input not final)")
+
+        if epoch % refresh_every == 0:
+            if outbuf is not None:
+                outbuf.publish(encode(data))
+            if not final and inbuf.version.value > version:
+                version, final = inbuf.read(data)
+                if final:
+                    final_epoch = epoch
+
+    if outbuf is not None:
+        outbuf.publish(encode(data), final=True)
+
+    results.put((i, [p.get_value() for p in (layer.W, layer.c, layer.b)]))
+
+
+def pipeline_pretrain(layers, data, n_epochs=10, refresh_every=1,
+                      final_epochs=None, batch_size=100, train_params=None):
+    """Pretrain a stack of layers in parallel (see module docstring)
+
+    Parameters
+    ----------
+    layers : list
+        The layers to train, bottom first. Their parameters are updated in
+        place when training finishes.
+    data : array_like (n_examples, n_vis)
+        Training data for the bottom layer.
+    n_epochs : int
+        Minimum number of epochs for each layer.
+    refresh_every : int
+        Number of epochs between publishing (and picking up) codes.
+    final_epochs : int
+        Minimum number of epochs trained on the final codes of the layer
+        below (default: `refresh_every`).
+    train_params : list of dict
+        Keyword arguments for each layer's `train_function` (e.g. `rate`).
+    """
+    n_layers = len(layers)
+    final_epochs = refresh_every if final_epochs is None else final_epochs
+    train_params = ([{}] * n_layers if train_params is None else train_params)
+    assert len(train_params) == n_layers
+
+    data = floatX(data)
+    buffers = [CodeBuffer((len(data), layer.n_hid), data.dtype)
+               for layer in layers[:-1]]
+    results = multiprocessing.Queue()
+
+    workers = []
+    for i, layer in enumerate(layers):
+        inbuf = buffers[i - 1] if i > 0 else None
+        outbuf = buffers[i] if i < n_layers - 1 else None
+        workers.append(multiprocessing.Process(
+            target=_train_layer,
+            args=(i, layer, data if i == 0 else None, inbuf, outbuf, results,
+                  n_epochs, refresh_every, final_epochs, batch_size,
+                  train_params[i])))
+
+    for worker in workers:
+        worker.start()
+
+    values = {}
+    try:
+        while len(values) < n_layers:
+            try:
+                i, params = results.get(timeout=1)
+                values[i] = params
+            except Queue.Empty:
+                failed = [i for i, w in enumerate(workers)
+                          if w.exitcode not in (None, 0)]
+                if failed:
+                    raise RuntimeError("Worker for layer %d failed" % failed[0])
+    finally:
+        for worker in workers:
+            if worker.is_alive() and len(values) < n_layers:
+                worker.terminate()
+            worker.join()
+
+    for i, layer in enumerate(layers):
+        for param, value in zip((layer.W, layer.c, layer.b), values[i]):
+            param.set_value(value)
+
+    return layers
@@ -0,0 +1,198 @@
+"""
+Helper functions for plotting when training autoencoders and RBMs.
+"""
+
+import os
+import struct
+import zlib
+
+import numpy as np
+import numpy.random as npr
+
+import matplotlib.pyplot as plt
+from matplotlib.collections import LineCollection
+from matplotlib.colors import colorConverter
+
+def display_available():
+    return ('DISPLAY' in os.environ)
+
+
+def show(image, ax=None, vlims=None, invert=False):
+    kwargs = dict(interpolation='none')
+    if image.ndim == 2:
+        kwargs['cmap'] = 'gray' if not invert else 'gist_yarg'
+        if vlims is not None:
+            kwargs['vmin'], kwargs['vmax'] = vlims
+    elif image.ndim == 3:
+        assert image.shape[2] == 3
+        if vlims is not None:
+            image = (image.clip(*vlims) - vlims[0]) / (vlims[1] - vlims[0])
+    else:
+        raise ValueError("Wrong number of image dimensions")
+
+    if ax is None: ax = plt.gca()
+    ax.imshow(image, **kwargs)
+    return ax
+
+
+def mosaic(images, rows, cols, inds=None):
+    """Arrange images (first axis) in a `rows` x `cols` grid, as one image"""
+    n_images = images.shape[0]
+    imshape = images.shape[1:]
+    k = min(rows*cols, n_images)
+    if inds is not None:
+        images = images[inds[:k]]
+
+    tiles = np.zeros((rows*cols,) + imshape, dtype=images.dtype)
+    tiles[:k] = images[:k]
+    tiles = tiles.reshape((rows, cols) + imshape)
+    tiles = tiles.swapaxes(1, 2)  # rows, m, cols, n [, channels]
+    return tiles.reshape((rows*imshape[0], cols*imshape[1]) + imshape[2:])
+
+
+def grid_lines(ax, img_shape, dy, dx, color='r', linewidth=1):
+    """Draw lines every `dy` rows and `dx` columns, as one LineCollection"""
+    h, w = img_shape[:2]
+    segments = [[(-0.5, y - 0.5), (w - 0.5, y - 0.5)]
+                for y in xrange(dy, h, dy)]
+    segments += [[(x - 0.5, -0.5), (x - 0.5, h - 0.5)]
+                 for x in xrange(dx, w, dx)]
+    ax.add_collection(
+        LineCollection(segments, colors=color, linewidths=linewidth))
+
+    ax.set_xlim([-0.5, w - 0.5])
+    ax.set_ylim([-0.5, h - 0.5])
+    ax.invert_yaxis()
+
+
+def write_png(filename, image, vlims=None, grid=None, gridcolor='r'):
+    """Write an image to a PNG file without a matplotlib figure
+
+    The image (2-D grey or 3-D RGB) is scaled from `vlims` (default: its
+    range) to 8 bits. `grid` is `(dy, dx)` to separate tiles of `dy` x `dx`
+    pixels with lines of `gridcolor`, one pixel wide, inserted between them
+    (so no image pixels are covered).
+    """
+    image = np.asarray(image, dtype=np.float64)
+    lo, hi = (image.min(), image.max()) if vlims is None else vlims
+    image = np.round(255 * (image.clip(lo, hi) - lo) / max(hi - lo, 1e-12))
+    image = image.astype(np.uint8)
+
+    if grid is not None:
+        if image.ndim == 2:
+            image = np.repeat(image[:, :, None], 3, axis=2)
+        color = np.round(255 * np.array(colorConverter.to_rgb(gridcolor)))
+        dy, dx = grid
+        h, w = image.shape[:2]
+        image = np.insert(image, np.arange(dy, h, dy), color, axis=0)
+        image = np.insert(image, np.arange(dx, w, dx), color, axis=1)
+
+    h, w = image.shape[:2]
+    color_type = 0 if image.ndim == 2 else 2  # grey or RGB
+    raw = np.zeros((h, 1 + image[0].size), dtype=np.uint8)  # filter 0
+    raw[:, 1:] = image.reshape(h, -1)
+
+    def chunk(kind, data):
+        crc = zlib.crc32(kind + data) & 0xffffffff
+        return struct.pack('>I', len(data)) + kind + data + struct.pack(
+            '>I', crc)
+
+    with open(filename, 'wb') as f:
+        f.write('\x89PNG\r\n\x1a\n')
+        f.write(chunk('IHDR', struct.pack(
+            '>IIBBBBB', w, h, 8, color_type, 0, 0, 0)))
+        f.write(chunk('IDAT', zlib.compress(raw.tostring(), 6)))
+        f.write(chunk('IEND', ''))
+
+
+def tile(images, ax=None, rows=16, cols=24, random=False,
+         grid=False, gridwidth=1, gridcolor='r', filename=None,
+         **show_params):
+    """
+    Plot tiled images to the current axis
+
+    :images Each row is one flattened image
+    :filename If given, write the tiled image to this PNG file instead
+    """
+
+    n_images = images.shape[0]
+    m, n = images.shape[1:3]
+
+    inds = None
+    if random:
+        inds = np.arange(n_images)
+        npr.shuffle(inds)
+
+    img = mosaic(images, rows, cols, inds=inds)
+
+    if filename is not None:
+        write_png(filename, img, vlims=show_params.get('vlims'),
+                  grid=(m, n) if grid else None, gridcolor=gridcolor)
+        return
+
+    ax = show(img, ax=ax, **show_params)
+    ax.xaxis.set_visible(False)
+    ax.yaxis.set_visible(False)
+
+    if grid:
+        grid_lines(ax, img.shape, m, n, color=gridcolor, linewidth=gridwidth)
+
+
+def compare(imagesetlist, ax=None, rows=5, cols=20, vlims=None, grid=True,
+            random=False, filename=None):
+    """
+    Plot image sets for comparison, each set one row below the previous one
+
+    :filename If given, write the tiled image to this PNG file instead
+    """
+    d = len(imagesetlist)
+
+    n_images = imagesetlist[0].shape[0]
+    imshape = imagesetlist[0].shape[1:]
+    m, n = imshape[:2]
+
+    inds = np.arange(n_images)
+    if random:
+        npr.shuffle(inds)
+    inds = inds[:min(rows*cols, n_images)]
+
+    # stack the sets so that each tile is `d` images high
+    dtype = imagesetlist[0].dtype
+    sets = np.concatenate(
+        [images[inds].astype(dtype, copy=False).reshape((-1, 1) + imshape)
+         for images in imagesetlist], axis=1)
+    sets = sets.reshape((-1, d*m) + imshape[1:])
+    img = mosaic(sets, rows, cols)
+
+    if filename is not None:
+        write_png(filename, img, vlims=vlims,
+                  grid=(d*m, n) if grid else None)
+        return
+
+    ax = show(img, ax=ax, vlims=vlims)
+
+    if grid:
+        grid_lines(ax, img.shape, d*m, n)
+
+
+def activations(acts, func, ax=None):
+    if ax is None:
+        ax = plt.gca()
+
+    N = acts.size
+    nbins = max(np.sqrt(N), 10)
+
+    minact, maxact = (-2, 2)
+    ax.hist(acts.ravel(), bins=nbins, range=(minact,maxact), normed=True)
+
+    x = np.linspace(minact, maxact, 101)
+    ax.plot(x, func(x))
+
+    ax.set_xlim([minact, maxact])
+
+
+def filters(filters, ax=None, **kwargs):
+    if filters.ndim == 4 and filters.shape[3] == 1:
+        filters = filters[..., 0]  # single-channel receptive fields
+    std = filters.std()
+    tile(filters, ax=ax, vlims=(-2*std, 2*std), grid=True, **kwargs)
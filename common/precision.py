@@ -0,0 +1,41 @@
+"""
+Global numerical precision policy for training.
+
+Parameters and data are stored in `theano.config.floatX`. Reductions over
+many terms (costs, mean activities) are accumulated in `acc_dtype` and then
+cast back, so a float32 model only pays for float64 where it matters. The
+L-BFGS optimizer state is always float64, regardless of this policy.
+
+Call `set_precision` before creating any models, e.g.
+
+    import precision
+    precision.set_precision('float32')
+"""
+import numpy as np
+
+import theano
+import theano.tensor as tt
+
+acc_dtype = 'float64'
+
+
+def set_precision(dtype='float32', acc='float64'):
+    """Set the storage dtype for parameters/data and the accumulation dtype"""
+    global acc_dtype
+    theano.config.floatX = dtype
+    acc_dtype = acc
+
+
+def floatX(x):
+    """Convert `x` to the storage dtype (no copy if already that dtype)"""
+    return np.asarray(x, dtype=theano.config.floatX)
+
+
+def mean(x, axis=None):
+    """Mean of `x` accumulated in `acc_dtype`, returned in the dtype of `x`"""
+    return tt.mean(x, axis=axis, dtype=x.dtype, acc_dtype=acc_dtype)
+
+
+def rms_error(x, y):
+    """Mean over examples of the RMS difference between rows of `x` and `y`"""
+    return mean(tt.sqrt(mean((x - y)**2, axis=1)))
@@ -0,0 +1,80 @@
+"""
+Inputs, biases and decisions for the spiking (Nengo) runs.
+
+The run scripts present each test image for `presentation_time` and decide
+on its class from the probed outputs. To keep the simulation loop lean:
+
+- `Presentation` feeds the images from a precomputed array, indexed by the
+  simulator step;
+- `folded_gain_bias` puts the layer biases into the LIF neurons' own bias
+  currents, instead of an extra `Node` and an `n x n` identity connection
+  per layer;
+- `step_correct`, `filtered` and `block_errors` compute the decisions
+  offline from a probe, instead of a Python `Node` called every step.
+"""
+import numpy as np
+
+import nengo
+
+
+class Presentation(object):
+    """Node output presenting each of `images` for `presentation_time`
+
+    The image for the simulator step `k` (starting at 0, at time
+    `(k + 1) * dt`) is `images[k // steps]`, matching `step_correct`.
+    """
+
+    def __init__(self, images, presentation_time, dt=1e-3):
+        self.images = np.asarray(images)
+        self.dt = dt
+        self.steps = steps_per_presentation(presentation_time, dt)
+
+    def __call__(self, t):
+        k = int(round(t / self.dt)) - 1
+        return self.images[(k // self.steps) % len(self.images)]
+
+
+def steps_per_presentation(presentation_time, dt=1e-3):
+    return int(round(presentation_time / dt))
+
+
+def folded_gain_bias(neuron_type, max_rates, intercepts, b):
+    """Gains and biases for an `Ensemble` whose neurons also get the input `b`
+
+    Equivalent to connecting a constant `b` to `ensemble.neurons` (which
+    Nengo scales by the gains), without the connection.
+    """
+    gain, bias = neuron_type.gain_bias(np.asarray(max_rates, dtype=float),
+                                       np.asarray(intercepts, dtype=float))
+    return gain, bias + gain * b
+
+
+def presented(labels, n_steps, steps):
+    """The label presented at each step; step `k` presents image `k // steps`"""
+    return labels[np.arange(n_steps) // steps]
+
+
+def step_correct(y, labels, classes, steps):
+    """Whether the largest output of `y` (n_steps, n_classes) is the label
+
+    `labels` are those of the presented images and `classes` the class of
+    each output.
+    """
+    return classes[np.argmax(y, axis=1)] == presented(labels, len(y), steps)
+
+
+def filtered(correct, synapse=0.01, dt=1e-3):
+    """Per-step correctness filtered with `synapse`, as a probe on it would be
+
+    Like the probe, the result lags the input by one step. The error windows
+    of `block_errors` are judged on this smoothed signal.
+    """
+    y = nengo.synapses.filt(np.asarray(correct, dtype=float), synapse, dt)
+    return np.concatenate([[0.], y[:-1]])
+
+
+def block_errors(correct, steps, start):
+    """Presentations correct for less than half of the steps from `start` on"""
+    n = len(correct) // steps
+    blocks = correct[:n * steps].reshape(n, steps)[:, start:]
+    return blocks.mean(axis=1) < 0.5
@@ -0,0 +1,170 @@
+"""
+Per-phase profiling of the training methods.
+
+Training methods take a `profile` argument: `True` (print a report at the
+end of the method), a `Profiler` (to set options or collect the reports of
+several methods), or None to disable profiling. The methods time their
+phases (Theano compilation, the compiled steps, host-side batching,
+`check_params`, validation, checkpointing, plotting, L-BFGS overhead) and
+record the throughput of each epoch:
+
+    profiler = Profiler(theano_profile=True, filename='profile.jsonl')
+    auto.auto_sgd(images, n_epochs=5, profile=profiler)
+    deep.sgd(train, test, n_epochs=5, profile=profiler)
+
+Each report is printed, kept in `profiler.reports`, and, if `filename` is
+given, appended to that file as one JSON line. With `theano_profile`, the
+compiled functions also collect Theano's own profile (`profile=True` in
+`theano.function`), whose summary is printed with the report.
+"""
+import collections
+import json
+import time
+
+
+class _Phase(object):
+    __slots__ = ['profiler', 'name', 't']
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.t = time.time()
+
+    def __exit__(self, *args):
+        self.profiler.add(self.name, time.time() - self.t)
+
+
+class _NullPhase(object):
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *args):
+        pass
+
+
+class NullProfiler(object):
+    """Does nothing; used when profiling is off"""
+
+    _phase = _NullPhase()
+
+    def begin(self, method):
+        return self
+
+    def phase(self, name):
+        return self._phase
+
+    def add(self, name, t, calls=1):
+        pass
+
+    def theano(self, name):
+        return False
+
+    def begin_epoch(self):
+        pass
+
+    def end_epoch(self, n_samples):
+        pass
+
+    def end(self):
+        pass
+
+
+class Profiler(object):
+
+    def __init__(self, theano_profile=False, filename=None, verbose=True):
+        self.theano_profile = theano_profile
+        self.filename = filename
+        self.verbose = verbose
+        self.reports = []
+
+    def begin(self, method):
+        """Start profiling the training method `method`"""
+        self.method = method
+        self.times = collections.OrderedDict()
+        self.calls = collections.defaultdict(int)
+        self.epochs = []
+        self.profiles = []
+        self.t_begin = self.t_epoch = time.time()
+        return self
+
+    def phase(self, name):
+        """Context manager that adds its wall time to the phase `name`"""
+        return _Phase(self, name)
+
+    def add(self, name, t, calls=1):
+        self.times[name] = self.times.get(name, 0.) + t
+        self.calls[name] += calls
+
+    def theano(self, name):
+        """Value for the `profile` argument of `theano.function`"""
+        if not self.theano_profile:
+            return False
+
+        from theano.compile.profiling import ProfileStats
+        stats = ProfileStats(message='%s: %s' % (self.method, name))
+        self.profiles.append(stats)
+        return stats
+
+    def begin_epoch(self):
+        self.t_epoch = time.time()
+
+    def end_epoch(self, n_samples):
+        t = time.time() - self.t_epoch
+        self.epochs.append(dict(epoch=len(self.epochs), time=t,
+                                samples=n_samples,
+                                samples_per_sec=n_samples / max(t, 1e-12)))
+
+    def end(self):
+        """Finish the method's report; print and save it"""
+        total = time.time() - self.t_begin
+        phases = collections.OrderedDict(
+            (name, dict(time=t, calls=self.calls[name], fraction=t / total))
+            for name, t in self.times.items())
+        other = total - sum(self.times.values())
+        report = dict(method=self.method, total=total, phases=phases,
+                      other=other, epochs=self.epochs)
+        self.reports.append(report)
+
+        if self.verbose:
+            print self.format(report)
+            for stats in self.profiles:
+                if stats.fct_callcount > 0:
+                    stats.summary()
+        if self.filename is not None:
+            with open(self.filename, 'a') as f:
+                f.write(json.dumps(report) + '\n')
+        return report
+
+    @staticmethod
+    def format(report):
+        lines = ["--- profile of %s: %0.3f s" % (
+            report['method'], report['total'])]
+        lines.append("%-16s %10s %8s %8s" % ('phase', 'time [s]', 'calls', '%'))
+        rows = report['phases'].items() + [
+            ('(other)', dict(time=report['other'], calls=0,
+                             fraction=report['other'] / report['total']))]
+        for name, p in rows:
+            lines.append("%-16s %10.3f %8d %7.1f%%" % (
+                name, p['time'], p['calls'], 100 * p['fraction']))
+
+        if len(report['epochs']) > 0:
+            speeds = [e['samples_per_sec'] for e in report['epochs']]
+            lines.append("epochs: %d, %0.0f samples/s (min %0.0f, max %0.0f)"
+                         % (len(speeds), sum(e['samples'] for e in report['epochs'])
+                            / sum(e['time'] for e in report['epochs']),
+                            min(speeds), max(speeds)))
+        return '\n'.join(lines)
+
+
+def get_profiler(profile, method):
+    """The profiler for a training method's `profile` argument, begun"""
+    if profile is None or profile is False:
+        profiler = NullProfiler()
+    elif profile is True:
+        profiler = Profiler()
+    else:
+        profiler = profile
+    return profiler.begin(method)
@@ -0,0 +1,61 @@
+"""
+Nengo connections for mostly zero weight matrices.
+
+First-layer weights are masked to receptive fields (see `masks.py`), so
+about 90% of their entries are zero, and unrolled convolutional layers
+(`conv.dense_weights`) are sparser still. Nengo 2.0 builds each connection
+transform as a dense matrix product, and cannot slice connections into
+neurons, so `connect` computes sparse products in a `Node` holding a CSR
+matrix instead. The step cost and build memory then scale with the number
+of nonzeros, and the spikes are the same as with the dense transform.
+
+The `Node` is a Python call every step, though, which only pays off for
+large, sparse matrices. With the reference simulator, a masked 784 x 500
+first layer (10% dense) takes 128 us/step through a `Node` against
+248 us/step dense, but 500 x 200 and smaller matrices are as fast or
+faster as `nengo.Connection`s even at 2-10% density; hence the defaults
+below. For the 784-500-200-50 network (the `nengo_masked_*` benchmarks in
+`benchmarks.py`), a step takes 448 us dense, 321 us with `connect`, and
+495 us with a `Node` for every layer.
+"""
+import numpy as np
+import scipy.sparse
+
+import nengo
+
+
+def density(transform):
+    """Fraction of nonzero entries"""
+    return np.count_nonzero(transform) / float(np.size(transform))
+
+
+class SparseProduct(object):
+    """Node output `A x`, with `A` stored as a CSR matrix"""
+
+    def __init__(self, transform):
+        self.A = scipy.sparse.csr_matrix(transform)
+
+    def __call__(self, t, x):
+        return self.A.dot(x)
+
+
+def connect(pre, post, transform, synapse=None, max_density=0.25,
+            min_size=200000, label=None):
+    """Like `nengo.Connection(pre, post, transform=..., synapse=...)`
+
+    If the matrix `transform` has at least `min_size` entries, and at most
+    `max_density` of them are nonzero, `pre` feeds a `Node` computing the
+    product (with no synapse), which is connected to `post` through
+    `synapse`. Otherwise this is a plain `nengo.Connection`. Returns the
+    connection into `post`.
+    """
+    transform = np.asarray(transform)
+    if (transform.ndim < 2 or transform.size < min_size
+            or density(transform) > max_density):
+        return nengo.Connection(pre, post, transform=transform, synapse=synapse)
+
+    n_out, n_in = transform.shape
+    node = nengo.Node(output=SparseProduct(transform), size_in=n_in,
+                      size_out=n_out, label=label)
+    nengo.Connection(pre, node, synapse=None)
+    return nengo.Connection(node, post, synapse=synapse)
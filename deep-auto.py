@@ -27,6 +27,7 @@ import nengo
 import nengo.utils.distributions as dists
 
 import plotting
+from solvers import Covariance, chunks, lstsq_l2, randomized_eigh
 
 
 def norm(x, **kwargs):
@@ -154,27 +155,31 @@ class RBM(object):
             if param is not None:
                 assert np.isfinite(param.get_value()).all()
 
-    def statistical_encoders(self, data):
-        x = data - data.mean(0)
-        corr = np.dot(x.T, x) / x.shape[0]
-
-        w, v = np.linalg.eigh(corr)
+    def statistical_encoders(self, data, rank=None, chunk_size=10000):
+        """Random encoders with the same correlations as the data
+
+        If `rank` is given, only the top `rank` principal components of the
+        data are used, found with a randomized eigendecomposition.
+        """
+        cov = Covariance(self.n_vis)
+        for x in chunks(data, chunk_size):
+            cov.add(x)
+        corr = cov.cov
+
+        if rank is None:
+            w, v = np.linalg.eigh(corr)
+        else:
+            w, v = randomized_eigh(corr, rank)
         # plt.figure(1)
         # plt.clf()
         # plt.plot(w)
         # # plt.show()
 
-        c2 = np.dot(v * w[None,:], v.T)
-        # i, j = 300, 305
-        # print corr[i:j,i:j]
-        # print c2[i:j,i:j]
-        assert np.allclose(corr, c2, atol=1e-6)
-
         # gamma = np.linalg.cholesky(corr)
         w = np.sqrt(np.maximum(w, 0))
         gamma = w[:,None] * v.T
 
-        encoders = np.random.normal(size=(self.n_hid, self.n_vis))
+        encoders = np.random.normal(size=(self.n_hid, len(w)))
         encoders = np.dot(encoders, gamma)
 
         # plt.figure(1)
@@ -189,10 +194,9 @@ class RBM(object):
 
     # def pretrain(self, batches, dbn=None, test_images=None,
     #              n_epochs=10, **train_params):
-    def pretrain(self, images):
-        acts = self.encode(images)
-        solver = nengo.decoders.LstsqL2()
-        decoders, info = solver(acts, images)
+    def pretrain(self, images, reg=0.1, chunk_size=10000):
+        decoders, info = lstsq_l2(
+            self.encode, images, reg=reg, chunk_size=chunk_size)
 
         decoders = decoders.astype(theano.config.floatX)
         self.decoders = theano.shared(decoders, name='decoders')
@@ -442,7 +446,7 @@ assert len(rf_shapes) == n_layers
 
 dbn = DBN()
 # data = train_images[:1000]
-data = train_images[:10000]
+data = train_images
 valid_images = valid_images[:1000]
 for i in range(n_layers):
 
@@ -13,6 +13,8 @@ import matplotlib.pyplot as plt
 plt.ion()
 
 import plotting
+from online import PESLearner
+from solvers import lstsq_l2
 
 import nengo
 # from nengo.utils.distributions import UniformHypersphere
@@ -69,8 +71,7 @@ def encode(x):
     return neurons.rates(np.dot(x, weights), gain, bias)
 
 # --- determine initial decoders
-x = train_images[:1000]
-decoders, _ = nengo.decoders.LstsqL2()(encode(x), x)
+decoders, _ = lstsq_l2(encode, train_images)
 
 # x = train_images[:1000]
 # A = encode(x)
@@ -90,20 +91,19 @@ decoders, _ = nengo.decoders.LstsqL2()(encode(x), x)
 
 # --- train the network
 n_epochs = 1
-batch_size = 1
-
-# batches = train_images.reshape(-1, batch_size, train_images.shape[1])
-batches = train_images[None, :, :]
+batch_size = 100
+test_x = test_images[:200]  # cached test subset
 
 w_rate = 0.0001
 # d_rate = 0.0000001
 d_rate = 0.00000001
 
+learner = PESLearner(weights, decoders, neurons, gain, bias, mask=mask,
+                     w_rate=w_rate, d_rate=d_rate, batch_size=batch_size)
+
 def test(x):
     # test error
-    # x = test_images[:200]
-    a = encode(x)
-    xhat = np.dot(a, decoders)
+    xhat = np.dot(learner.encode(x), decoders)
 
     plt.figure(99)
     plt.clf()
@@ -115,29 +115,9 @@ def test(x):
 
     print "error", rms(xhat - x, axis=1).mean()
 
-test(test_images[:200])
-
-
-for i in range(n_epochs):
-    for x in batches:
-
-        a = encode(x)
-        # print a.mean()
-        xhat = np.dot(a, decoders)
-        x_err = xhat - x
-
-        # update weights
-        a_err = np.dot(x_err, weights)
-        d_weights = -(w_rate / batch_size) * np.dot(x.T, a_err)
-        # weights += d_weights
-
-        # update decoders
-        d_decoders = -(d_rate / batch_size) * np.dot(a.T, x_err)
-        decoders += d_decoders
-
-        # x = train_images[:1000]
-        # decoders, _ = nengo.decoders.LstsqL2()(encode(x), x)
+test(test_x)
 
-        test(test_images[:200])
+learner.train(train_images, n_epochs=n_epochs, test_images=test_x,
+              test_every=100)
 
-        # raw_input("key?")
+test(test_x)
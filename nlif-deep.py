@@ -681,14 +681,13 @@ if 0:
 
 if 0:
     # Try to learn linear reconstructor (doesn't work too well)
-    import nengo
+    from solvers import lstsq_l2
 
-    codes = deep.encode(train_images)
-    decoders, info = nengo.decoders.LstsqL2()(codes, train_images)
+    decoders, info = lstsq_l2(deep.encode, train_images)
     print info['rmses'].mean()
 
-    recons = np.dot(codes, decoders)
-    print rms(train_images - recons, axis=1).mean()
+    recons = np.dot(deep.encode(test_images), decoders)
+    print rms(test_images - recons, axis=1).mean()
 
     plt.figure(99)
     plt.clf()
@@ -0,0 +1,144 @@
+"""
+Online (PES-like) learning of LIF encoders and decoders.
+
+`PESLearner` trains a one-layer LIF autoencoder on mini-batches. For each
+batch, the reconstruction error `x_err = xhat - x` drives both the decoder
+update (PES: `-d_rate * a^T x_err`) and the encoder update (the error
+projected onto the encoders, `-w_rate * x^T (x_err W)`). Both updates are
+computed from the parameters before the step, and then applied in place.
+
+All intermediate arrays are preallocated for the batch size, and the LIF
+rates are computed in place, so a training step allocates no large arrays.
+"""
+import time
+
+import numpy as np
+
+
+class PESLearner(object):
+    """
+    Parameters
+    ----------
+    encoders : array (n_vis, n_hid)
+        Encoding weights (updated in place), without the gains. The input
+        current is `gain * x.dot(encoders) + bias`.
+    decoders : array (n_hid, n_vis)
+        Decoding weights (updated in place).
+    neurons : nengo.LIF
+        Provides `tau_rc` and `tau_ref` for the rate approximation.
+    gain, bias : arrays (n_hid,)
+    mask : array (n_vis, n_hid)
+        If given, encoder updates are masked (receptive fields stay local).
+    """
+
+    def __init__(self, encoders, decoders, neurons, gain, bias, mask=None,
+                 w_rate=1e-4, d_rate=1e-8, batch_size=100):
+        self.encoders = encoders
+        self.decoders = decoders
+        self.tau_rc = neurons.tau_rc
+        self.tau_ref = neurons.tau_ref
+        self.gain = gain
+        self.bias = bias
+        self.mask = mask
+        self.w_rate = w_rate
+        self.d_rate = d_rate
+        self.batch_size = batch_size
+
+        n_vis, n_hid = encoders.shape
+        assert decoders.shape == (n_hid, n_vis)
+        dtype = encoders.dtype
+        self._J = np.zeros((batch_size, n_hid), dtype=dtype)
+        self._A = np.zeros((batch_size, n_hid), dtype=dtype)
+        self._xhat = np.zeros((batch_size, n_vis), dtype=dtype)
+        self._a_err = np.zeros((batch_size, n_hid), dtype=dtype)
+        self._dW = np.zeros_like(encoders)
+        self._dD = np.zeros_like(decoders)
+
+    def rates(self, x, J, out):
+        """LIF rates for inputs `x`, using `J` as a buffer for the currents"""
+        np.dot(x, self.encoders, out=J)
+        J *= self.gain
+        J += self.bias
+        J -= 1
+        np.maximum(J, 0, out=J)
+
+        # 1 / (tau_ref + tau_rc * log1p(1 / j)), which is zero for j == 0
+        with np.errstate(divide='ignore'):
+            np.divide(1., J, out=out)
+        np.log1p(out, out=out)
+        out *= self.tau_rc
+        out += self.tau_ref
+        np.divide(1., out, out=out)
+        return out
+
+    def encode(self, x):
+        n = len(x)
+        J = np.zeros((n, self.encoders.shape[1]), dtype=self.encoders.dtype)
+        return self.rates(x, J, J)
+
+    def step(self, x):
+        """Update the encoders and decoders on the batch `x`
+
+        Returns the sum of squared reconstruction errors of the batch.
+        """
+        n = len(x)
+        assert n <= self.batch_size
+        x = np.asarray(x, dtype=self.encoders.dtype)
+        A = self.rates(x, self._J[:n], self._A[:n])
+        x_err = self._xhat[:n]
+        np.dot(A, self.decoders, out=x_err)
+        x_err -= x
+        sq_err = np.dot(x_err.ravel(), x_err.ravel())
+
+        if self.w_rate > 0:
+            a_err = self._a_err[:n]
+            np.dot(x_err, self.encoders, out=a_err)
+            np.dot(x.T, a_err, out=self._dW)
+            self._dW *= self.w_rate / n
+            if self.mask is not None:
+                self._dW *= self.mask
+
+        np.dot(A.T, x_err, out=self._dD)
+        self._dD *= self.d_rate / n
+
+        if self.w_rate > 0:
+            self.encoders -= self._dW
+        self.decoders -= self._dD
+        return sq_err
+
+    def error(self, x):
+        """Mean RMS reconstruction error over the examples in `x`"""
+        xhat = np.dot(self.encode(x), self.decoders)
+        return np.sqrt(((xhat - x)**2).mean(axis=1)).mean()
+
+    def train(self, images, n_epochs=1, test_images=None, test_every=100,
+              rng=None):
+        """Train on `images` for `n_epochs`, in mini-batches
+
+        The error on `test_images` (keep this a small cached subset) is
+        printed every `test_every` batches and at the end of each epoch,
+        along with the training throughput in samples per second.
+        """
+        n, n_vis = images.shape
+        bs = self.batch_size
+        for epoch in range(n_epochs):
+            order = rng.permutation(n) if rng is not None else None
+            t0 = time.time()
+            t_test = 0.
+            sq_err = 0.
+            for k, i in enumerate(xrange(0, n, bs)):
+                x = images[i:i + bs] if order is None else images[order[i:i + bs]]
+                sq_err += self.step(x)
+
+                if test_images is not None and (k + 1) % test_every == 0:
+                    t = time.time()
+                    print "Batch %d: test error %0.4f" % (
+                        k + 1, self.error(test_images))
+                    t_test += time.time() - t
+
+            speed = n / (time.time() - t0 - t_test)
+            print "Epoch %d: train rms %0.4f, %0.0f samples/s" % (
+                epoch, np.sqrt(sq_err / (n * n_vis)), speed)
+            if test_images is not None:
+                print "Epoch %d: test error %0.4f" % (
+                    epoch, self.error(test_images))
@@ -0,0 +1,56 @@
+"""
+Compare serial and Hogwild (lock-free, multi-process) RBM pretraining.
+
+Trains the first layer of the DBN (sparse receptive fields) serially with
+`RBM.pretrain` and with `RBM.pretrain_hogwild` for increasing numbers of
+workers, and reports the training throughput and the final reconstruction
+error on the test set.
+"""
+import multiprocessing
+import time
+
+import numpy as np
+
+from datasets import mnist
+from rbm import RBM, DBN
+
+n_train = 20000
+n_epochs = 5
+batch_size = 100
+rate = 0.1
+worker_counts = [n for n in [1, 2, 4, 8, 16]
+                 if n <= multiprocessing.cpu_count()]
+
+# --- load the data
+train, valid, test = mnist()
+
+train_images = train[0][:n_train]
+test_images = test[0]
+batches = train_images.reshape(-1, batch_size, train_images.shape[1])
+
+
+def recons_error(rbm):
+    recons = DBN([rbm]).reconstruct(test_images.astype(rbm.dtype))
+    return np.sqrt(((test_images - recons)**2).mean(axis=1)).mean()
+
+
+def run(n_workers=None):
+    rbm = RBM((28, 28), 500, rf_shape=(9, 9))
+    t = time.time()
+    if n_workers is None:
+        rbm.pretrain(batches, n_epochs=n_epochs, rate=rate)
+    else:
+        rbm.pretrain_hogwild(batches, n_workers=n_workers,
+                             n_epochs=n_epochs, rate=rate)
+    t = time.time() - t
+    return n_epochs * n_train / t, recons_error(rbm)
+
+
+results = [('serial', run())]
+results.extend(('hogwild x%d' % n, run(n)) for n in worker_counts)
+
+serial_rate = results[0][1][0]
+print "%-12s %12s %8s %12s" % ('mode', 'examples/s', 'speedup', 'test error')
+for name, (speed, error) in results:
+    print "%-12s %12.0f %8.2f %12.4f" % (
+        name, speed, speed / serial_rate, error)
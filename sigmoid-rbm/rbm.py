@@ -0,0 +1,786 @@
+"""
+Restricted Boltzmann machines and deep belief networks in Theano.
+
+Based off the demo code at
+    http://www.cs.toronto.edu/~hinton/MatlabForSciencePaper.html
+"""
+
+import collections
+import multiprocessing
+import Queue
+import time
+
+import numpy as np
+import matplotlib.pyplot as plt
+import scipy.optimize
+
+import theano
+import theano.tensor as tt
+import theano.sandbox.rng_mrg
+
+from classifiers import Vocabulary
+import conv
+from early_stopping import StopTraining
+from masks import rf_filter_shape, sparse_mask
+import modelfile
+from parallel import SharedVector
+import plotting
+from precision import floatX, mean, rms_error
+from profiling import get_profiler
+
+
+def norm(x, **kwargs):
+    return np.sqrt((x**2).sum(**kwargs))
+
+
+class RBM(object):
+
+    # constructor arguments saved in the model file config
+    config_keys = ['vis_shape', 'n_hid', 'rf_shape', 'hidlinear', 'seed']
+
+    # --- define RBM parameters
+    def __init__(self, vis_shape, n_hid,
+                 W=None, c=None, b=None, mask=None,
+                 rf_shape=None, hidlinear=False, seed=22, tiled=False):
+        self.dtype = theano.config.floatX
+
+        self.vis_shape = vis_shape if isinstance(vis_shape, tuple) else (vis_shape,)
+        self.n_vis = np.prod(vis_shape)
+        self.n_hid = n_hid
+        # self.gaussian = gaussian
+        self.hidlinear = hidlinear
+        self.seed = seed
+
+        rng = np.random.RandomState(seed=self.seed)
+        self.theano_rng = theano.sandbox.rng_mrg.MRG_RandomStreams(seed=self.seed)
+
+        # create initial weights and biases
+        if W is None:
+            Wmag = 4 * np.sqrt(6. / (self.n_vis + self.n_hid))
+            W = rng.uniform(
+                low=-Wmag, high=Wmag, size=(self.n_vis, self.n_hid)
+            ).astype(self.dtype)
+
+        if c is None:
+            c = np.zeros(self.n_hid, dtype=self.dtype)
+
+        if b is None:
+            b = np.zeros(self.n_vis, dtype=self.dtype)
+
+        # create initial sparsity mask
+        self.rf_shape = rf_shape
+        self.mask = mask
+        if rf_shape is not None and mask is None:
+            self.mask = sparse_mask(vis_shape, n_hid, rf_shape, tiled=tiled,
+                                    rng=rng)
+            W = W * self.mask  # make initial W sparse
+
+        # create states for weights and biases
+        W = W.astype(self.dtype)
+        c = c.astype(self.dtype)
+        b = b.astype(self.dtype)
+
+        self.W = theano.shared(W, name='W')
+        self.c = theano.shared(c, name='c')
+        self.b = theano.shared(b, name='b')
+
+        # create states for initial increments (for momentum)
+        self.Winc = theano.shared(np.zeros_like(W), name='Winc')
+        self.cinc = theano.shared(np.zeros_like(c), name='cinc')
+        self.binc = theano.shared(np.zeros_like(b), name='binc')
+
+    def save(self, filename):
+        tensors, config = {}, {}
+        for k, v in self.__dict__.items():
+            if k in ['W', 'c', 'b']:
+                tensors[k] = v.get_value()
+            elif k == 'mask' and v is not None:
+                tensors[k] = v
+            elif k in self.config_keys:
+                config[k] = v
+        modelfile.save(filename, tensors, config=config, cls=self.__class__)
+
+    @classmethod
+    def load(cls, filename):
+        if modelfile.is_model_file(filename):
+            f = modelfile.ModelFile(filename)
+            if f.cls is not None and issubclass(f.cls, cls):
+                cls = f.cls  # e.g. load a `ConvRBM` with `RBM.load`
+            d = dict(f.config)
+            d.update((k, f[k]) for k in f.names)
+        else:
+            d = np.load(filename)['dict'].item()
+        return cls(**d)
+
+    @property
+    def filters(self):
+        if self.mask is None:
+            return self.W.get_value().T.reshape((self.n_hid,) + self.vis_shape)
+        else:
+            filters = self.W.get_value().T[self.mask.T]
+            shape = (self.n_hid,) + rf_filter_shape(self.vis_shape, self.rf_shape)
+            return filters.reshape(shape)
+
+    def dense_weights(self):
+        """Encoding weights `(n_vis, n_hid)` and biases, e.g. for export"""
+        return self.W.get_value(), self.c.get_value()
+
+    # --- define RBM propagation functions
+    def probHgivenV(self, vis):
+        x = tt.dot(vis, self.W) + self.c
+        if self.hidlinear:
+            return x
+        else:
+            return tt.nnet.sigmoid(x)
+
+    def probVgivenH(self, hid):
+        x = tt.dot(hid, self.W.T) + self.b
+        return tt.nnet.sigmoid(x)
+
+    def sampHgivenV(self, vis):
+        hidprob = self.probHgivenV(vis)
+        if self.hidlinear:
+            hidsamp = hidprob + self.theano_rng.normal(
+                size=hidprob.shape, dtype=self.dtype)
+        else:
+            hidsamp = self.theano_rng.binomial(
+                size=hidprob.shape, n=1, p=hidprob, dtype=self.dtype)
+        return hidprob, hidsamp
+
+    # --- define RBM updates
+    def vis_hid_stats(self, vis, hid):
+        """Mean products of visible and hidden units, shaped like `W`"""
+        return tt.dot(vis.T, hid) / tt.cast(vis.shape[0], self.dtype)
+
+    def hid_stats(self, hid):
+        """Mean hidden activities, shaped like `c`"""
+        return mean(hid, axis=0)
+
+    def get_cost_updates(self, data, rate=0.1, weightcost=2e-4, momentum=0.5):
+
+        rate = tt.cast(rate, self.dtype)
+        weightcost = tt.cast(weightcost, self.dtype)
+        momentum = tt.cast(momentum, self.dtype)
+
+        # compute positive phase
+        poshidprob, poshidsamp = self.sampHgivenV(data)
+
+        posprods = self.vis_hid_stats(data, poshidprob)
+        posvisact = mean(data, axis=0)
+        poshidact = self.hid_stats(poshidprob)
+
+        # compute negative phase
+        negdata = self.probVgivenH(poshidsamp)
+        neghidprob = self.probHgivenV(negdata)
+        negprods = self.vis_hid_stats(negdata, neghidprob)
+        negvisact = mean(negdata, axis=0)
+        neghidact = self.hid_stats(neghidprob)
+
+        # compute error
+        err = rms_error(data, negdata)
+
+        # compute updates
+        Winc = momentum * self.Winc + rate * (
+            (posprods - negprods) - weightcost * self.W)
+        cinc = momentum * self.cinc + rate * (poshidact - neghidact)
+        binc = momentum * self.binc + rate * (posvisact - negvisact)
+
+        if self.mask is not None:
+            Winc = Winc * self.mask
+
+        updates = [
+            (self.W, self.W + Winc),
+            (self.c, self.c + cinc),
+            (self.b, self.b + binc),
+            (self.Winc, Winc),
+            (self.cinc, cinc),
+            (self.binc, binc)
+        ]
+
+        return err, updates
+
+    @property
+    def encode(self):
+        data = tt.matrix('data', dtype=self.dtype)
+        code = self.probHgivenV(data)
+        return theano.function([data], code)
+
+    def train_function(self, profile=False, **train_params):
+        """Compile one contrastive divergence step, returning the batch error"""
+        data = tt.matrix('data', dtype=self.dtype)
+        cost, updates = self.get_cost_updates(data, **train_params)
+        return theano.function([data], cost, updates=updates, profile=profile)
+
+    def error_function(self):
+        """Compile the (noise-free) reconstruction error of a batch"""
+        data = tt.matrix('data', dtype=self.dtype)
+        recons = self.probVgivenH(self.probHgivenV(data))
+        return theano.function([data], rms_error(data, recons))
+
+    def pretrain(self, batches, dbn=None, test_images=None,
+                 n_epochs=10, checkpoint=None, valid_images=None,
+                 early_stopping=None, profile=None, **train_params):
+        """Train with contrastive divergence
+
+        If `checkpoint` is a `Checkpointer`, the parameters and the momentum
+        increments are checkpointed every `checkpoint.every` epochs (with the
+        state of `early_stopping`, if given), and training resumes after the
+        epoch of the latest checkpoint.
+
+        If `valid_images` are given, the reconstruction error on them is
+        printed after each epoch and, if `early_stopping` is an
+        `EarlyStopping`, used to stop training (and decay the learning rate
+        on plateaus). The best parameters are restored at the end.
+
+        `profile` is True or a `Profiler` to time the phases of training
+        (see `profiling.py`).
+        """
+        prof = get_profiler(profile, 'RBM.pretrain')
+        rate = None
+        if early_stopping is not None:
+            assert valid_images is not None
+            early_stopping.reset()
+            rate0 = train_params.get('rate', 0.1)
+            rate = theano.shared(np.asarray(rate0, dtype=self.dtype),
+                                 name='rate')
+            train_params['rate'] = rate
+
+        with prof.phase('compile'):
+            train_rbm = self.train_function(
+                profile=prof.theano('train'), **train_params)
+        batches = floatX(batches)
+        if test_images is not None:
+            test_images = floatX(test_images)
+        if valid_images is not None:
+            valid_images = floatX(valid_images)
+            with prof.phase('compile'):
+                valid_error = self.error_function()
+
+        state_vars = [self.W, self.c, self.b, self.Winc, self.cinc, self.binc]
+        start = 0
+        if checkpoint is not None:
+            state = checkpoint.restore_shared(
+                state_vars, early_stopping=early_stopping)
+            if state is not None:
+                start = state['step'] + 1
+                if early_stopping is not None:
+                    rate.set_value(np.asarray(
+                        early_stopping.rate_scale * rate0, dtype=self.dtype))
+
+        for epoch in range(start, n_epochs):
+            prof.begin_epoch()
+
+            # train on each mini-batch
+            costs = []
+            for batch in batches:
+                with prof.phase('step'):
+                    costs.append(train_rbm(batch))
+            prof.end_epoch(batches.shape[0] * batches.shape[1])
+
+            print "Epoch %d: %0.3f" % (epoch, np.mean(costs))
+
+            stop = False
+            if valid_images is not None:
+                with prof.phase('validation'):
+                    verror = valid_error(valid_images)
+                print "Validation error: %0.4f" % verror
+                if early_stopping is not None:
+                    stop = early_stopping.update(epoch, verror, state_vars)
+                    rate.set_value(np.asarray(
+                        early_stopping.rate_scale * rate0, dtype=self.dtype))
+
+            if checkpoint is not None and checkpoint.due(epoch):
+                with prof.phase('checkpoint'):
+                    checkpoint.save_shared(epoch, state_vars,
+                                           early_stopping=early_stopping)
+            if stop:
+                break
+
+            with prof.phase('plotting'):
+                if dbn is not None and test_images is not None:
+                    # plot reconstructions on test set
+                    plt.figure(2)
+                    plt.clf()
+                    recons = dbn.reconstruct(test_images)
+                    shape = (-1,) + dbn.rbms[0].vis_shape
+                    plotting.compare([test_images.reshape(shape),
+                                      recons.reshape(shape)],
+                                     rows=5, cols=20)
+                    plt.draw()
+
+                # plot filters for first layer only
+                if dbn is not None and self is dbn.rbms[0]:
+                    plt.figure(3)
+                    plt.clf()
+                    plotting.filters(self.filters, rows=10, cols=20)
+                    plt.draw()
+
+        if checkpoint is not None:
+            with prof.phase('checkpoint'):
+                checkpoint.wait()
+        if early_stopping is not None:
+            early_stopping.restore(state_vars)
+        prof.end()
+
+    def _hogwild_work(self, k, state, batches, n_epochs, results,
+                      train_params):
+        views = state.views()
+        shared = [self.W, self.c, self.b, self.Winc, self.cinc, self.binc]
+        for var, value in zip(shared, views):
+            var.set_value(value, borrow=True)
+        W, c, b, Winc, cinc, binc = views
+
+        # compute the increments with Theano, but apply them in place
+        self.theano_rng.seed(self.seed + 1 + k)
+        data = tt.matrix('data', dtype=self.dtype)
+        cost, updates = self.get_cost_updates(data, **train_params)
+        updates = dict(updates)
+        step = theano.function(
+            [data], [cost, updates[self.Winc], updates[self.cinc],
+                     updates[self.binc]])
+
+        for epoch in range(n_epochs):
+            costs = []
+            for batch in batches:
+                cost, dW, dc, db = step(batch)
+                Winc[...] = dW
+                cinc[...] = dc
+                binc[...] = db
+                W += dW
+                c += dc
+                b += db
+                costs.append(cost)
+
+            results.put((epoch, k, np.mean(costs)))
+
+    def pretrain_hogwild(self, batches, n_workers=2, n_epochs=10,
+                         **train_params):
+        """Train with contrastive divergence on several processes at once
+
+        The parameters and momentum increments are kept in shared memory,
+        and each worker applies CD updates from its share of the batches
+        without any locking ("Hogwild"). Updates from different workers
+        can overwrite each other; with sparse receptive fields, most
+        updates touch different weights.
+        """
+        batches = floatX(batches)
+        shared = [self.W, self.c, self.b, self.Winc, self.cinc, self.binc]
+        state = SharedVector([v.get_value(borrow=True).shape for v in shared],
+                             self.dtype)
+        for var, value in zip(shared, state.views()):
+            value[...] = var.get_value(borrow=True)
+
+        results = multiprocessing.Queue()
+        workers = [multiprocessing.Process(
+            target=self._hogwild_work,
+            args=(k, state, batches[k::n_workers], n_epochs, results,
+                  train_params))
+            for k in range(n_workers)]
+        for worker in workers:
+            worker.start()
+
+        costs = collections.defaultdict(list)
+        n_results = 0
+        while n_results < n_epochs * n_workers:
+            try:
+                epoch, k, cost = results.get(timeout=1)
+            except Queue.Empty:
+                if any(w.exitcode not in (None, 0) for w in workers):
+                    for worker in workers:
+                        worker.terminate()
+                    raise RuntimeError("Hogwild worker failed")
+                continue
+
+            n_results += 1
+            costs[epoch].append(cost)
+            if len(costs[epoch]) == n_workers:
+                print "Epoch %d: %0.3f" % (epoch, np.mean(costs[epoch]))
+
+        for worker in workers:
+            worker.join()
+
+        for var, value in zip(shared, state.views()):
+            var.set_value(value.copy())
+
+
+class ConvRBM(RBM):
+    """RBM with shared convolutional filters
+
+    `n_filters` filters of shape `rf_shape` are applied with `stride` (see
+    `conv.py`). The hidden units are the flattened feature maps, with shape
+    `hid_shape = (rows, cols, n_filters)`, so the layer stacks with dense
+    RBMs and `dense_weights` gives the equivalent dense layer. The weight
+    and hidden bias statistics are averaged over the map positions, so
+    `rate` has the same scale as for a dense RBM.
+    """
+
+    config_keys = ['vis_shape', 'n_filters', 'rf_shape', 'stride',
+                   'hidlinear', 'seed']
+
+    def __init__(self, vis_shape, n_filters, rf_shape=(9, 9), stride=(1, 1),
+                 W=None, c=None, b=None, hidlinear=False, seed=22):
+        self.dtype = theano.config.floatX
+
+        self.vis_shape = tuple(vis_shape)
+        self.n_vis = np.prod(vis_shape)
+        self.n_filters = n_filters
+        self.rf_shape = tuple(rf_shape)
+        self.stride = tuple(stride)
+        self.hid_shape = conv.map_shape(vis_shape, rf_shape, stride) + (n_filters,)
+        self.n_hid = int(np.prod(self.hid_shape))
+        self.mask = None
+        self.hidlinear = hidlinear
+        self.seed = seed
+
+        rng = np.random.RandomState(seed=self.seed)
+        self.theano_rng = theano.sandbox.rng_mrg.MRG_RandomStreams(seed=self.seed)
+
+        if W is None:
+            W = conv.initial_filters(n_filters, vis_shape, rf_shape, stride,
+                                     rng=rng)
+        if c is None:
+            c = np.zeros(n_filters)
+        if b is None:
+            b = np.zeros(self.n_vis)
+
+        W = W.astype(self.dtype)
+        c = c.astype(self.dtype)
+        b = b.astype(self.dtype)
+
+        self.W = theano.shared(W, name='W')
+        self.c = theano.shared(c, name='c')
+        self.b = theano.shared(b, name='b')
+
+        self.Winc = theano.shared(np.zeros_like(W), name='Winc')
+        self.cinc = theano.shared(np.zeros_like(c), name='cinc')
+        self.binc = theano.shared(np.zeros_like(b), name='binc')
+
+    @property
+    def filter_shape(self):
+        return (self.n_filters, conv.image_shape(self.vis_shape)[2]) + self.rf_shape
+
+    @property
+    def filters(self):
+        return conv.filter_images(self.W.get_value())
+
+    def dense_weights(self):
+        return conv.dense_weights(self.W.get_value(), self.c.get_value(),
+                                  self.vis_shape, self.stride)
+
+    def probHgivenV(self, vis):
+        x = conv.conv_up(vis, self.W, self.c, self.vis_shape,
+                         self.filter_shape, self.stride)
+        if self.hidlinear:
+            return x
+        else:
+            return tt.nnet.sigmoid(x)
+
+    def probVgivenH(self, hid):
+        x = conv.conv_down(hid, self.W, self.vis_shape, self.filter_shape,
+                           self.stride) + self.b
+        return tt.nnet.sigmoid(x)
+
+    def vis_hid_stats(self, vis, hid):
+        n = tt.cast(vis.shape[0] * (self.n_hid // self.n_filters), self.dtype)
+        return conv.conv_products(vis, hid, self.vis_shape, self.filter_shape,
+                                  self.stride) / n
+
+    def hid_stats(self, hid):
+        maps = hid.reshape((hid.shape[0], -1, self.n_filters))
+        return mean(mean(maps, axis=1), axis=0)
+
+
+class DBN(object):
+
+    def __init__(self, rbms=None):
+        self.dtype = theano.config.floatX
+        self.rbms = rbms if rbms is not None else []
+        self.W = None  # classifier weights
+        self.b = None  # classifier biases
+        self.vocab = None  # class means of the training codes, see `test`
+        self._vocab_key = None
+
+        self.theano_rng = theano.sandbox.rng_mrg.MRG_RandomStreams(seed=90)
+
+    def propup(self, images):
+        codes = images
+        for rbm in self.rbms:
+            codes = rbm.probHgivenV(codes)
+        return codes
+
+    def propdown(self, codes):
+        images = codes
+        for rbm in self.rbms[::-1]:
+            images = rbm.probVgivenH(images)
+        return images
+
+    @property
+    def encode(self):
+        images = tt.matrix('images', dtype=self.dtype)
+        codes = self.propup(images)
+        return theano.function([images], codes)
+
+    @property
+    def decode(self):
+        codes = tt.matrix('codes', dtype=self.dtype)
+        images = self.propdown(codes)
+        return theano.function([codes], images)
+
+    @property
+    def reconstruct(self):
+        images = tt.matrix('images', dtype=self.dtype)
+        codes = self.propup(images)
+        recons = self.propdown(codes)
+        return theano.function([images], recons)
+
+    def get_vocab(self, train_set):
+        """Vocabulary of mean codes for each label of `train_set`"""
+        images, labels = train_set
+        vocab = Vocabulary()
+        vocab.update(self.encode(floatX(images)), labels)
+        return vocab
+
+    def cached_vocab(self, train_set):
+        """`get_vocab(train_set)`, cached until `train_set` or the encoder
+        weights change
+
+        The cache is keyed on the identity of the `train_set` arrays and a
+        copy of the encoder weights, so it is invalidated by any training
+        (`RBM.pretrain`, `pretrain_hogwild`, `backprop`, ...), even of the
+        RBMs directly. Comparing the weights is much cheaper than
+        re-encoding the training set.
+        """
+        weights = [p.get_value() for rbm in self.rbms for p in (rbm.W, rbm.c)]
+        key = self._vocab_key
+        cached = (self.vocab is not None and key is not None
+                  and all(a is b for a, b in zip(key[0], train_set))
+                  and len(key[1]) == len(weights)
+                  and all(np.array_equal(a, b)
+                          for a, b in zip(key[1], weights)))
+        if not cached:
+            self.vocab = self.get_vocab(train_set)
+            self._vocab_key = (tuple(train_set), weights)
+        return self.vocab
+
+    def get_categories_vocab(self, train_set, normalize=True):
+        vocab = self.get_vocab(train_set)
+        pointers = vocab.pointers(normalize=normalize)
+        return vocab.categories, pointers.astype(self.dtype)
+
+    def train_classifier(self, train, test):
+        dtype = self.rbms[0].dtype
+
+        # --- find codes
+        images, labels = train
+        n_labels = len(np.unique(labels))
+        codes = self.encode(images.astype(dtype))
+
+        codes = theano.shared(codes.astype(dtype), name='codes')
+        labels = tt.cast(theano.shared(labels.astype(dtype), name='labels'), 'int32')
+
+        # --- compute backprop function
+        Wshape = (self.rbms[-1].n_hid, n_labels)
+        x = tt.matrix('x', dtype=dtype)
+        y = tt.ivector('y')
+        W = tt.matrix('W', dtype=dtype)
+        b = tt.vector('b', dtype=dtype)
+
+        W0 = np.random.normal(size=Wshape).astype(dtype).flatten() / 10
+        b0 = np.zeros(n_labels)
+
+        split_p = lambda p: [p[:-n_labels].reshape(Wshape), p[-n_labels:]]
+        form_p = lambda params: np.hstack([p.flatten() for p in params])
+
+        # compute negative log likelihood
+        x_n = x + self.theano_rng.normal(size=x.shape, std=1, dtype=dtype)
+        p_y_given_x = tt.nnet.softmax(tt.dot(x_n, W) + b)
+        y_pred = tt.argmax(p_y_given_x, axis=1)
+        nll = -mean(tt.log(p_y_given_x)[tt.arange(y.shape[0]), y])
+        error = tt.mean(tt.neq(y_pred, y))
+
+        # compute gradients
+        grads = tt.grad(nll, [W, b])
+        f_df = theano.function(
+            [W, b], [error] + grads,
+            givens={x: codes, y: labels})
+
+        # --- begin backprop
+        def f_df_wrapper(p):
+            w, b = split_p(p)
+            outs = f_df(w.astype(dtype), b.astype(dtype))
+            cost, grad = outs[0], form_p(outs[1:])
+            return cost.astype('float64'), grad.astype('float64')
+
+        p0 = form_p([W0, b0])
+        p_opt, mincost, info = scipy.optimize.lbfgsb.fmin_l_bfgs_b(
+            f_df_wrapper, p0, maxfun=100, iprint=1)
+
+        self.W, self.b = split_p(p_opt)
+
+    def class_error_function(self, W, b):
+        """Compile the (noise-free) classification error for weights W, b"""
+        x = tt.matrix('images', dtype=self.dtype)
+        y = tt.ivector('labels')
+        y_pred = tt.argmax(tt.dot(self.propup(x), W) + b, axis=1)
+        return theano.function([x, y], tt.mean(tt.neq(y_pred, y)))
+
+    def backprop(self, train_set, test_set, n_epochs=30, checkpoint=None,
+                 valid_set=None, early_stopping=None, profile=None):
+        """Fine-tune the RBM weights with L-BFGS on the classifier cost
+
+        If `checkpoint` is a `Checkpointer`, the weights are checkpointed
+        every `checkpoint.every` function evaluations (with the state of
+        `early_stopping`, if given), and training resumes from the latest
+        checkpoint (L-BFGS restarts its curvature estimate).
+
+        If `valid_set` is given, the validation error is computed after each
+        function evaluation, which counts as an epoch for `early_stopping`.
+
+        `profile` is True or a `Profiler` to time the phases of training
+        (see `profiling.py`); each function evaluation counts as an epoch.
+        """
+        prof = get_profiler(profile, 'DBN.backprop')
+        dtype = self.rbms[0].dtype
+        params = []
+        for rbm in self.rbms:
+            params.extend([rbm.W, rbm.c])
+
+        # --- compute backprop function
+        assert self.W is not None and self.b is not None
+        W = theano.shared(self.W.astype(dtype), name='Wc')
+        b = theano.shared(self.b.astype(dtype), name='bc')
+
+        x = tt.matrix('batch', dtype=dtype)
+        y = tt.ivector('labels')
+
+        # compute coding error
+        code = self.propup(x)
+        code_n = code + self.theano_rng.normal(size=code.shape, std=1, dtype=dtype)
+        p_y_given_x = tt.nnet.softmax(tt.dot(code_n, W) + b)
+        y_pred = tt.argmax(p_y_given_x, axis=1)
+        nll = -mean(tt.log(p_y_given_x)[tt.arange(y.shape[0]), y])
+        error = tt.mean(tt.neq(y_pred, y))
+
+        # compute gradients
+        with prof.phase('compile'):
+            grads = tt.grad(nll, params)
+            f_df = theano.function([x, y], [error] + grads,
+                                   profile=prof.theano('f_df'))
+
+        np_params = [param.get_value() for param in params]
+        def split_p(p):
+            split = []
+            i = 0
+            for param in np_params:
+                split.append(p[i:i + param.size].reshape(param.shape))
+                i += param.size
+            return split
+
+        def form_p(params):
+            return np.hstack([param.flatten() for param in params])
+
+        # --- find target codes
+        images, labels = train_set
+        images = floatX(images)
+        labels = labels.astype('int32')
+        batch_size = 50000
+
+        import itertools
+        ibatches = images.reshape(-1, batch_size, images.shape[1])
+        lbatches = labels.reshape(-1, batch_size)
+        ibatches = itertools.cycle(ibatches)
+        lbatches = itertools.cycle(lbatches)
+
+        if valid_set is not None:
+            with prof.phase('compile'):
+                valid_error = self.class_error_function(W, b)
+            valid_images = floatX(valid_set[0])
+            valid_labels = valid_set[1].astype('int32')
+        if early_stopping is not None:
+            assert valid_set is not None
+            early_stopping.reset()
+
+        maxfun = 100
+        start = 0
+        if checkpoint is not None:
+            state = checkpoint.restore_shared(
+                params, early_stopping=early_stopping)
+            if state is not None:
+                start = state['step'] + 1
+                np_params = [param.get_value() for param in params]
+
+        evals = [start]
+        t_wrapper = [0.]
+
+        def f_df_wrapper(p):
+            prof.begin_epoch()
+            t = time.time()
+            with prof.phase('lbfgs glue'):
+                for param, value in zip(params, split_p(p)):
+                    param.set_value(value.astype(param.dtype))
+
+            batch = ibatches.next()
+            label = lbatches.next()
+
+            with prof.phase('step'):
+                outs = f_df(batch, label)
+            with prof.phase('lbfgs glue'):
+                cost, grads = outs[0], outs[1:]
+                grad = form_p(grads)
+
+            stop = False
+            if valid_set is not None:
+                with prof.phase('validation'):
+                    verror = valid_error(valid_images, valid_labels)
+                print "Validation error: %0.4f" % verror
+                stop = (early_stopping is not None
+                        and early_stopping.update(evals[0], verror, params))
+
+            if checkpoint is not None and checkpoint.due(evals[0]):
+                with prof.phase('checkpoint'):
+                    checkpoint.save_shared(evals[0], params,
+                                           early_stopping=early_stopping)
+            if stop:
+                raise StopTraining()
+            evals[0] += 1
+            prof.end_epoch(len(batch))
+            t_wrapper[0] += time.time() - t
+
+            return cost.astype('float64'), grad.astype('float64')
+
+        p0 = form_p(np_params)
+        p_opt = p0
+        if maxfun > start:
+            t = time.time()
+            try:
+                p_opt, mincost, info = scipy.optimize.lbfgsb.fmin_l_bfgs_b(
+                    f_df_wrapper, p0, maxfun=maxfun - start, iprint=1)
+            except StopTraining:
+                p_opt = None
+            prof.add('lbfgs', time.time() - t - t_wrapper[0])
+
+        if p_opt is not None:
+            for param, value in zip(params, split_p(p_opt)):
+                param.set_value(value.astype(param.dtype), borrow=False)
+        if early_stopping is not None:
+            early_stopping.restore(params)
+
+        if checkpoint is not None:
+            with prof.phase('checkpoint'):
+                checkpoint.wait()
+        prof.end()
+
+    def test(self, train_set, test_set, classifier=False):
+        images, labels = test_set
+        codes = self.encode(floatX(images))
+
+        if classifier:
+            categories = np.unique(train_set[1])
+            inds = np.argmax(np.dot(codes, self.W) + self.b, axis=1)
+            return (labels != categories[inds])
+        else:
+            # find vocabulary pointers on training set
+            vocab = self.cached_vocab(train_set)
+
+            # compare test codes to vocab pointers
+            return (labels != vocab.classify_dot(codes))
@@ -1,8 +1,5 @@
 import os
 import re
-import gzip
-import cPickle as pickle
-import urllib
 
 import numpy as np
 import matplotlib.pyplot as plt
@@ -10,7 +7,13 @@ plt.ion()
 
 import nengo
 
+from datasets import mnist
 import find_neuron_params
+from presentation import (
+    Presentation, block_errors, filtered, step_correct,
+    steps_per_presentation)
+from rbm import RBM
+from transforms import connect
 
 # --- parameters
 presentation_time = 0.1
@@ -26,14 +29,6 @@ pstc = 0.006
 def sigmoid(x):
     return 1. / (1 + np.exp(-x))
 
-def get_image(t):
-    return test_images[int(t / presentation_time)]
-
-def test_dots(t, dots):
-    i = int(t / presentation_time)
-    j = np.argmax(dots)
-    return test_labels[i] == labels[j]
-
 # --- load the DBN data
 filenames = os.listdir('.')
 filenames = sorted(filter(lambda s: re.match(r'rbm_[0-9]+\.npz', s), filenames))
@@ -41,23 +36,16 @@ filenames = sorted(filter(lambda s: re.match(r'rbm_[0-9]+\.npz', s), filenames))
 weights = []
 biases = []
 for filename in filenames:
-    data = np.load(filename)['dict'].item()
-    weights.append(data['W'])
-    biases.append(data['c'])
+    W, c = RBM.load(filename).dense_weights()  # unrolls `ConvRBM`s
+    weights.append(W)
+    biases.append(c)
 
 data = np.load('classifier.npz')
 Wc = data['W']
 bc = data['b']
 
 # --- load the testing data
-filename = 'mnist.pkl.gz'
-
-if not os.path.exists(filename):
-    url = 'http://deeplearning.net/data/mnist/mnist.pkl.gz'
-    urllib.urlretrieve(url, filename=filename)
-
-with gzip.open(filename, 'rb') as f:
-    train, valid, test = pickle.load(f)
+train, valid, test = mnist()
 
 test_images, test_labels = test
 
@@ -82,7 +70,8 @@ N = neuron_params.pop('N')
 # --- create the model
 model = nengo.Network()
 with model:
-    input_images = nengo.Node(output=get_image, label='images')
+    input_images = nengo.Node(
+        output=Presentation(test_images, presentation_time), label='images')
 
     # --- make sigmoidal layers
     layers = []
@@ -92,7 +81,7 @@ with model:
         bias = nengo.Node(output=b)
         nengo.Connection(bias, layer.input, synapse=0)
 
-        nengo.Connection(output, layer.input, transform=w.T, synapse=pstc)
+        connect(output, layer.input, transform=w.T, synapse=pstc)
         output = layer.add_output('sigmoid', function=sigmoid)
 
         layers.append(layer)
@@ -102,7 +91,7 @@ with model:
     code_layer = nengo.networks.EnsembleArray(10, b.size, label='code', radius=10)
     code_bias = nengo.Node(output=b)
     nengo.Connection(code_bias, code_layer.input, synapse=0)
-    nengo.Connection(output, code_layer.input, transform=W.T, synapse=pstc)
+    connect(output, code_layer.input, transform=W.T, synapse=pstc)
 
     # --- make classifier layer
     class_layer = nengo.networks.EnsembleArray(10, 10, label='class', radius=20)
@@ -111,12 +100,8 @@ with model:
     nengo.Connection(code_layer.output, class_layer.input,
                      transform=Wc.T, synapse=pstc)
 
-    test = nengo.Node(output=test_dots, size_in=n_labels)
-    nengo.Connection(class_layer.output, test)
-
     probe_code = nengo.Probe(code_layer.output, synapse=0.03)
     probe_class = nengo.Probe(class_layer.output, synapse=0.03)
-    probe_test = nengo.Probe(test, synapse=0.01)
 
 
 # --- simulation
@@ -131,12 +116,15 @@ if 1:
     t = sim.trange()
     x = sim.data[probe_code]
     y = sim.data[probe_class]
-    z = sim.data[probe_test]
 
-    # np.savez(rundata_file, t=t, y=y, z=z)
+    # np.savez(rundata_file, t=t, x=x, y=y)
 else:
     rundata = np.load(rundata_file)
-    t, y, z = [rundata[k] for k in ['t', 'y', 'z']]
+    t, x, y = [rundata[k] for k in ['t', 'x', 'y']]
+
+# --- decisions, offline from the class probe
+steps = steps_per_presentation(presentation_time)
+z = filtered(step_correct(y, test_labels, labels, steps))
 
 # --- plots
 def plot_bars():
@@ -146,13 +134,10 @@ def plot_bars():
 
 inds = slice(0, int(t[-1]/presentation_time) + 1)
 images = test_images[inds]
-labels = test_labels[inds]
 allimage = np.zeros((28, 28 * len(images)), dtype=images.dtype)
 for i, image in enumerate(images):
     allimage[:, i * 28:(i + 1) * 28] = image.reshape(28, 28)
 
-z2 = np.argmax(y, axis=1) == labels.repeat(100)
-
 plt.figure(1)
 plt.clf()
 r, c = 4, 1
@@ -182,10 +167,8 @@ plt.ylabel('correct')
 plt.savefig('runtime.png')
 
 # --- compute error rate
-zblocks = z.reshape(-1, 100)[:, 50:]  # 50 ms blocks at end of each 100
-errors = np.mean(zblocks, axis=1) < 0.5
+errors = block_errors(z, steps, 50)  # 50 ms blocks at end of each 100
 print errors.mean()
 
-zblocks = z2.reshape(-1, 100)[:, 80:]  # 20 ms blocks at end of each 100
-errors = np.mean(zblocks, axis=1) < 0.5
+errors = block_errors(z, steps, 80)  # 20 ms blocks at end of each 100
 print errors.mean()
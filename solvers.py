@@ -0,0 +1,161 @@
+"""
+Streaming least-squares solvers for NEF decoders.
+
+`nengo.decoders.LstsqL2` needs the whole activity matrix in memory. The
+solvers here instead accumulate the normal equations (`A^T A` and `A^T Y`)
+over chunks of data, so memory is bounded by `n_neurons**2` regardless of
+the number of examples. The regularization matches `LstsqL2`: for a
+regularization `reg`, `sigma = reg * A.max()` and the system solved is
+`(A^T A + m * sigma**2 I) X = A^T Y`, where `m` is the number of examples.
+
+    normal = NormalEquations(n_hid, n_vis)
+    for x in chunks(images):
+        normal.add(encode(x), x)
+    decoders, info = normal.solve(reg=0.1)
+
+`Covariance` accumulates a covariance matrix in the same way, and
+`randomized_eigh` finds the top eigenpairs of either without a full
+eigendecomposition.
+"""
+import numpy as np
+import scipy.linalg
+
+
+def chunks(x, chunk_size=10000):
+    """Split `x` into chunks along the first axis"""
+    for i in xrange(0, len(x), chunk_size):
+        yield x[i:i + chunk_size]
+
+
+class NormalEquations(object):
+    """Accumulate the normal equations of a least-squares problem
+
+    Statistics are accumulated in float64 whatever the dtype of the data.
+    """
+
+    def __init__(self, n_in, n_out):
+        self.n_in = n_in
+        self.n_out = n_out
+        self.AA = np.zeros((n_in, n_in))
+        self.AY = np.zeros((n_in, n_out))
+        self.YY = np.zeros(n_out)  # squared norm of each target column
+        self.m = 0
+        self.A_max = -np.inf
+
+    def add(self, A, Y):
+        """Add a chunk of activities `A` and targets `Y`"""
+        A = np.asarray(A, dtype=np.float64)
+        Y = np.asarray(Y, dtype=np.float64)
+        assert A.shape == (Y.shape[0], self.n_in)
+        assert Y.shape[1] == self.n_out
+
+        self.AA += np.dot(A.T, A)
+        self.AY += np.dot(A.T, Y)
+        self.YY += (Y**2).sum(axis=0)
+        self.m += A.shape[0]
+        self.A_max = max(self.A_max, A.max())
+
+    def rmses(self, X):
+        """RMS error of `Y - A X` for each target, from the statistics alone"""
+        sq = (self.YY - 2 * (X * self.AY).sum(axis=0)
+              + (X * np.dot(self.AA, X)).sum(axis=0))
+        return np.sqrt(np.maximum(sq, 0) / self.m)
+
+    def solve(self, reg=0.1, rank=None, rng=np.random):
+        """Solve with L2 regularization `reg` (a number or a list)
+
+        Returns `(X, info)`, or a list of them if `reg` is a list; all
+        regularizations reuse the same accumulated statistics. If `rank` is
+        given and less than `n_in`, the solution is restricted to the span
+        of the top `rank` eigenvectors of `A^T A`, which are found with a
+        randomized eigendecomposition (see `randomized_eigh`).
+        """
+        assert self.m > 0, "No data added"
+        if rank is not None and rank < self.n_in:
+            w, v = randomized_eigh(self.AA, rank, rng=rng)
+            solve = lambda s2: np.dot(
+                v / (w + s2), np.dot(v.T, self.AY))
+        else:
+            def solve(s2):
+                G = self.AA.copy()
+                G.flat[::self.n_in + 1] += s2
+                return scipy.linalg.cho_solve(
+                    scipy.linalg.cho_factor(G, overwrite_a=True), self.AY)
+
+        results = []
+        for r in (reg if isinstance(reg, (list, tuple)) else [reg]):
+            sigma = r * self.A_max
+            X = solve(self.m * sigma**2)
+            results.append((X, dict(reg=r, rmses=self.rmses(X))))
+
+        return results if isinstance(reg, (list, tuple)) else results[0]
+
+
+class Covariance(object):
+    """Accumulate the covariance of data given in chunks
+
+    The data are shifted by the mean of the first chunk before accumulating,
+    which avoids most of the cancellation in `E[x x^T] - E[x] E[x]^T`.
+    """
+
+    def __init__(self, n):
+        self.n = n
+        self.shift = None
+        self.S = np.zeros((n, n))
+        self.s = np.zeros(n)
+        self.m = 0
+
+    def add(self, x):
+        x = np.asarray(x, dtype=np.float64)
+        if self.shift is None:
+            self.shift = x.mean(axis=0)
+        x = x - self.shift
+        self.S += np.dot(x.T, x)
+        self.s += x.sum(axis=0)
+        self.m += x.shape[0]
+
+    @property
+    def mean(self):
+        return self.shift + self.s / self.m
+
+    @property
+    def cov(self):
+        mu = self.s / self.m
+        return self.S / self.m - np.outer(mu, mu)
+
+
+def randomized_eigh(G, k, n_oversamples=10, n_iter=2, rng=np.random):
+    """Top `k` eigenpairs of the symmetric PSD matrix `G`
+
+    Uses a randomized range finder with `n_iter` power iterations (Halko,
+    Martinsson & Tropp, 2011), then an exact eigendecomposition of `G`
+    projected onto that range. Returns the eigenvalues in descending order
+    and the eigenvectors as columns.
+    """
+    n = G.shape[0]
+    p = min(k + n_oversamples, n)
+    Q, _ = np.linalg.qr(np.dot(G, rng.normal(size=(n, p))))
+    for _ in range(n_iter):
+        Q, _ = np.linalg.qr(np.dot(G, Q))
+
+    w, u = np.linalg.eigh(np.dot(Q.T, np.dot(G, Q)))
+    w, u = w[::-1][:k], u[:, ::-1][:, :k]
+    return np.maximum(w, 0), np.dot(Q, u)
+
+
+def lstsq_l2(encode, x, y=None, reg=0.1, chunk_size=10000, rank=None,
+             rng=np.random):
+    """Solve for decoders of `y` from `encode(x)`, streaming over `x`
+
+    `y` defaults to `x` (autoencoder decoders). `encode` maps a chunk of
+    inputs to activities; only one chunk of activities is in memory at once.
+    """
+    y = x if y is None else y
+    normal = None
+    for xi, yi in zip(chunks(x, chunk_size), chunks(y, chunk_size)):
+        a = encode(xi)
+        if normal is None:
+            normal = NormalEquations(a.shape[1], yi.shape[1])
+        normal.add(a, yi)
+
+    return normal.solve(reg=reg, rank=rank, rng=rng)